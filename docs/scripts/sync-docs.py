@@ -40,7 +40,10 @@ module_names = [
     "netcdf",
     "opus",
     "opus.file_interface",
+    "opus.index",
+    "opus.export",
     "opus.http_interface",
+    "opus.fake_http_server",
     "plotting",
     "processes",
     "rebinning",
@@ -121,7 +124,9 @@ def parse_api_reference_content(raw_api_reference_content: str) -> str:
 
 
 def generate_api_reference_content(module_import_paths: list[str]) -> str:
-    parsed_modules = [f"--module={module_import_path}" for module_import_path in module_import_paths]
+    parsed_modules = [
+        f"--module={module_import_path}" for module_import_path in module_import_paths
+    ]
     with tempfile.NamedTemporaryFile() as f:
         with open(f.name, "w") as stdout:
             subprocess.run(
@@ -174,8 +179,7 @@ def write_agentic_docs() -> None:
         "`modules/column.astronomy.md` documents `tum_esm_utils.column.astronomy`.\n"
         "- This `AGENTS.md` file lists the documented modules and their module docstrings so "
         "agents can choose the narrowest API file before reading detailed references.\n\n"
-        "## Modules\n\n"
-        + "\n".join(module_summary_lines),
+        "## Modules\n\n" + "\n".join(module_summary_lines),
     )
 
 
@@ -0,0 +1,127 @@
+from typing import Callable
+import asyncio
+import concurrent.futures
+import statistics
+import time
+from tum_esm_utils.opus import (
+    AsyncOpusHTTPInterface,
+    FakeOpusHTTPServer,
+    OpusHTTPClient,
+    OpusMacroWatcher,
+)
+
+LATENCY = 0.02
+REQUEST_COUNT = 50
+
+
+def print_duration(label: str, durations: list[float]) -> None:
+    print(
+        f"  {label:<36} {statistics.median(durations) * 1000:8.1f} ms "
+        + f"(min {min(durations) * 1000:.1f} ms, max {max(durations) * 1000:.1f} ms)"
+    )
+
+
+def measure(function: Callable[[], object], n: int = 5) -> list[float]:
+    durations: list[float] = []
+    for _ in range(n):
+        t = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - t)
+    return durations
+
+
+def benchmark_throughput() -> None:
+    # OPUS answers one request at a time, the parallel server shows the upper bound
+    for parallel in [False, True]:
+        server_kind = "parallel" if parallel else "serial"
+        print(
+            f"Throughput ({REQUEST_COUNT} requests, {LATENCY * 1000:.0f} ms latency, "
+            + f"{server_kind} server)"
+        )
+        requests = ["GET_VERSION"] * REQUEST_COUNT
+        with FakeOpusHTTPServer(latency=LATENCY, concurrent=parallel) as server:
+            client = OpusHTTPClient(
+                host=server.host, port=server.port, max_connections=REQUEST_COUNT
+            )
+            interface = AsyncOpusHTTPInterface(
+                host=server.host, port=server.port, max_connections=REQUEST_COUNT
+            )
+            print_duration(
+                "sequential requests", measure(lambda: [client.request(r) for r in requests])
+            )
+            print_duration(
+                "OpusHTTPClient.request_many", measure(lambda: client.request_many(requests))
+            )
+            print_duration(
+                "AsyncOpusHTTPInterface.request_many",
+                measure(lambda: asyncio.run(interface.request_many(requests))),
+            )
+
+
+def benchmark_retry_overhead() -> None:
+    print(f"Retry overhead ({REQUEST_COUNT} sequential requests, {LATENCY * 1000:.0f} ms latency)")
+    for drop_rate in [0.0, 0.1, 0.3]:
+        with FakeOpusHTTPServer(latency=LATENCY, drop_rate=drop_rate, seed=42) as server:
+            client = OpusHTTPClient(
+                host=server.host, port=server.port, retry_attempts=10, retry_wait=0.0
+            )
+            durations = measure(
+                lambda: [client.request("GET_VERSION") for _ in range(REQUEST_COUNT)]
+            )
+            print_duration(
+                f"drop rate {drop_rate:.0%} ({server.dropped_requests} dropped)", durations
+            )
+
+
+def benchmark_polling_latency() -> None:
+    print(f"Polling latency ({LATENCY * 1000:.0f} ms latency)")
+    with FakeOpusHTTPServer(latency=LATENCY, macro_duration=60) as server:
+        client = OpusHTTPClient(host=server.host, port=server.port)
+        macro_id = client.start_macro("C:/macros/measure.mtx")
+        print_duration("macro_is_running", measure(lambda: client.macro_is_running(macro_id)))
+        print_duration(
+            "some_macro_is_running",
+            measure(lambda: client.some_macro_is_running(check_interval=0.1)),
+        )
+        client.stop_macro(macro_id)
+
+    print("Macro completion detection (macro runs for 0.5 s)")
+    for poll_interval in [0.05, 0.2, 0.5]:
+        with FakeOpusHTTPServer(latency=LATENCY, macro_duration=0.5) as server:
+            client = OpusHTTPClient(host=server.host, port=server.port)
+            delays: list[float] = []
+            for _ in range(3):
+                macro_id = client.start_macro("C:/macros/measure.mtx")
+                t = time.perf_counter()
+                while client.macro_is_running(macro_id):
+                    time.sleep(poll_interval)
+                delays.append(time.perf_counter() - t - 0.5)
+            print_duration(f"poll interval {poll_interval * 1000:.0f} ms (delay)", delays)
+
+
+def benchmark_macro_watcher() -> None:
+    print("OpusMacroWatcher (20 macros running for 0.5 to 5 s)")
+    for poll_intervals in [[0.1], [1.0], [0.1, 0.2, 0.5, 1, 2, 5]]:
+        with FakeOpusHTTPServer(latency=LATENCY) as server:
+            client = OpusHTTPClient(host=server.host, port=server.port)
+            with OpusMacroWatcher(client, poll_intervals=poll_intervals) as watcher:
+                futures: list[concurrent.futures.Future[int]] = []
+                for i in range(20):
+                    server.macro_duration = 0.5 + i * 0.25
+                    futures.append(watcher.watch(client.start_macro(f"C:/macros/m{i}.mtx")))
+                for f in futures:
+                    f.result()
+            latencies = watcher.detection_latencies
+            print(
+                f"  intervals {str(poll_intervals):<28} "
+                + f"{server.request_counts['MACRO_RESULTS']:4d} requests, detection "
+                + f"mean {(latencies.mean or 0) * 1000:6.1f} ms, "
+                + f"p95 <= {(latencies.quantile(0.95) or 0) * 1000:6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    benchmark_throughput()
+    benchmark_retry_overhead()
+    benchmark_polling_latency()
+    benchmark_macro_watcher()
@@ -0,0 +1,50 @@
+import os
+import struct
+import timeit
+import numpy as np
+import numpy.typing as npt
+import tum_esm_utils
+
+IFG_DIR = tum_esm_utils.files.rel_to_abs_path("../data/ifgs")
+DUAL_CHANNEL_FILES = [
+    os.path.join(IFG_DIR, "md20220409s0e00a.0198"),
+    os.path.join(IFG_DIR, "ma20240514s0e00a.0975"),
+]
+
+
+def decode_with_struct(filepath: str) -> npt.NDArray[np.float64]:
+    """The per-channel struct decoding used before the vectorized decoder."""
+
+    metadata = tum_esm_utils.opus.OpusFile.read_metadata(filepath)
+    opus_file = metadata.to_opus_file()
+    channels: list[npt.NDArray[np.float64]] = []
+    with open(filepath, "rb") as f:
+        for i, block_index in enumerate(metadata.interferogram_block_indices):
+            entry = metadata.directory[block_index]
+            f.seek(entry.block_pointer)
+            values = struct.unpack(f"<{entry.block_length}f", f.read(4 * entry.block_length))
+            channels.append(
+                np.array(values, dtype=np.float64) * opus_file.channel_parameters[i].spectrum["CSF"]
+            )
+    return np.stack(channels)
+
+
+if __name__ == "__main__":
+    for filepath in DUAL_CHANNEL_FILES:
+        reference = decode_with_struct(filepath)
+        interferogram = tum_esm_utils.opus.OpusFile.read(filepath).interferogram
+        assert interferogram is not None
+        assert np.array_equal(reference, interferogram)
+
+        print(f"{os.path.basename(filepath)} ({interferogram.shape[0]} channels)")
+        for label, function in [
+            ("struct decoding", lambda: decode_with_struct(filepath)),
+            ("OpusFile.read", lambda: tum_esm_utils.opus.OpusFile.read(filepath)),
+            (
+                "OpusFile.read (map)",
+                lambda: tum_esm_utils.opus.OpusFile.read(filepath, interferogram_mode="map"),
+            ),
+        ]:
+            n = 20
+            duration = timeit.timeit(function, number=n) / n
+            print(f"  {label:<22} {duration * 1000:8.2f} ms")
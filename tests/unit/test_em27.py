@@ -1,6 +1,11 @@
+import concurrent.futures
+import datetime
+import glob
 import os
+import shutil
 import tempfile
 
+import polars as pl
 import pytest
 import tum_esm_utils
 
@@ -30,6 +35,127 @@ def test_detect_corrupt_ifgs() -> None:
     )
 
 
+@pytest.mark.order(4)
+@pytest.mark.skipif(os.name != "posix", reason="Not supported on Windows")
+def test_detect_corrupt_ifgs_in_parallel(monkeypatch: pytest.MonkeyPatch) -> None:
+    ifg_directory = tum_esm_utils.files.rel_to_abs_path("../data/ifgs")
+    expected_results = tum_esm_utils.em27.detect_corrupt_opus_files(ifg_directory)
+
+    # shard the files across multiple validator processes
+    monkeypatch.setattr(tum_esm_utils.em27, "_FORTRAN_MIN_SHARD_SIZE", 1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert (
+            tum_esm_utils.em27.detect_corrupt_opus_files(
+                ifg_directory, max_workers=3, debug_output_dir=tmpdir
+            )
+            == expected_results
+        )
+        assert set(os.listdir(tmpdir)) == {"output.0.txt", "output.1.txt", "output.2.txt"}
+
+    # concurrent invocations do not interfere with each other
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(tum_esm_utils.em27.detect_corrupt_opus_files, [ifg_directory] * 4)
+        )
+    assert all(r == expected_results for r in results)
+
+
+@pytest.mark.order(4)
+@pytest.mark.skipif(os.name != "posix", reason="Not supported on Windows")
+def test_python_and_fortran_validator_parity() -> None:
+    ifg_directory = tum_esm_utils.files.rel_to_abs_path("../data/ifgs")
+    fortran_results = tum_esm_utils.em27.detect_corrupt_opus_files(
+        ifg_directory, validator="fortran"
+    )
+    python_results = tum_esm_utils.em27.detect_corrupt_opus_files(ifg_directory, validator="python")
+    assert python_results == fortran_results
+    errors = fortran_results["md20220409s0e00a.0199"]
+    i = errors.index('Charfilter "')
+    assert errors[i : i + 3] == ['Charfilter "', "GFW", '" is missing']
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_detect_corrupt_ifgs_with_python_validator() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert len(tum_esm_utils.em27.detect_corrupt_opus_files(tmpdir, validator="python")) == 0
+        test_file_name = os.path.join(tmpdir, "test_ifg")
+        with open(test_file_name, "w") as f:
+            f.write("corrupt interferogram")
+        assert tum_esm_utils.em27.detect_corrupt_opus_files(tmpdir, validator="python") == {
+            "test_ifg": ["File not even readible by the parser"]
+        }
+
+    ifg_directory = tum_esm_utils.files.rel_to_abs_path("../data/ifgs")
+    for max_workers in [1, 2]:
+        detection_results = tum_esm_utils.em27.detect_corrupt_opus_files(
+            ifg_directory, validator="python", max_workers=max_workers
+        )
+        assert set(detection_results.keys()) == set(
+            [
+                "md20220409s0e00a.0199",
+                "md20220409s0e00a.0200",
+                "md20220409s0e00a.0198.json",
+            ]
+        )
+        assert "Inconsistent dualifg!" in detection_results["md20220409s0e00a.0199"]
+        assert "IFG size too small!" in detection_results["md20220409s0e00a.0199"]
+
+    assert (
+        tum_esm_utils.em27.validate_opus_file(os.path.join(ifg_directory, "md20220409s0e00a.0198"))
+        == []
+    )
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_detect_corrupt_ifgs_with_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ifg_directory = os.path.join(tmpdir, "ifgs")
+        shutil.copytree(tum_esm_utils.files.rel_to_abs_path("../data/ifgs"), ifg_directory)
+        cache_path = os.path.join(tmpdir, "cache.sqlite")
+
+        expected_results = tum_esm_utils.em27.detect_corrupt_opus_files(
+            ifg_directory, validator="python", max_workers=1
+        )
+        for _ in range(2):
+            assert (
+                tum_esm_utils.em27.detect_corrupt_opus_files(
+                    ifg_directory,
+                    validator="python",
+                    max_workers=1,
+                    use_cache=True,
+                    cache_path=cache_path,
+                )
+                == expected_results
+            )
+
+        # modified files are validated again
+        with open(os.path.join(ifg_directory, "md20220409s0e00a.0198"), "r+b") as f:
+            f.write(b"corrupt")
+        results = tum_esm_utils.em27.detect_corrupt_opus_files(
+            ifg_directory,
+            validator="python",
+            max_workers=1,
+            use_cache=True,
+            cache_path=cache_path,
+        )
+        assert results == {**expected_results, "md20220409s0e00a.0198": ["Not an OPUS file!"]}
+
+        # by default, the cache is stored in the user cache directory
+        if os.name == "posix":
+            monkeypatch.setenv("XDG_CACHE_HOME", os.path.join(tmpdir, "user-cache"))
+            monkeypatch.setattr(tum_esm_utils.em27.sys, "platform", "linux")
+            tum_esm_utils.em27.detect_corrupt_opus_files(
+                ifg_directory, validator="python", max_workers=1, use_cache=True
+            )
+            assert os.path.isfile(
+                os.path.join(
+                    tmpdir, "user-cache", "tum_esm_utils", "opus_file_validator.cache.sqlite"
+                )
+            )
+
+
 @pytest.mark.order(3)
 @pytest.mark.quick
 def test_load_proffast2_result() -> None:
@@ -40,3 +166,132 @@ def test_load_proffast2_result() -> None:
         assert len(df) > 2
         assert "UTC" in df.columns
         assert "XCO2" in df.columns
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_load_proffast2_result_with_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    input_dir = tum_esm_utils.files.rel_to_abs_path("../data/proffast")
+    filename = "comb_invparms_ma_SN061_210329-210329.csv"
+    expected_df = tum_esm_utils.em27.load_proffast2_result(os.path.join(input_dir, filename))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, filename)
+        shutil.copy(os.path.join(input_dir, filename), path)
+        assert tum_esm_utils.em27.load_proffast2_result(path, use_cache=True).equals(expected_df)
+        cache_files = glob.glob(os.path.join(tmpdir, f".{filename}.v*.parquet"))
+        assert len(cache_files) == 1
+
+        # later loads read the cache file instead of the CSV file
+        with monkeypatch.context() as m:
+            m.setattr(tum_esm_utils.em27, "_scan_proffast2_result", None)
+            df = tum_esm_utils.em27.load_proffast2_result(path, use_cache=True)
+        assert df.equals(expected_df)
+
+        # modifying the file or the schema version invalidates the cache
+        first_row = open(path).read().strip().split("\n")[1]
+        with open(path, "a") as f:
+            f.write(f"\n{first_row}")
+        df = tum_esm_utils.em27.load_proffast2_result(path, use_cache=True)
+        assert len(df) == len(expected_df) + 1
+        monkeypatch.setattr(tum_esm_utils.em27, "_PROFFAST2_CACHE_VERSION", 2)
+        assert tum_esm_utils.em27.load_proffast2_result(path, use_cache=True).equals(df)
+        assert [os.path.basename(p) for p in glob.glob(os.path.join(tmpdir, ".*"))] == [
+            f".{filename}.v2-{os.stat(path).st_size}-{os.stat(path).st_mtime_ns}.parquet"
+        ]
+
+        cache_dir = os.path.join(tmpdir, "cache")
+        tum_esm_utils.em27.load_proffast2_result(path, use_cache=True, cache_dir=cache_dir)
+        assert len(os.listdir(cache_dir)) == 1
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_scan_proffast2_results() -> None:
+    input_dir = tum_esm_utils.files.rel_to_abs_path("../data/proffast")
+    paths = sorted(glob.glob(os.path.join(input_dir, "comb_invparms_*.csv")))
+
+    # the LazyFrame contains the rows of all files with the sensor columns
+    df = tum_esm_utils.em27.scan_proffast2_results(paths).collect()
+    assert len(df) == sum(len(tum_esm_utils.em27.load_proffast2_result(p)) for p in paths)
+    assert df.select("sensor_id", "serial_number").unique().sort("sensor_id").rows() == [
+        ("ma", 61),
+        ("mc", 115),
+    ]
+    assert df.filter(pl.col("sensor_id") == "ma")["XCO2_STR"].is_null().all()
+    single_df = tum_esm_utils.em27.load_proffast2_result(paths[0])
+    assert df.filter(pl.col("sensor_id") == "ma").select(single_df.columns).equals(single_df)
+
+    # column selection, time filters and multipliers
+    lf = tum_esm_utils.em27.scan_proffast2_results(
+        os.path.join(input_dir, "comb_invparms_*.csv"),
+        columns=["XCH4", "CO2"],
+        from_datetime=datetime.datetime(2022, 6, 2, 5, 14),
+        to_datetime=datetime.datetime(2022, 6, 2, 5, 15),
+        apply_multipliers=True,
+    )
+    assert lf.collect_schema().names() == ["UTC", "sensor_id", "serial_number", "XCH4", "CO2"]
+    df = lf.collect()
+    expected_df = tum_esm_utils.em27.load_proffast2_result(paths[1]).filter(
+        pl.col("UTC").is_between(
+            datetime.datetime(2022, 6, 2, 5, 14), datetime.datetime(2022, 6, 2, 5, 15)
+        )
+    )
+    assert len(df) == len(expected_df) == 4
+    assert df["XCH4"].to_list() == (expected_df["XCH4"] * 1000).to_list()
+    assert (
+        df["CO2"].to_list()
+        == (expected_df["CO2"] * tum_esm_utils.em27.PROFFAST_MULTIPLIERS["CO2"]).to_list()
+    )
+
+    # timezone-aware datetimes are converted to UTC
+    cest = datetime.timezone(datetime.timedelta(hours=2))
+    aware_df = tum_esm_utils.em27.scan_proffast2_results(
+        os.path.join(input_dir, "comb_invparms_*.csv"),
+        columns=["XCH4", "CO2"],
+        from_datetime=datetime.datetime(2022, 6, 2, 7, 14, tzinfo=cest),
+        to_datetime=datetime.datetime(2022, 6, 2, 7, 15, tzinfo=cest),
+        apply_multipliers=True,
+    ).collect()
+    assert aware_df.equals(df)
+
+    with pytest.raises(FileNotFoundError):
+        tum_esm_utils.em27.scan_proffast2_results(paths, to_datetime=datetime.datetime(2020, 1, 1))
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_aggregate_proffast2_results() -> None:
+    input_dir = tum_esm_utils.files.rel_to_abs_path("../data/proffast")
+    paths = sorted(glob.glob(os.path.join(input_dir, "comb_invparms_*.csv")))
+    df = tum_esm_utils.em27.aggregate_proffast2_results(
+        paths, gases=["XCO2", "XCH4", "XCO2_STR"], every="1m"
+    )
+    assert df.columns == ["sensor_id", "gas", "unit", "UTC", "mean", "std", "count"]
+
+    # XCO2_STR is not in the output of the first sensor
+    assert df.group_by("sensor_id", "gas").agg(pl.col("count").sum()).sort(
+        "sensor_id", "gas"
+    ).rows() == [
+        ("ma", "XCH4", 5),
+        ("ma", "XCO2", 5),
+        ("mc", "XCH4", 10),
+        ("mc", "XCO2", 10),
+        ("mc", "XCO2_STR", 10),
+    ]
+
+    raw_df = tum_esm_utils.em27.load_proffast2_result(paths[1])
+    bin_df = raw_df.filter(
+        (pl.col("UTC") >= datetime.datetime(2022, 6, 2, 5, 14))
+        & (pl.col("UTC") < datetime.datetime(2022, 6, 2, 5, 15))
+    )
+    row = df.filter(
+        (pl.col("sensor_id") == "mc")
+        & (pl.col("gas") == "XCH4")
+        & (pl.col("UTC") == datetime.datetime(2022, 6, 2, 5, 14))
+    ).row(0, named=True)
+    expected_values = bin_df["XCH4"].cast(pl.Float64) * 1000
+    assert row["unit"] == "ppb"
+    assert row["count"] == len(bin_df) == 4
+    assert row["mean"] == pytest.approx(expected_values.mean(), rel=1e-6)
+    assert row["std"] == pytest.approx(expected_values.std(), rel=1e-4)
@@ -1,3 +1,5 @@
+from typing import Any
+import datetime
 import pytest
 import tempfile
 import os
@@ -151,3 +153,402 @@ def test_netcdffile_compression() -> None:
                 )
                 a.variables["temperature"][:] = random_temp
                 a.close()
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_compress_netcdf_file_in_blocks() -> None:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        src_filepath = os.path.join(tmpdirname, "src.nc")
+        src_nc = NetCDFFile(src_filepath, mode="w")
+        src_nc.create_dimension("time", 50)
+        src_nc.create_dimension("lat", 30)
+        src_nc.create_dimension("lon", 40)
+        src_nc.create_variable(
+            "temperature",
+            dimensions=("time", "lat", "lon"),
+            units="K",
+            datatype="f8",
+            chunk_sizes=[7, 30, 40],
+            zlib=False,
+        )
+        src_nc.create_variable("pressure", dimensions=("time",), units="hPa", datatype="f8")
+        temperature = np.random.rand(50, 30, 40)
+        temperature[3, 4, 5] = -9999  # masked values are kept
+        src_nc.variables["temperature"][:] = temperature
+        src_nc.variables["pressure"][:] = np.arange(50)
+        src_nc.add_attribute("title", "Test NetCDF File")
+        src_nc.close()
+
+        # the blocks cover the variable exactly once and consist of whole chunks
+        src_nc = NetCDFFile(src_filepath, mode="r")
+        variable = src_nc.variables["temperature"]
+        coverage = np.zeros(variable.shape, dtype=np.int32)
+        blocks = tum_esm_utils.netcdf._iterate_blocks(variable, 3 * 30 * 40 * 8 * 8)  # pyright: ignore[reportPrivateUsage]
+        for block in blocks:
+            assert block[0].start % 7 == 0
+            coverage[block] += 1
+        assert np.all(coverage == 1)
+        src_nc.close()
+
+        for max_workers in [1, 2]:
+            dst_filepath = os.path.join(tmpdirname, f"dst-{max_workers}.nc")
+            tum_esm_utils.netcdf.compress_netcdf_file(
+                src_filepath,
+                dst_filepath,
+                compression_level=4,
+                max_workers=max_workers,
+                memory_budget=100_000,
+            )
+            dst_nc = NetCDFFile(dst_filepath, mode="r")
+            assert dst_nc.variables["temperature"].chunking() == [7, 30, 40]
+            assert dst_nc.variables["temperature"].filters()["zlib"]
+            np.testing.assert_array_almost_equal(
+                dst_nc.variables["temperature"][:], temperature.astype(np.float32)
+            )
+            np.testing.assert_array_equal(dst_nc.variables["pressure"][:], np.arange(50))
+            assert dst_nc.attributes["title"] == "Test NetCDF File"
+            dst_nc.close()
+            assert os.path.getsize(dst_filepath) < os.path.getsize(src_filepath)
+
+        # unlimited dimensions become fixed, so their chunks are shortened to the data
+        src_filepath = os.path.join(tmpdirname, "src-unlimited.nc")
+        src_nc = NetCDFFile(src_filepath, mode="w")
+        src_nc.create_dimension("time", None)
+        src_nc.create_variable("pressure", ("time",), units="hPa", chunk_sizes=[512])
+        src_nc.variables["pressure"][:] = np.arange(10)
+        src_nc.close()
+        dst_filepath = os.path.join(tmpdirname, "dst-unlimited.nc")
+        tum_esm_utils.netcdf.compress_netcdf_file(src_filepath, dst_filepath)
+        dst_nc = NetCDFFile(dst_filepath, mode="r")
+        assert dst_nc.variables["pressure"].chunking() == [10]
+        np.testing.assert_array_equal(dst_nc.variables["pressure"][:], np.arange(10))
+        dst_nc.close()
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_netcdffile_stream_writer() -> None:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        fp = os.path.join(tmpdirname, "stream.nc")
+        ncfile = NetCDFFile(fp, mode="w")
+        ncfile.create_dimension("time", None)
+        ncfile.create_dimension("lat", 20)
+        ncfile.create_dimension("lon", 30)
+
+        # chunk sizes derived from the target chunk size and access pattern
+        assert ncfile.compute_chunk_sizes(("time", "lat", "lon"), target_chunk_size=24000) == [
+            10,
+            20,
+            30,
+        ]
+        assert ncfile.compute_chunk_sizes(("time", "lat", "lon"), target_chunk_size=800) == [
+            1,
+            6,
+            30,
+        ]
+        assert ncfile.compute_chunk_sizes(
+            ("time", "lat", "lon"),
+            target_chunk_size=40000,
+            access_pattern="series",
+            expected_length=2500,
+        ) == [2500, 2, 2]
+        assert ncfile.compute_chunk_sizes(("lat", "lon"), datatype="f8") == [20, 30]
+        assert ncfile.compute_chunk_sizes(()) is None
+
+        ncfile.create_variable("time", ("time",), units="s", datatype="f8", chunk_sizes=[5])
+        ncfile.create_variable(
+            "temperature",
+            ("time", "lat", "lon"),
+            units="K",
+            chunk_sizes=ncfile.compute_chunk_sizes(("time", "lat", "lon"), target_chunk_size=24000),
+        )
+        writer = ncfile.create_stream_writer(["time", "temperature"])
+        assert writer.flush_sizes == {"time": 5, "temperature": 10}
+
+        data = np.random.rand(25, 20, 30).astype(np.float32)
+        for i in range(9):
+            writer.append({"time": i, "temperature": data[i]})
+        assert writer.lengths == {"time": 5, "temperature": 0}
+        assert writer.buffered_records == 9
+        writer.extend({"time": np.arange(9, 22), "temperature": data[9:22]})
+        assert len(ncfile.dimensions["time"]) == 20
+        assert writer.buffered_records == 2
+        writer.extend({"time": np.arange(22, 25), "temperature": data[22:25]})
+
+        with pytest.raises(ValueError):
+            writer.append({"time": 25})
+        with pytest.raises(ValueError):
+            writer.append({"time": 25, "temperature": data[0, 0]})
+        with pytest.raises(ValueError):
+            writer.extend({"time": 25.0, "temperature": data[0]})
+        assert writer.buffered_records == 5
+        ncfile.create_variable("lat_weights", ("lat",), units="1")
+        with pytest.raises(ValueError):
+            ncfile.create_stream_writer(["temperature", "lat_weights"])
+        with pytest.raises(ValueError):
+            ncfile.create_stream_writer(["lat_weights"])
+        ncfile.close()
+
+        # continuing in append mode fills up the last chunk first
+        ncfile = NetCDFFile(fp, mode="a")
+        assert len(ncfile.dimensions["time"]) == 25
+        writer = ncfile.create_stream_writer(["time", "temperature"])
+        writer.extend({"time": np.arange(25, 30), "temperature": data[:5]})
+        assert len(ncfile.dimensions["time"]) == 30
+        ncfile.close()
+
+        ncfile = NetCDFFile(fp, mode="r")
+        np.testing.assert_array_equal(ncfile.variables["time"][:], np.arange(30))
+        np.testing.assert_array_equal(ncfile.variables["temperature"][:25], data)
+        np.testing.assert_array_equal(ncfile.variables["temperature"][25:], data[:5])
+        assert ncfile.variables["temperature"].chunking() == [10, 20, 30]
+        ncfile.close()
+
+        # with automatic chunk sizes, each variable is written in its own chunks
+        fp = os.path.join(tmpdirname, "stream_auto.nc")
+        ncfile = NetCDFFile(fp, mode="w")
+        ncfile.create_dimension("time", None)
+        ncfile.create_dimension("lat", 20)
+        ncfile.create_variable("time", ("time",), units="s", datatype="f8", chunk_sizes="auto")
+        ncfile.create_variable("t2m", ("time", "lat"), units="K", chunk_sizes="auto")
+        time_chunk = int(ncfile.variables["time"].chunking()[0])
+        t2m_chunk = int(ncfile.variables["t2m"].chunking()[0])
+        assert time_chunk > t2m_chunk
+        writer = ncfile.create_stream_writer(["time", "t2m"])
+        assert writer.flush_sizes == {"time": time_chunk, "t2m": t2m_chunk}
+        n = time_chunk + 7
+        fields = np.random.rand(n, 20).astype(np.float32)
+        writer.extend({"time": np.arange(n), "t2m": fields})
+        assert writer.lengths == {"time": time_chunk, "t2m": (n // t2m_chunk) * t2m_chunk}
+        assert writer.buffered_records == n - min(writer.lengths.values())
+        np.testing.assert_array_equal(ncfile.variables["time"][:time_chunk], np.arange(time_chunk))
+        ncfile.close()
+
+        ncfile = NetCDFFile(fp, mode="r")
+        np.testing.assert_array_equal(ncfile.variables["time"][:], np.arange(n))
+        np.testing.assert_array_equal(ncfile.variables["t2m"][:], fields)
+        ncfile.close()
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_benchmark_compression() -> None:
+    data = scipy.ndimage.gaussian_filter(np.random.normal(300, 10, size=(20, 50, 50)), sigma=5)
+    results = tum_esm_utils.netcdf.benchmark_compression(
+        data,
+        codecs=[None, "zlib", "zstd"],
+        levels=[1, 9, 20],  # zlib does not support level 20
+        chunk_sizes=[None, [5, 50, 50]],
+        sample_size=10 * 50 * 50 * 8,
+    )
+    assert len(results) == 2 * (1 + 2 + 3)
+    assert results == sorted(results, key=lambda r: r.compression_ratio, reverse=True)
+    uncompressed = [r for r in results if r.compression is None]
+    assert len(uncompressed) == 2 and all(0.8 < r.compression_ratio < 1.05 for r in uncompressed)
+    assert results[0].compression is not None and results[0].compression_ratio > 1.05
+    assert all(r.write_throughput > 0 and r.read_throughput > 0 for r in results)
+
+    assert tum_esm_utils.netcdf.recommend_compression(results) == results[0]
+    fastest = tum_esm_utils.netcdf.recommend_compression(results, min_read_throughput=1e12)
+    assert min(fastest.write_throughput, fastest.read_throughput) == max(
+        min(r.write_throughput, r.read_throughput) for r in results
+    )
+    with pytest.raises(ValueError):
+        tum_esm_utils.netcdf.benchmark_compression(data.astype(np.int16))
+    with pytest.raises(ValueError):
+        tum_esm_utils.netcdf.benchmark_compression(data, chunk_sizes=[[5, 50]])
+
+    # chunk sizes larger than the sample are shortened to its shape
+    results = tum_esm_utils.netcdf.benchmark_compression(
+        data, codecs=["zlib"], levels=[4], chunk_sizes=[[100, 50, 50]], sample_size=5 * 50 * 50 * 8
+    )
+    assert len(results) == 1 and results[0].chunk_sizes == [5, 50, 50]
+
+    # the recommended configuration can be applied to an existing file
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        src_filepath = os.path.join(tmpdirname, "src.nc")
+        ncfile = NetCDFFile(src_filepath, mode="w")
+        for name, size in zip(["time", "lat", "lon"], data.shape):
+            ncfile.create_dimension(name, size)
+        ncfile.create_variable("t", ("time", "lat", "lon"), units="K", datatype="f8", zlib=False)
+        ncfile.variables["t"][:] = data
+        ncfile.close()
+        dst_filepath = os.path.join(tmpdirname, "dst.nc")
+        tum_esm_utils.netcdf.compress_netcdf_file(
+            src_filepath,
+            dst_filepath,
+            compression="zstd",
+            compression_level=9,
+        )
+        ncfile = NetCDFFile(dst_filepath, mode="r")
+        assert ncfile.variables["t"].filters()["zstd"]
+        ncfile.close()
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_netcdffile_chunk_cache() -> None:
+    data = np.random.normal(300, 10, size=(40, 20, 30))
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        fp = os.path.join(tmpdirname, "test.nc")
+        ncfile = NetCDFFile(fp, mode="w")
+        for name, size in zip(["time", "lat", "lon"], data.shape):
+            ncfile.create_dimension(name, size)
+        ncfile.create_variable("t", ("time", "lat", "lon"), units="K", chunk_sizes=[10, 20, 30])
+        ncfile.create_variable("c", ("time", "lat"), units="K", zlib=False)
+        ncfile.variables["t"][:] = np.ma.masked_greater(data, 310)
+        ncfile.variables["c"][:] = data[:, :, 0]
+        ncfile.close()
+
+        ncfile = NetCDFFile(fp, mode="r")
+        assert ncfile.variables["c"].chunking() == "contiguous"
+        for name in ["t", "c"]:
+            variable = ncfile.variables[name]
+            for key in [
+                ...,
+                5,
+                -1,
+                np.s_[3:27],
+                np.s_[3:27:4, 2],
+                np.s_[::-3, -5:],
+                np.s_[..., 1],
+                np.s_[12, 3:4],
+                np.s_[5:5],
+            ]:
+                expected = variable[key]
+                actual = ncfile.read(name, key)
+                assert actual.shape == expected.shape, (name, key)
+                np.testing.assert_array_equal(
+                    np.ma.getmaskarray(actual), np.ma.getmaskarray(expected)
+                )
+                np.testing.assert_array_equal(actual.filled(0), np.ma.filled(expected, 0))
+        for key in [np.s_[40], np.s_[1, 2, 3, 4], np.s_[..., 1, ...], np.s_[[1, 2]]]:
+            with pytest.raises(IndexError):
+                ncfile.read("t", key)
+
+        # repeated window reads are served from memory
+        cache = ncfile.chunk_cache
+        cache.clear()
+        ncfile.read("t", np.s_[5:15])
+        assert (cache.hits, cache.misses, len(cache)) == (0, 2, 2)
+        ncfile.read("t", np.s_[8:12])
+        ncfile.read("t", np.s_[12:25])
+        assert (cache.hits, cache.misses, len(cache)) == (3, 3, 3)
+        assert cache.hit_rate == 0.5
+
+        # strided reads only load the chunks that contain selected positions
+        cache.clear()
+        np.testing.assert_array_equal(
+            ncfile.read("t", np.s_[::25, 0]), ncfile.variables["t"][::25, 0]
+        )
+        np.testing.assert_array_equal(
+            ncfile.read("t", np.s_[-2::-17]), ncfile.variables["t"][-2::-17]
+        )
+        assert (cache.hits, cache.misses, len(cache)) == (2, 3, 3)
+        ncfile.close()
+
+        # the least recently used chunks are evicted to stay within the memory budget
+        # each chunk uses 10 * 20 * 30 * (4 + 1) bytes for its float32 data and its mask
+        cache = tum_esm_utils.netcdf.NetCDFChunkCache(max_size=70_000)
+        ncfile = NetCDFFile(fp, mode="r", chunk_cache=cache)
+        ncfile.read("t", np.s_[0:30])
+        assert len(cache) == 2 and cache.size <= cache.max_size
+        ncfile.read("t", np.s_[20])
+        assert cache.hits == 1
+        ncfile.read("t", np.s_[0])
+        assert cache.misses == 4
+        ncfile.close()
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_netcdf_multi_file_dataset() -> None:
+    pl = pytest.importorskip("polars")
+    day_lengths = [24, 0, 12, 30]
+    times = np.concatenate(
+        [day * 86400 + np.arange(n) * 3600.0 for day, n in enumerate(day_lengths)]
+    )
+    temperature = np.random.normal(300, 10, size=(len(times), 5)).astype(np.float32)
+    pressure = np.ma.masked_greater(np.random.normal(1000, 10, size=len(times)), 1010).astype(
+        np.float32
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        # write the days in reverse order to check that the files are sorted by time
+        for day, n in reversed(list(enumerate(day_lengths))):
+            offset = sum(day_lengths[:day])
+            ncfile = NetCDFFile(os.path.join(tmpdirname, f"site_{9 - day}.nc"), mode="w")
+            ncfile.create_dimension("time", None)
+            ncfile.create_dimension("height", 5)
+            ncfile.create_variable("time", ("time",), units="seconds since 2025-03-01")
+            ncfile.variables["time"].setncattr("calendar", "standard")
+            ncfile.create_variable("height", ("height",), units="m")
+            ncfile.create_variable("temperature", ("time", "height"), units="K")
+            ncfile.create_variable("pressure", ("time",), units="hPa", chunk_sizes=[8])
+            ncfile.variables["height"][:] = np.arange(5) * 100
+            ncfile.variables["time"][:] = times[offset : offset + n]
+            ncfile.variables["temperature"][:] = temperature[offset : offset + n]
+            ncfile.variables["pressure"][:] = pressure[offset : offset + n]
+            ncfile.close()
+
+        ds = tum_esm_utils.netcdf.NetCDFMultiFileDataset(
+            os.path.join(tmpdirname, "site_*.nc"), max_open_files=2
+        )
+        assert len(ds) == len(times) and len(ds.filepaths) == 3
+        assert ds.shape("temperature") == (len(times), 5)
+        assert ds.shape("height") == (5,)
+        assert ds.open_files == []
+
+        # reads are indexed like a single concatenated variable
+        expected: dict[str, Any] = {"time": times, "temperature": temperature, "pressure": pressure}
+        for key in [
+            ...,
+            30,
+            -1,
+            np.s_[20:40],
+            np.s_[::7],
+            np.s_[::-5],
+            np.s_[50:10:-3],
+            np.s_[3:3],
+        ]:
+            for name in ["time", "pressure"]:
+                actual = ds.read(name, key)
+                assert actual.shape == expected[name][key].shape
+                np.testing.assert_array_equal(actual, expected[name][key])
+        keys: list[Any] = [np.s_[10:50, 2], np.s_[:, ::-1], np.s_[::-1, ::-1], np.s_[-1, ::-1]]
+        for key in keys:
+            actual = ds.read("temperature", key)
+            assert actual.shape == temperature[key].shape
+            np.testing.assert_array_equal(actual, temperature[key])
+        np.testing.assert_array_equal(ds.read("height"), np.arange(5) * 100)
+        np.testing.assert_array_equal(
+            np.ma.getmaskarray(ds.read("pressure")), np.ma.getmaskarray(pressure)
+        )
+        assert len(ds.open_files) == 2
+
+        # time range queries only open the files they touch
+        ds.close()
+        assert ds.get_range(86400 * 2 + 3600, 86400 * 2 + 7200 * 3) == slice(25, 30)
+        assert ds.get_range(86400 * 1.5, None) == slice(24, len(times))
+        assert ds.get_range(None, -1) == slice(0, 0)
+        arrays = ds.select(
+            datetime.datetime(2025, 3, 3, 2), datetime.datetime(2025, 3, 3, 5), ["temperature"]
+        )
+        np.testing.assert_array_equal(arrays["temperature"], temperature[26:29])
+        assert ds.open_files == [ds.filepaths[1]]
+        arrays = ds.select(86400 * 3 + 3600 * 4)
+        assert sorted(arrays.keys()) == ["pressure", "temperature", "time"]
+        np.testing.assert_array_equal(arrays["time"], times[40:])
+
+        df = ds.to_polars(86400 * 0.5, 86400 * 2.5)
+        assert df.columns == ["time", "pressure"]
+        assert df["time"].to_list() == times[12:36].tolist()
+        assert df["pressure"].null_count() == np.ma.getmaskarray(pressure[12:36]).sum()
+        assert isinstance(df, pl.DataFrame)
+        with pytest.raises(ValueError):
+            ds.to_polars(variable_names=["temperature"])
+        ds.close()
+
+        with pytest.raises(FileNotFoundError):
+            tum_esm_utils.netcdf.NetCDFMultiFileDataset(os.path.join(tmpdirname, "*.txt"))
@@ -1,7 +1,14 @@
+import asyncio
+import datetime
 import os
+import shutil
+import socket
+import tempfile
+import threading
 import numpy as np
 import pytest
 import tum_esm_utils.opus
+import tum_esm_utils.opus.utils
 import tum_esm_utils.files
 
 
@@ -17,10 +24,11 @@ IFG6 = os.path.join(IFG_DIR, "so20170608.ifg.050")
 @pytest.mark.order(3)
 @pytest.mark.quick
 def test_opus_file_reading() -> None:
-    for mode in ["skip", "validate", "read"]:
+    for mode in ["skip", "validate", "read", "map"]:
         for f in [IFG1, IFG5, IFG6]:
             of = tum_esm_utils.opus.OpusFile.read(f, interferogram_mode=mode)  # type: ignore
             assert (of.interferogram is not None) == (mode == "read")
+            assert (of.raw_interferogram is not None) == (mode == "map")
             of.model_dump()
 
         # Expect invalid OPUS files to raise a RuntimeError
@@ -44,3 +52,584 @@ def test_opus_file_reading() -> None:
     computed_peak = np.argmax(fwd)  # type: ignore
     ifg_center = fwd.shape[0] // 2
     assert abs(computed_peak - ifg_center) < 10
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_file_memory_mapping() -> None:
+    for f in [IFG1, IFG4, IFG5]:
+        of1 = tum_esm_utils.opus.OpusFile.read(f, interferogram_mode="read")
+        of2 = tum_esm_utils.opus.OpusFile.read(f, interferogram_mode="map")
+        assert of1.interferogram is not None
+        assert of2.raw_interferogram is not None
+        assert of2.interferogram_scaling_factors is not None
+
+        # raw interferogram is a read-only view over the file
+        assert of2.raw_interferogram.dtype == np.float32
+        assert not of2.raw_interferogram.flags.owndata
+        assert not of2.raw_interferogram.flags.writeable
+        assert of2.raw_interferogram.shape == of1.interferogram.shape
+
+        scaled = of2.raw_interferogram * of2.interferogram_scaling_factors[:, np.newaxis]
+        assert np.array_equal(scaled, of1.interferogram)
+
+        # channels come from their own blocks
+        if of1.interferogram.shape[0] == 2:
+            assert not np.array_equal(of1.interferogram[0], of1.interferogram[1])
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_read_many() -> None:
+    filepaths = [IFG1, IFG2, IFG3, IFG4, IFG5, IFG6, IFG1 + ".json"]
+    valid_filepaths = {IFG1, IFG4, IFG5, IFG6}
+
+    results = list(tum_esm_utils.opus.read_many(filepaths, workers=2))
+    assert [r.filepath for r in results] == filepaths
+    for r in results:
+        assert (r.error is None) == (r.filepath in valid_filepaths)
+        assert (r.opus_file is None) == (r.filepath not in valid_filepaths)
+        if r.opus_file is not None:
+            expected = tum_esm_utils.opus.OpusFile.read(r.filepath)
+            assert r.opus_file.model_dump() == expected.model_dump()
+            assert r.opus_file.interferogram is not None
+            assert expected.interferogram is not None
+            assert np.array_equal(r.opus_file.interferogram, expected.interferogram)
+
+    results = list(
+        tum_esm_utils.opus.read_many(filepaths, workers=3, interferogram_mode="skip", ordered=False)
+    )
+    assert set(r.filepath for r in results) == set(filepaths)
+    for r in results:
+        assert (r.error is None) == (r.filepath in valid_filepaths)
+        if r.opus_file is not None:
+            assert r.opus_file.interferogram is None
+
+    # stopping early must not leak worker processes or shared memory
+    for r in tum_esm_utils.opus.read_many(filepaths * 4, workers=2):
+        assert r.filepath == IFG1
+        break
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_channel_scaling() -> None:
+    for f in [IFG1, IFG4, IFG5]:
+        of = tum_esm_utils.opus.OpusFile.read(f)
+        assert of.interferogram is not None
+        metadata = tum_esm_utils.opus.OpusFile.read_metadata(f)
+        for i, block_index in enumerate(metadata.interferogram_block_indices):
+            entry = metadata.directory[block_index]
+            with open(f, "rb") as file:
+                file.seek(entry.block_pointer)
+                raw = np.frombuffer(file.read(4 * entry.block_length), dtype="<f4").astype(
+                    np.float64
+                )
+            assert np.array_equal(
+                of.interferogram[i], raw * of.channel_parameters[i].spectrum["CSF"]
+            )
+
+    # the channels are scaled with their own DBTDSTAT block, even if the
+    # DBTDSTAT directory entries are not in the same order as the data blocks
+    with tempfile.TemporaryDirectory() as tmpdir:
+        swapped_file = os.path.join(tmpdir, os.path.basename(IFG4))
+        shutil.copyfile(IFG4, swapped_file)
+        metadata = tum_esm_utils.opus.OpusFile.read_metadata(IFG4)
+        i, j = metadata.spectrum_block_indices
+        with open(swapped_file, "r+b") as file:
+            file.seek(metadata.header.dir_pointer + 12 * i)
+            entry_i = file.read(12)
+            file.seek(metadata.header.dir_pointer + 12 * j)
+            entry_j = file.read(12)
+            file.seek(metadata.header.dir_pointer + 12 * i)
+            file.write(entry_j)
+            file.seek(metadata.header.dir_pointer + 12 * j)
+            file.write(entry_i)
+
+        of1 = tum_esm_utils.opus.OpusFile.read(IFG4)
+        of2 = tum_esm_utils.opus.OpusFile.read(swapped_file)
+        assert of1.interferogram is not None and of2.interferogram is not None
+        # the channels are stored in the order of the interferogram blocks
+        assert of2.channel_parameters[0].spectrum == of1.channel_parameters[0].spectrum
+        assert of2.channel_parameters[1].spectrum == of1.channel_parameters[1].spectrum
+        assert of2.measurement_times == of1.measurement_times
+        assert np.array_equal(of1.interferogram, of2.interferogram)
+        metadata = tum_esm_utils.opus.OpusFile.read_metadata(swapped_file)
+        assert metadata.spectrum_block_indices == [j, i]
+        for k, block_index in enumerate(metadata.interferogram_block_indices):
+            entry = metadata.directory[block_index]
+            with open(swapped_file, "rb") as file:
+                file.seek(entry.block_pointer)
+                raw = np.frombuffer(file.read(4 * entry.block_length), dtype="<f4")
+            assert np.array_equal(
+                of2.interferogram[k],
+                raw.astype(np.float64) * of2.channel_parameters[k].spectrum["CSF"],
+            )
+        with tum_esm_utils.opus.OpusFile.open(swapped_file) as handle:
+            assert dict(handle.channels[0].spectrum) == of1.channel_parameters[0].spectrum
+        single_channel = tum_esm_utils.opus.OpusFile.read(swapped_file, read_all_channels=False)
+        assert single_channel.channel_parameters[0].spectrum == of1.channel_parameters[0].spectrum
+        assert np.array_equal(
+            np.concatenate(
+                list(tum_esm_utils.opus.OpusFile.iter_interferogram(swapped_file)), axis=1
+            ),
+            of1.interferogram,
+        )
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_file_writing() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for f in [IFG1, IFG4, IFG5]:
+            of = tum_esm_utils.opus.OpusFile.read(f)
+            assert of.interferogram is not None
+            metadata = tum_esm_utils.opus.OpusFile.read_metadata(f)
+
+            # writing the unchanged interferogram reproduces the file
+            target = os.path.join(tmpdir, os.path.basename(f))
+            of.write(target, source_filepath=f)
+            with open(f, "rb") as file1, open(target, "rb") as file2:
+                assert file1.read() == file2.read()
+
+            # only the interferogram blocks differ after rescaling
+            tum_esm_utils.opus.OpusFile.rewrite_interferogram(
+                f, of.interferogram * 2, target_filepath=target
+            )
+            rewritten = tum_esm_utils.opus.OpusFile.read(target)
+            assert rewritten.interferogram is not None
+            assert np.array_equal(rewritten.interferogram, of.interferogram * 2)
+            assert rewritten.model_dump() == of.model_dump()
+            with open(f, "rb") as file1, open(target, "rb") as file2:
+                original, modified = bytearray(file1.read()), bytearray(file2.read())
+            for i in metadata.interferogram_block_indices:
+                entry = metadata.directory[i]
+                end = entry.block_pointer + 4 * entry.block_length
+                original[entry.block_pointer : end] = modified[entry.block_pointer : end]
+            assert original == modified
+
+            # rewrite in place
+            tum_esm_utils.opus.OpusFile.rewrite_interferogram(target, of.interferogram)
+            rewritten = tum_esm_utils.opus.OpusFile.read(target)
+            assert rewritten.interferogram is not None
+            assert np.array_equal(rewritten.interferogram, of.interferogram)
+
+            with pytest.raises(ValueError):
+                tum_esm_utils.opus.OpusFile.rewrite_interferogram(
+                    f, of.interferogram[:, :-1], target_filepath=target
+                )
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_metadata_reading() -> None:
+    for f in [IFG1, IFG4, IFG5]:
+        metadata = tum_esm_utils.opus.OpusFile.read_metadata(f)
+        of = tum_esm_utils.opus.OpusFile.read(f, interferogram_mode="skip")
+        assert metadata.to_opus_file().model_dump() == of.model_dump()
+        assert metadata.parse_measurement_times("end") == (
+            tum_esm_utils.opus.OpusFile.read(f, "end", interferogram_mode="skip").measurement_times
+        )
+
+        # the single-call directory decoding matches the per-entry decoding
+        with open(f, "rb") as file:
+            header = tum_esm_utils.opus.utils.read_opus_header(file)
+            file.seek(header.dir_pointer)
+            entries = [
+                tum_esm_utils.opus.utils.read_opus_dir_entry(file) for _ in range(header.dir_size)
+            ]
+        assert [e.to_model() for e in metadata.directory] == entries
+        assert metadata.header.to_model() == header
+
+    for f in [IFG2, IFG3]:
+        with pytest.raises(RuntimeError):
+            tum_esm_utils.opus.OpusFile.read_metadata(f)
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_file_handle() -> None:
+    for f in [IFG1, IFG4, IFG5]:
+        of = tum_esm_utils.opus.OpusFile.read(f, "end")
+        with tum_esm_utils.opus.OpusFile.open(f, "end") as handle:
+            # only the blocks needed for the timestamps are decoded
+            assert handle.measurement_times == of.measurement_times
+            assert len(handle._blocks) == len(handle.channels) + 1  # pyright: ignore[reportPrivateUsage]
+
+            # blocks are shared between channels instead of being copied
+            assert handle.channels[0].instrument is handle.channels[-1].instrument
+            assert handle.channels[0].spectrum == of.channel_parameters[0].spectrum
+            with pytest.raises(TypeError):
+                handle.channels[0].spectrum["DAT"] = "01/01/2000"  # type: ignore
+
+            assert handle.to_opus_file().model_dump() == of.model_dump()
+            assert of.interferogram is not None
+            assert np.array_equal(handle.read_interferogram(), of.interferogram)
+
+        # decoded blocks remain accessible after closing
+        assert handle.channels[0].optics == of.channel_parameters[0].optics
+        with tum_esm_utils.opus.OpusFile.open(f) as handle, pytest.raises(ValueError):
+            handle.get_parameter_block("DBTXXX")
+
+    for f in [IFG2, IFG3]:
+        with pytest.raises(RuntimeError):
+            tum_esm_utils.opus.OpusFile.open(f)
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_metadata_export() -> None:
+    import polars as pl
+
+    filepaths = [IFG1, IFG2, IFG4, IFG5]
+    with pytest.raises(RuntimeError):
+        tum_esm_utils.opus.export_metadata(filepaths)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        parquet_path = os.path.join(tmpdir, "metadata.parquet")
+        for workers in [1, 2]:
+            df = tum_esm_utils.opus.export_metadata(
+                filepaths, parquet_path=parquet_path, workers=workers, skip_invalid_files=True
+            )
+            assert df.equals(pl.read_parquet(parquet_path))
+
+    expected_rows = [
+        (f, i, p, t)
+        for f in [IFG1, IFG4, IFG5]
+        for of in [tum_esm_utils.opus.OpusFile.read(f, interferogram_mode="skip")]
+        for i, (p, t) in enumerate(zip(of.channel_parameters, of.measurement_times))
+    ]
+    assert len(df) == len(expected_rows)
+    for row, (f, i, p, t) in zip(df.iter_rows(named=True), expected_rows):
+        assert (row["filepath"], row["channel"], row["measurement_time"]) == (f, i, t)
+        assert row["instrument.INS"] == p.instrument["INS"]
+        assert row["spectrum.NPT"] == p.spectrum["NPT"]
+        assert row["acquisition.NSS"] == p.acquisition["NSS"]
+
+    assert df.schema["spectrum.NPT"] == pl.Int32()
+    assert df.schema["spectrum.CSF"] == pl.Float64()
+    assert df.schema["instrument.INS"] == pl.String()
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_index() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ifg_dir = os.path.join(tmpdir, "ifgs")
+        shutil.copytree(IFG_DIR, ifg_dir)
+        index_path = os.path.join(tmpdir, "index", "opus.sqlite")
+        copied_ifg1 = os.path.join(ifg_dir, os.path.basename(IFG1))
+        copied_ifg4 = os.path.join(ifg_dir, os.path.basename(IFG4))
+
+        with tum_esm_utils.opus.OpusIndex(index_path) as index:
+            assert index.update(ifg_dir) == 7
+            assert index.update(ifg_dir) == 0
+            assert set(index.get_invalid_files().keys()) == {
+                os.path.join(ifg_dir, f)
+                for f in [
+                    "md20220409s0e00a.0199",
+                    "md20220409s0e00a.0200",
+                    "md20220409s0e00a.0198.json",
+                ]
+            }
+            assert len(index.query()) == 4
+
+            # query by time and instrument
+            of = tum_esm_utils.opus.OpusFile.read(IFG4, interferogram_mode="skip")
+            t = of.measurement_times[0]
+            entries = index.query(
+                from_datetime=t - datetime.timedelta(minutes=1),
+                to_datetime=t + datetime.timedelta(minutes=1),
+            )
+            assert [e.filepath for e in entries] == [copied_ifg4]
+            assert entries[0].measurement_times == of.measurement_times
+            assert entries[0].header == of.header
+            assert [p.model_dump() for p in entries[0].channel_parameters] == [
+                p.model_dump() for p in of.channel_parameters
+            ]
+            assert [e.filepath for e in index.query(instrument="md")] == [copied_ifg1]
+            assert len(index.query(from_datetime=t + datetime.timedelta(seconds=1))) == 0
+
+            # query by parameter values
+            assert len(index.query(parameters={"instrument.INS": "EM27/SUN"})) == 4
+            assert [
+                e.filepath
+                for e in index.query(parameters={"sample.SNM": "s0e00a", "spectrum.NPT": 228512})
+            ] == [copied_ifg1, copied_ifg4]
+            with pytest.raises(ValueError):
+                index.query(parameters={"INS": "EM27/SUN"})
+
+            # only changed and new files are parsed again, removed files are dropped
+            os.utime(copied_ifg1, ns=(0, 0))
+            os.remove(copied_ifg4)
+            shutil.copy(IFG4, os.path.join(ifg_dir, "mb20240514s0e00a.0975"))
+            assert index.update(ifg_dir, workers=2) == 2
+            assert [e.instrument for e in index.query()] == ["so", "so", "md", "mb"]
+
+        # the index persists
+        with tum_esm_utils.opus.OpusIndex(index_path) as index:
+            assert index.update(ifg_dir) == 0
+            assert len(index.query()) == 4
+
+        # indices with a different timestamp mode are rebuilt
+        with tum_esm_utils.opus.OpusIndex(index_path, measurement_timestamp_mode="end") as index:
+            assert len(index.query()) == 0
+            assert index.update(ifg_dir) == 7
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_interferogram_iteration() -> None:
+    for f in [IFG1, IFG5]:
+        ifg = tum_esm_utils.opus.OpusFile.read(f, interferogram_mode="read").interferogram
+        assert ifg is not None
+
+        windows = list(tum_esm_utils.opus.OpusFile.iter_interferogram(f, window_size=50_000))
+        assert all(w.shape == (ifg.shape[0], 50_000) for w in windows[:-1])
+        assert windows[-1].shape == (ifg.shape[0], ifg.shape[1] % 50_000)
+        assert all(w.dtype == np.float64 for w in windows)
+        assert np.array_equal(np.concatenate(windows, axis=1), ifg)
+
+        windows = list(
+            tum_esm_utils.opus.OpusFile.iter_interferogram(
+                f, window_size=ifg.shape[1] * 2, dtype="float32", read_all_channels=False
+            )
+        )
+        assert len(windows) == 1
+        assert windows[0].dtype == np.float32
+        assert windows[0].shape == (1, ifg.shape[1])
+        assert np.allclose(windows[0][0], ifg[0], rtol=1e-6)
+
+    with pytest.raises(ValueError):
+        next(tum_esm_utils.opus.OpusFile.iter_interferogram(IFG1, window_size=0))
+    with pytest.raises(RuntimeError):
+        next(tum_esm_utils.opus.OpusFile.iter_interferogram(IFG2))
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_http_client(monkeypatch: pytest.MonkeyPatch) -> None:
+    with tum_esm_utils.opus.FakeOpusHTTPServer(
+        latency=0.05, macro_duration=0.5, parameters={"NSS": "10"}, concurrent=True
+    ) as server:
+        client = tum_esm_utils.opus.OpusHTTPClient(
+            host=server.host, port=server.port, timeout=2, retry_wait=0, max_connections=11
+        )
+
+        # answers larger than a single packet are read completely
+        long_text = "x" * 100_000
+        assert client.request_without_retry(f"COMMAND_SAY {long_text}") == [long_text]
+        assert client.is_working()
+        assert client.request_many([f"COMMAND_SAY {i}" for i in range(20)]) == [
+            [str(i)] for i in range(20)
+        ]
+        with pytest.raises(ConnectionError):
+            client.request("UNKNOWN", expect_ok=True)
+
+        # by default, requests are sent one after another
+        server.max_concurrent_requests = 0
+        sequential_client = tum_esm_utils.opus.OpusHTTPClient(
+            host=server.host, port=server.port, timeout=2
+        )
+        assert sequential_client.request_many(["GET_VERSION"] * 3) == [["20190310"]] * 3
+        assert server.max_concurrent_requests == 1
+
+        # with enough connections, all FIND_FUNCTION requests of one check are sent concurrently
+        server.max_concurrent_requests = 0
+        assert not client.some_macro_is_running(check_interval=0.1)
+        request_count = server.request_counts["FIND_FUNCTION"]
+        assert server.max_concurrent_requests > 1
+        macro_id = client.start_macro("C:/macros/measure.mtx")
+        assert client.macro_is_running(macro_id)
+        assert client.some_macro_is_running(check_interval=0.1)
+        assert server.request_counts["FIND_FUNCTION"] == 2 * request_count
+
+        client.stop_macro("C:/macros/measure.mtx")
+        assert not client.macro_is_running(macro_id)
+        assert not client.some_macro_is_running(check_interval=0)
+
+        client.load_experiment("C:/experiments/default.xpm")
+        assert client.get_loaded_experiment() == os.path.join("C:/experiments", "default.xpm")
+        client.set_parameter_mode("file")
+        client.write_parameter("NSS", 20)
+        assert client.read_parameter("NSS") == "20"
+        client.set_parameter_mode("opus")
+        assert client.read_parameter("NSS") == "10"
+
+    # many parameters are read concurrently
+    parameters = {f"P{i:02d}": str(i) for i in range(50)}
+    with tum_esm_utils.opus.FakeOpusHTTPServer(
+        latency=0.05, parameters=parameters, concurrent=True
+    ) as server:
+        client = tum_esm_utils.opus.OpusHTTPClient(
+            host=server.host, port=server.port, timeout=2, retry_wait=0, max_connections=50
+        )
+        results = client.read_parameters([*parameters.keys(), "UNKNOWN"], mode="opus")
+        assert server.max_concurrent_requests > 1
+        assert results.values == parameters
+        assert list(results.errors.keys()) == ["UNKNOWN"]
+        assert server.request_counts["READ_PARAMETER"] == 51
+
+        results = client.write_parameters({"P00": 100, "P01": 101}, mode="file")
+        assert results.values == {"P00": "100", "P01": "101"} and results.errors == {}
+        assert client.read_parameters(["P00", "P02"], mode="file").values == {
+            "P00": "100",
+            "P02": "2",
+        }
+        assert client.read_parameters(["P00"], mode="opus").values == {"P00": "0"}
+
+        # the parameter mode is only set when it changes
+        assert server.request_counts["OPUS_PARAMETERS"] == 2
+        assert server.request_counts["FILE_PARAMETERS"] == 1
+
+        # the static interface shares one client, so the parameter mode stays set
+        monkeypatch.setattr(
+            tum_esm_utils.opus.OpusHTTPInterface,
+            "_client",
+            tum_esm_utils.opus.OpusHTTPClient(host=server.host, port=server.port, timeout=2),
+        )
+        for _ in range(2):
+            results = tum_esm_utils.opus.OpusHTTPInterface.read_parameters(["P02"], mode="file")
+            assert results.values == {"P02": "2"}
+        assert server.request_counts["FILE_PARAMETERS"] == 2
+        tum_esm_utils.opus.OpusHTTPInterface.set_parameter_mode("opus")
+        tum_esm_utils.opus.OpusHTTPInterface.write_parameters({"P03": 103}, mode="opus")
+        assert server.request_counts["OPUS_PARAMETERS"] == 3
+
+    with tum_esm_utils.opus.FakeOpusHTTPServer(drop_rate=1) as server:
+        client = tum_esm_utils.opus.OpusHTTPClient(
+            host=server.host, port=server.port, timeout=2, retry_attempts=2, retry_wait=0
+        )
+        with pytest.raises(ConnectionError):
+            client.request("GET_VERSION")
+        assert server.dropped_requests == 2
+        assert server.request_counts["GET_VERSION"] == 2
+
+    # like OPUS, the fake server answers one request at a time by default
+    with tum_esm_utils.opus.FakeOpusHTTPServer(latency=0.02) as server:
+        client = tum_esm_utils.opus.OpusHTTPClient(
+            host=server.host, port=server.port, timeout=5, max_connections=5
+        )
+        assert client.request_many(["GET_VERSION"] * 5) == [["20190310"]] * 5
+        assert server.max_concurrent_requests == 1
+
+    # an answer that is cut off by a timeout is not parsed as a valid answer
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        connections: list[socket.socket] = []
+
+        def answer_partially() -> None:
+            connection, _ = listener.accept()
+            connections.append(connection)
+            connection.recv(65536)
+            connection.sendall(b"OK\r\n12")
+
+        thread = threading.Thread(target=answer_partially)
+        thread.start()
+        client = tum_esm_utils.opus.OpusHTTPClient(
+            host="127.0.0.1", port=listener.getsockname()[1], timeout=0.5
+        )
+        with pytest.raises(ConnectionError, match="incomplete answer"):
+            client.request_without_retry("GET_VERSION")
+        thread.join()
+        for connection in connections:
+            connection.close()
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_opus_macro_watcher() -> None:
+    with tum_esm_utils.opus.FakeOpusHTTPServer(latency=0.01, macro_duration=0.5) as server:
+        client = tum_esm_utils.opus.OpusHTTPClient(
+            host=server.host, port=server.port, timeout=2, retry_attempts=1
+        )
+        with tum_esm_utils.opus.OpusMacroWatcher(
+            client, poll_intervals=[0.05, 0.1, 0.2]
+        ) as watcher:
+            finished_macro_ids: list[int] = []
+            macro_ids = [client.start_macro(f"C:/macros/m{i}.mtx") for i in range(5)]
+            futures = [watcher.watch(i) for i in macro_ids]
+            assert watcher.watch(macro_ids[0]) is futures[0]
+            for f in futures:
+                f.add_done_callback(lambda f: finished_macro_ids.append(f.result()))
+            assert sorted(watcher.watched_macro_ids()) == macro_ids
+
+            # stopped macros are detected before the others finish
+            client.stop_macro(macro_ids[0])
+            assert [f.result(timeout=10) for f in futures] == macro_ids
+            assert finished_macro_ids[0] == macro_ids[0]
+            assert sorted(finished_macro_ids) == macro_ids
+            assert watcher.watched_macro_ids() == []
+
+            # 0.05 + 0.1 + 0.2 + 0.2 seconds cover the 0.5 seconds runtime
+            assert server.request_counts["MACRO_RESULTS"] <= 1 + 4 * 5
+            assert watcher.request_latencies.count == server.request_counts["MACRO_RESULTS"]
+            assert watcher.detection_latencies.count == 5
+            p95 = watcher.detection_latencies.quantile(0.95)
+            assert p95 is not None and p95 < 5
+
+            # polling errors are passed on to the future
+            with pytest.raises(ConnectionError):
+                watcher.watch(12345).result(timeout=10)
+
+            pending_future = watcher.watch(client.start_macro("C:/macros/long.mtx"))
+        assert pending_future.cancelled()
+
+    histogram = tum_esm_utils.opus.OpusLatencyHistogram(bucket_bounds=[0.1, 0.2, 0.5])
+    assert histogram.mean is None and histogram.quantile(0.5) is None
+    for duration in [0.05, 0.15, 0.15, 0.3, 1.0]:
+        histogram.record(duration)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.quantile(0.5) == 0.2
+    assert histogram.quantile(1) == 1.0
+    assert histogram.mean == pytest.approx(0.33)
+
+
+@pytest.mark.order(3)
+@pytest.mark.quick
+def test_async_opus_http_interface() -> None:
+    with tum_esm_utils.opus.FakeOpusHTTPServer(latency=0.05, concurrent=True) as server:
+
+        async def run() -> None:
+            interfaces = [
+                tum_esm_utils.opus.AsyncOpusHTTPInterface(
+                    host=server.host, port=server.port, timeout=2, retry_wait=0
+                )
+                for _ in range(5)
+            ]
+
+            # the requests to all instances run concurrently on one event loop
+            assert await asyncio.gather(*[i.is_working() for i in interfaces]) == [True] * 5
+            assert (
+                await asyncio.gather(*[i.get_main_thread_id() for i in interfaces])
+                == [server.main_thread_id] * 5
+            )
+            assert server.max_concurrent_requests > 1
+
+            macro_id = await interfaces[0].start_macro("C:/macros/measure.mtx")
+            assert await interfaces[1].macro_is_running(macro_id)
+            interfaces[0].max_connections = 11
+            server.max_concurrent_requests = 0
+            assert await interfaces[0].some_macro_is_running(check_interval=0.1)
+            assert server.max_concurrent_requests > 1
+            await interfaces[2].stop_macro(macro_id)
+            assert not await interfaces[3].macro_is_running(macro_id)
+
+            with pytest.raises(ConnectionError):
+                await interfaces[0].request("UNKNOWN", expect_ok=True)
+
+            await interfaces[0].write_parameters({"NSS": 20, "RES": 0.5}, mode="file")
+            results = await interfaces[0].read_parameters(["NSS", "RES", "UNKNOWN"])
+            assert results.values == {"NSS": "20", "RES": "0.5"}
+            assert list(results.errors.keys()) == ["UNKNOWN"]
+            assert server.request_counts["FILE_PARAMETERS"] == 1
+
+        asyncio.run(run())
+        port = server.port
+
+    async def run_without_server() -> None:
+        with pytest.raises(ConnectionError):
+            await tum_esm_utils.opus.AsyncOpusHTTPInterface(
+                host="127.0.0.1", port=port, retry_attempts=2, retry_wait=0.01
+            ).get_version()
+
+    asyncio.run(run_without_server())
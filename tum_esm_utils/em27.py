@@ -1,6 +1,8 @@
 """Functions for interacting with EM27 interferograms.
 
-Implements: `detect_corrupt_opus_files`, `load_proffast2_result`.
+Implements: `detect_corrupt_opus_files`, `validate_opus_file`,
+`load_proffast2_result`, `scan_proffast2_results`,
+`aggregate_proffast2_results`.
 
 This requires you to install this utils library with the optional `em27` dependency:
 
@@ -8,135 +10,296 @@ This requires you to install this utils library with the optional `em27` depende
 pip install "tum_esm_utils[em27]"
 # or
 uv add "tum_esm_utils[em27]"
-```"""
+```
+
+The Python validator (`validator="python"`) additionally requires the
+optional `opus` dependency."""
 
 from __future__ import annotations
-from typing import Literal
+from typing import Literal, Optional
 from typing_extensions import deprecated
+import concurrent.futures
+import datetime
+import glob
+import hashlib
+import json
 import os
+import re
+import sqlite3
+import struct
 import subprocess
-import filelock
-import tum_esm_utils.text
+import sys
+import tempfile
 import polars as pl
 from tailwind_colors import TAILWIND_COLORS_HEX as TCH
 
 _PARSER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opus_file_validator")
+_FORTRAN_SOURCE_FILES = ["glob_prepro6.F90", "glob_OPUSparms6.F90", "opus_file_validator.F90"]
+_FORTRAN_REFERENCE_FILES = ["refspec.dat", "refspec2.dat"]
+
+
+def _hash_parser_files(filenames: list[str]) -> str:
+    sha = hashlib.sha256()
+    for filename in filenames:
+        with open(os.path.join(_PARSER_DIR, filename), "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
 
 
 def _compile_fortran_code(
     silent: bool = True,
     fortran_compiler: Literal["gfortran", "gfortran-9"] = "gfortran",
     force_recompile: bool = False,
-) -> None:
+) -> str:
+    """Compile the Fortran validator once per compiler and source hash and
+    return the path of the binary. The binary is compiled in a temporary
+    directory and moved into place atomically, so concurrent callers never
+    see a partially written binary and do not need a lock."""
+
     assert os.name == "posix"
 
-    if force_recompile or (not os.path.isfile(os.path.join(_PARSER_DIR, "opus_file_validator"))):
+    binary_path = os.path.join(
+        _PARSER_DIR,
+        "bin",
+        f"opus_file_validator-{fortran_compiler}-{_hash_parser_files(_FORTRAN_SOURCE_FILES)}",
+    )
+    if force_recompile or (not os.path.isfile(binary_path)):
         if not silent:
             print("compiling fortran code")
 
-        command = (
-            f"{fortran_compiler} -nocpp -O3 -o ./opus_file_validator "
-            + "glob_prepro6.F90 glob_OPUSparms6.F90 opus_file_validator.F90"
-        )
-        p = subprocess.run(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=_PARSER_DIR,
-            env=os.environ.copy(),
-        )
-        if p.returncode != 0:
-            stdout = p.stdout.decode("utf-8", errors="replace").strip()
-            stderr = p.stderr.decode("utf-8", errors="replace").strip()
-            raise Exception(
-                f"command '{command}' failed with exit code {p.returncode}, "
-                + f"stderr: {stderr}, stout:{stdout}",
+        os.makedirs(os.path.dirname(binary_path), exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(binary_path)) as tmpdir:
+            command = [
+                fortran_compiler,
+                "-nocpp",
+                "-O3",
+                "-o",
+                "./opus_file_validator",
+                *[os.path.join(_PARSER_DIR, f) for f in _FORTRAN_SOURCE_FILES],
+            ]
+            p = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=tmpdir,
+                env=os.environ.copy(),
             )
+            if p.returncode != 0:
+                stdout = p.stdout.decode("utf-8", errors="replace").strip()
+                stderr = p.stderr.decode("utf-8", errors="replace").strip()
+                raise Exception(
+                    f"command '{' '.join(command)}' failed with exit code {p.returncode}, "
+                    + f"stderr: {stderr}, stout:{stdout}",
+                )
+            os.replace(os.path.join(tmpdir, "opus_file_validator"), binary_path)
+
+    return binary_path
+
+
+# settings of the Proffast 2 preprocessor used for validating OPUS files
+# (see `opus_file_validator.template.inp`): mpowFFT = 17 and dual channel
+_VALIDATOR_OPD_MAX = 1.8
+_VALIDATOR_IFG_RADIUS = 56873
+_VALIDATOR_MAX_IFG = 2**17
+_VALIDATOR_PHASE_POINTS = 3000
+_VALIDATOR_MAX_BLOCKS = 40
+_VALIDATOR_MAX_BLOCK_LENGTH = 50000
+_VALIDATOR_MIN_FILE_SIZE = 100000
+_VALIDATOR_UNREADABLE_FILE = "File not even readible by the parser"
+_PYTHON_VALIDATOR_VERSION = 3
+_FORTRAN_MIN_SHARD_SIZE = 64
+
+
+def _validate_opus_parameter(
+    raw_block: Optional[bytes],
+    name: str,
+    kind: Literal["int", "double", "string"],
+    errors: list[str],
+) -> Optional[int | float | str]:
+    """Read a single parameter from a raw parameter block like the Proffast 2
+    preprocessor does and append its error messages to `errors`."""
+
+    position = -1 if raw_block is None else raw_block.find(name.encode() + b"\x00")
+    if raw_block is None or position < 0 or position + 8 > len(raw_block):
+        # the Fortran validator prints this message over three lines
+        errors.extend(['Charfilter "', name, '" is missing'])
+        errors.append("Inconsistent parameter kind in OPUS file!")
+        return None
+
+    parameter_type, reserved_space = struct.unpack_from("<hh", raw_block, position + 4)
+    value: Optional[int | float | str] = None
+    if kind == "int":
+        if parameter_type != 0 or reserved_space != 2:
+            errors.append("Inconsistent parameter kind in OPUS file!")
+        elif position + 12 <= len(raw_block):
+            value = struct.unpack_from("<i", raw_block, position + 8)[0]
+    elif kind == "double":
+        if parameter_type != 1 or reserved_space != 4:
+            errors.append("Inconsistent parameter kind in OPUS file!")
+        elif position + 16 <= len(raw_block):
+            value = struct.unpack_from("<d", raw_block, position + 8)[0]
+    else:
+        if parameter_type not in [2, 3]:
+            errors.append("Inconsistent parameter kind in OPUS file!")
+        value = raw_block[position + 8 : position + 8 + 2 * max(reserved_space, 0)].decode(
+            "utf-8", errors="replace"
+        )
+    return value
 
 
-def detect_corrupt_opus_files(
-    ifg_directory: str,
-    silent: bool = True,
-    fortran_compiler: Literal["gfortran", "gfortran-9"] = "gfortran",
-    force_recompile: bool = False,
-) -> dict[str, list[str]]:
-    """Returns dict[filename, list[error_messages]] for all
-    corrupt opus files in the given directory.
-
-    It will compile the fortran code using a given compiler
-    to perform this task. The fortran code is derived from
-    the preprocess source code of Proffast 2
-    (https://www.imk-asf.kit.edu/english/3225.php). We use
-    it because the retrieval using Proffast 2 will fail if
-    there are corrupt interferograms in the input.
+def validate_opus_file(filepath: str) -> list[str]:
+    """Check whether a single OPUS file can be processed by Proffast 2.
 
-    Args:
-        ifg_directory:     The directory containing the interferograms.
-        silent:            If set to False, print additional information.
-        fortran_compiler:  The fortran compiler to use.
-        force_recompile:   If set to True, the fortran code will be recompiled.
+    This is a pure Python port of the checks in our Fortran validator (see
+    `detect_corrupt_opus_files`), which is derived from the Proffast 2
+    preprocessor, and returns the same messages. Like the Fortran validator,
+    it reports files smaller than 100 kB as "File not even readible by the
+    parser" and splits the message `Charfilter "<name>" is missing` into
+    three entries (`'Charfilter "'`, `'<name>'`, `'" is missing'`). The
+    differences are:
 
-    Returns:
-        A dictionary containing corrupt filenames as keys and a list of error
-        messages as values."""
+    * It checks that the interferogram blocks are fully present in the file
+      ("IFG block exceeds the file size!").
+    * Files that cannot be parsed at all are reported with the errors found
+      up to that point, followed by "File not even readible by the parser".
+    * The values in the "OPUS RES" and "Requested RES" messages are
+      formatted by Python instead of Fortran.
 
-    if os.name != "posix":
-        raise OSError("detect_corrupt_opus_files is only supported on Unix systems")
+    Requires the optional `opus` dependency.
 
-    # compiling the fortran code in a semaphore
-    with filelock.FileLock(
-        os.path.join(_PARSER_DIR, "opus_file_validator.lock"),
-        timeout=30,
-    ):
-        _compile_fortran_code(
-            silent=silent, fortran_compiler=fortran_compiler, force_recompile=force_recompile
-        )
+    Args:
+        filepath: The path to the OPUS file.
 
-    # list directory files
-    filepaths = list(
-        sorted(
-            [
-                fp
-                for fp in [f"{ifg_directory}/{x}" for x in os.listdir(ifg_directory)]
-                if os.path.isfile(fp)
-            ]
-        )
+    Returns:
+        A list of error messages. The file is intact if the list is empty."""
+
+    from tum_esm_utils.opus import utils as opus_utils
+
+    errors: list[str] = []
+    try:
+        f = open(filepath, "rb")
+    except OSError:
+        return ["Cannot open measurement file!"]
+
+    try:
+        with f:
+            if os.fstat(f.fileno()).st_size < _VALIDATOR_MIN_FILE_SIZE:
+                return [_VALIDATOR_UNREADABLE_FILE]
+            if f.read(4) != opus_utils.FILE_MAGIC:
+                return ["Not an OPUS file!"]
+            f.seek(0)
+            opus_header = opus_utils.read_raw_opus_header(f)
+            if opus_header.dir_size > _VALIDATOR_MAX_BLOCKS:
+                errors.append("nofblock too big!")
+            opus_dirs = opus_utils.read_raw_opus_directory(f, opus_header)
+            file_size = os.fstat(f.fileno()).st_size
+
+            # interferogram blocks
+            block_types = [d.block_type % 2**16 for d in opus_dirs]
+            ifg_a_dirs = [d for d, t in zip(opus_dirs, block_types) if t == 2055]
+            ifg_b_dirs = [d for d, t in zip(opus_dirs, block_types) if t == 34823]
+            ifg_a_size = 4 * ifg_a_dirs[-1].block_length if len(ifg_a_dirs) > 0 else 0
+            ifg_b_size = 4 * ifg_b_dirs[-1].block_length if len(ifg_b_dirs) > 0 else 0
+            if len(ifg_b_dirs) == 0:
+                errors.append("Inconsistent dualifg!")
+            if ifg_a_size == 0:
+                errors.append("Zero IFG block size!")
+            ifg_points = 0
+            if ifg_a_size != ifg_b_size:
+                errors.append("Differing sizes of dual channel IFGs!")
+            else:
+                if ifg_a_size % 8 != 0:
+                    errors.append("Unexpected IFG size!")
+                ifg_points = ifg_a_size // 8
+            if ifg_points > _VALIDATOR_MAX_IFG:
+                errors.append("Note: nifg > maxifg")
+            if ifg_points < _VALIDATOR_IFG_RADIUS + _VALIDATOR_PHASE_POINTS + 1:
+                errors.append("IFG size too small!")
+            for ifg_dir in ifg_a_dirs[-1:] + ifg_b_dirs[-1:]:
+                if ifg_dir.block_pointer + 4 * ifg_dir.block_length > file_size:
+                    errors.append("IFG block exceeds the file size!")
+
+            # parameter blocks
+            raw_blocks: dict[int, Optional[bytes]] = {}
+            for block_type in [32, 48, 96, 2071]:
+                raw_blocks[block_type] = None
+                if block_type not in block_types:
+                    continue
+                block_dir = opus_dirs[block_types.index(block_type)]
+                if 4 * block_dir.block_length > _VALIDATOR_MAX_BLOCK_LENGTH:
+                    errors.append("Max blocklength exceeded!")
+                f.seek(block_dir.block_pointer)
+                raw_block = f.read(4 * block_dir.block_length)
+                if len(raw_block) != 4 * block_dir.block_length:
+                    return [*errors, _VALIDATOR_UNREADABLE_FILE]
+                raw_blocks[block_type] = raw_block
+
+            for name in ["GFW", "GBW"]:
+                _validate_opus_parameter(raw_blocks[32], name, "int", errors)
+            for name in ["HFL", "LWN", "TSC", "DUR"]:
+                _validate_opus_parameter(raw_blocks[32], name, "double", errors)
+            nss = _validate_opus_parameter(raw_blocks[48], "NSS", "int", errors)
+            _validate_opus_parameter(raw_blocks[48], "AQM", "string", errors)
+            res = _validate_opus_parameter(raw_blocks[48], "RES", "double", errors)
+            for name in ["VEL", "HPF", "LPF", "DAT", "TIM"]:
+                _validate_opus_parameter(
+                    raw_blocks[96 if name in ["VEL", "HPF", "LPF"] else 2071],
+                    name,
+                    "string",
+                    errors,
+                )
+
+            # formal consistency with the demands of the Proffast 2 preprocessor
+            if isinstance(res, float) and res > 0.90001 / _VALIDATOR_OPD_MAX:
+                errors.append(f"OPUS RES: {res}")
+                errors.append(f"Requested RES: {0.9 / _VALIDATOR_OPD_MAX}")
+                errors.append("RES too small!")
+            if isinstance(nss, int) and nss % 2 != 0:
+                errors.append("Uneven number of scans!")
+    except Exception:
+        return [*errors, _VALIDATOR_UNREADABLE_FILE]
+
+    return errors
+
+
+def _get_validator_version(validator: Literal["fortran", "python"]) -> str:
+    """Identifies the validator implementation, used to invalidate cached results."""
+
+    if validator == "python":
+        return f"python-{_PYTHON_VALIDATOR_VERSION}"
+    return "fortran-" + _hash_parser_files(
+        [*_FORTRAN_SOURCE_FILES, "opus_file_validator.template.inp"]
     )
 
-    # write input file for parser in a semaphore
-    with filelock.FileLock(f"{_PARSER_DIR}/opus_file_validator.lock"):
-        random_id = tum_esm_utils.text.get_random_string(
-            10,
-            forbidden=[
-                f.replace("opus_file_validator.inp.", "")
-                for f in os.listdir(_PARSER_DIR)
-                if f.startswith("opus_file_validator.inp.")
-            ],
-        )
-        input_file_path = f"{_PARSER_DIR}/opus_file_validator.inp.{random_id}"
 
-        with open(f"{_PARSER_DIR}/opus_file_validator.template.inp", "r") as f:
-            template_content = f.read()
-        with open(input_file_path, "w") as f:
-            f.write(template_content.replace("%IFG_LIST%", "\n".join(filepaths)))
+def _run_python_validator(
+    filepaths: list[str],
+    max_workers: Optional[int],
+) -> dict[str, list[str]]:
+    """Validate files with `validate_opus_file` in a process pool. Returns
+    the errors for every given filepath (empty list = intact)."""
+
+    workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    if workers > 1 and len(filepaths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            errors = list(
+                executor.map(
+                    validate_opus_file,
+                    filepaths,
+                    chunksize=max(1, min(256, len(filepaths) // (4 * workers))),
+                )
+            )
+    else:
+        errors = [validate_opus_file(fp) for fp in filepaths]
+    return dict(zip(filepaths, errors))
 
-    # run the parser
-    process = subprocess.run(
-        ["./opus_file_validator", input_file_path],
-        cwd=_PARSER_DIR,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    os.remove(input_file_path)
-    stdout = process.stdout.decode()
-    stderr = process.stderr.decode()
 
-    if not process.returncode == 0:
-        raise RuntimeError(
-            f"Opus File Parser failed with exit code {process.returncode}, "
-            + f"stderr: {stderr}, stdout: {stdout}",
-        )
+def _parse_fortran_validator_output(
+    filepaths: list[str],
+    stdout: str,
+) -> dict[str, list[str]]:
+    """Parse the stdout of the Fortran validator. Returns the errors for
+    every given filepath (empty list = intact)."""
 
     # locate the block of verification results
     if (stdout.count("--- Start verifying file integrities ---") != 1) or (
@@ -152,27 +315,293 @@ def detect_corrupt_opus_files(
     # parse the verification results
     results: dict[str, list[str]] = {}
     checked_files: set[str] = set(filepaths)
-    if "\n\n" in verification_block:
-        file_verification_blocks = verification_block.split("\n\n")
-        for block in file_verification_blocks:
-            lines = block.split("\n")
-            is_corrupt = len(lines) > 2
-            filepath = lines[0].split('"')[1]
-            if is_corrupt:
-                results[os.path.basename(filepath)] = lines[1:-1]
-            checked_files.remove(filepath)
+    for block in verification_block.split("\n\n"):
+        if not block.startswith("Parsing file"):
+            continue
+        lines = block.split("\n")
+        is_corrupt = len(lines) > 2
+        filepath = lines[0].split('"')[1]
+        results[filepath] = lines[1:-1] if is_corrupt else []
+        checked_files.remove(filepath)
 
     # every file not mentioned in the verification results failed during reading it
     for filepath in checked_files:
-        results[os.path.basename(filepath)] = ["File not even readible by the parser"]
+        results[filepath] = [_VALIDATOR_UNREADABLE_FILE]
+
+    return results
+
+
+def _run_fortran_validator_shard(
+    binary_path: str,
+    filepaths: list[str],
+    debug_output_path: Optional[str],
+) -> dict[str, list[str]]:
+    """Run the Fortran validator on a list of files in its own temporary
+    working directory."""
+
+    with tempfile.TemporaryDirectory(prefix="opus_file_validator-") as tmpdir:
+        # the validator reads its reference spectra from the working directory
+        for filename in _FORTRAN_REFERENCE_FILES:
+            os.symlink(os.path.join(_PARSER_DIR, filename), os.path.join(tmpdir, filename))
+
+        input_file_path = os.path.join(tmpdir, "opus_file_validator.inp")
+        with open(os.path.join(_PARSER_DIR, "opus_file_validator.template.inp"), "r") as f:
+            template_content = f.read()
+        with open(input_file_path, "w") as f:
+            f.write(template_content.replace("%IFG_LIST%", "\n".join(filepaths)))
+
+        # run the parser
+        process = subprocess.run(
+            [binary_path, input_file_path],
+            cwd=tmpdir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    stdout = process.stdout.decode()
+    stderr = process.stderr.decode()
 
     # save the raw output for debugging purposes
-    with open(os.path.join(_PARSER_DIR, "output.txt"), "w") as f:
-        f.write(stdout)
+    if debug_output_path is not None:
+        with open(debug_output_path, "w") as f:
+            f.write(stdout)
+
+    if not process.returncode == 0:
+        raise RuntimeError(
+            f"Opus File Parser failed with exit code {process.returncode}, "
+            + f"stderr: {stderr}, stdout: {stdout}",
+        )
+
+    return _parse_fortran_validator_output(filepaths, stdout)
+
+
+def _run_fortran_validator(
+    filepaths: list[str],
+    silent: bool,
+    fortran_compiler: Literal["gfortran", "gfortran-9"],
+    force_recompile: bool,
+    max_workers: Optional[int],
+    debug_output_dir: Optional[str],
+) -> dict[str, list[str]]:
+    """Validate files with the compiled Fortran validator, sharded across
+    `max_workers` parallel subprocesses. Returns the errors for every given
+    filepath (empty list = intact)."""
+
+    if os.name != "posix":
+        raise OSError("detect_corrupt_opus_files is only supported on Unix systems")
 
+    binary_path = _compile_fortran_code(
+        silent=silent, fortran_compiler=fortran_compiler, force_recompile=force_recompile
+    )
+
+    # every shard should contain enough files to amortize the process startup
+    workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    shard_count = max(1, min(workers, len(filepaths) // _FORTRAN_MIN_SHARD_SIZE))
+    shards = [filepaths[i::shard_count] for i in range(shard_count)]
+    debug_output_paths: list[Optional[str]] = [None] * shard_count
+    if debug_output_dir is not None:
+        os.makedirs(debug_output_dir, exist_ok=True)
+        debug_output_paths = [
+            os.path.join(debug_output_dir, "output.txt" if shard_count == 1 else f"output.{i}.txt")
+            for i in range(shard_count)
+        ]
+    if not silent:
+        print(f"running the fortran validator in {shard_count} parallel process(es)")
+
+    results: dict[str, list[str]] = {}
+    if shard_count == 1:
+        results.update(_run_fortran_validator_shard(binary_path, shards[0], debug_output_paths[0]))
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=shard_count) as executor:
+            for shard_results in executor.map(
+                _run_fortran_validator_shard,
+                [binary_path] * shard_count,
+                shards,
+                debug_output_paths,
+            ):
+                results.update(shard_results)
     return results
 
 
+def _get_user_cache_dir() -> str:
+    """The per-user cache directory of this library, e.g. `~/.cache/tum_esm_utils`
+    on Linux (respecting `XDG_CACHE_HOME`), `~/Library/Caches/tum_esm_utils` on
+    macOS and `%LOCALAPPDATA%/tum_esm_utils` on Windows."""
+
+    if os.name == "nt":
+        base_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base_dir = os.path.expanduser("~/Library/Caches")
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base_dir, "tum_esm_utils")
+
+
+class _ValidationCache:
+    """SQLite cache of validation results, keyed by
+    (filepath, size, mtime, validator version)."""
+
+    def __init__(self, cache_path: str, validator_version: str) -> None:
+        self.validator_version = validator_version
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self.conn = sqlite3.connect(cache_path, timeout=30)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS validation_results ("
+                + "filepath TEXT NOT NULL, directory TEXT NOT NULL, "
+                + "validator_version TEXT NOT NULL, size INTEGER NOT NULL, "
+                + "mtime_ns INTEGER NOT NULL, errors TEXT NOT NULL, "
+                + "PRIMARY KEY (filepath, validator_version))"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS validation_results_directory "
+                + "ON validation_results (directory, validator_version)"
+            )
+
+    def get(self, directory: str) -> dict[str, tuple[int, int, list[str]]]:
+        """Returns {filepath: (size, mtime_ns, errors)} for a directory."""
+
+        rows = self.conn.execute(
+            "SELECT filepath, size, mtime_ns, errors FROM validation_results "
+            + "WHERE directory = ? AND validator_version = ?",
+            (directory, self.validator_version),
+        ).fetchall()
+        return {fp: (size, mtime_ns, json.loads(errors)) for fp, size, mtime_ns, errors in rows}
+
+    def put(self, results: dict[str, tuple[int, int, list[str]]]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO validation_results VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        fp,
+                        os.path.dirname(fp),
+                        self.validator_version,
+                        size,
+                        mtime_ns,
+                        json.dumps(errors),
+                    )
+                    for fp, (size, mtime_ns, errors) in results.items()
+                ],
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def detect_corrupt_opus_files(
+    ifg_directory: str,
+    silent: bool = True,
+    fortran_compiler: Literal["gfortran", "gfortran-9"] = "gfortran",
+    force_recompile: bool = False,
+    validator: Literal["fortran", "python"] = "fortran",
+    max_workers: Optional[int] = None,
+    use_cache: bool = False,
+    cache_path: Optional[str] = None,
+    debug_output_dir: Optional[str] = None,
+) -> dict[str, list[str]]:
+    """Returns dict[filename, list[error_messages]] for all
+    corrupt opus files in the given directory.
+
+    It will compile the fortran code using a given compiler
+    to perform this task. The fortran code is derived from
+    the preprocess source code of Proffast 2
+    (https://www.imk-asf.kit.edu/english/3225.php). We use
+    it because the retrieval using Proffast 2 will fail if
+    there are corrupt interferograms in the input.
+
+    The Fortran validator is compiled once per compiler and source
+    version. Every invocation runs in its own temporary working
+    directories, so concurrent calls do not block each other. Large
+    directories are split across `max_workers` parallel validator
+    processes.
+
+    With `validator="python"`, the same checks are performed by
+    `validate_opus_file` in a process pool instead. This requires
+    no compiler, no shared lock, and also works on Windows.
+
+    With `use_cache=True`, the results are stored in an SQLite file
+    keyed by the path, size, modification time and validator version
+    of each file. Repeated scans of a directory only validate new or
+    modified files.
+
+    Args:
+        ifg_directory:     The directory containing the interferograms.
+        silent:            If set to False, print additional information.
+        fortran_compiler:  The fortran compiler to use.
+        force_recompile:   If set to True, the fortran code will be recompiled.
+        validator:         Whether to use the Fortran or the Python validator.
+        max_workers:       Number of parallel validator processes. Defaults to
+                           the number of CPUs.
+        use_cache:         Whether to reuse the results of previous runs.
+        cache_path:        The SQLite file to store the results in. Defaults
+                           to `opus_file_validator.cache.sqlite` in the user
+                           cache directory (e.g. `~/.cache/tum_esm_utils`).
+        debug_output_dir:  If set, the raw output of the Fortran validator is
+                           written to `output.txt` (or `output.{i}.txt` per
+                           parallel process) in this directory. Otherwise,
+                           it is not saved. Earlier versions always wrote it
+                           to `output.txt` in the package directory, where
+                           concurrent calls overwrote each other's output.
+
+    Returns:
+        A dictionary containing corrupt filenames as keys and a list of error
+        messages as values."""
+
+    # list directory files
+    ifg_directory = os.path.abspath(ifg_directory)
+    file_stats: dict[str, tuple[int, int]] = {}
+    with os.scandir(ifg_directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                file_stats[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    filepaths = list(sorted(file_stats.keys()))
+
+    cache: Optional[_ValidationCache] = None
+    cached_results: dict[str, tuple[int, int, list[str]]] = {}
+    if use_cache:
+        cache = _ValidationCache(
+            cache_path or os.path.join(_get_user_cache_dir(), "opus_file_validator.cache.sqlite"),
+            _get_validator_version(validator),
+        )
+    try:
+        if cache is not None:
+            cached_results = cache.get(ifg_directory)
+        results: dict[str, list[str]] = {}
+        unchecked_filepaths: list[str] = []
+        for fp in filepaths:
+            cached_result = cached_results.get(fp)
+            if (cached_result is not None) and (cached_result[:2] == file_stats[fp]):
+                results[fp] = cached_result[2]
+            else:
+                unchecked_filepaths.append(fp)
+        if not silent and cache is not None:
+            print(f"validating {len(unchecked_filepaths)} new or modified files")
+
+        if len(unchecked_filepaths) > 0:
+            if validator == "python":
+                new_results = _run_python_validator(unchecked_filepaths, max_workers)
+            else:
+                new_results = _run_fortran_validator(
+                    unchecked_filepaths,
+                    silent,
+                    fortran_compiler,
+                    force_recompile,
+                    max_workers,
+                    debug_output_dir,
+                )
+            results.update(new_results)
+            if cache is not None:
+                cache.put({fp: (*file_stats[fp], new_results[fp]) for fp in unchecked_filepaths})
+    finally:
+        if cache is not None:
+            cache.close()
+
+    return {
+        os.path.basename(fp): errors for fp, errors in sorted(results.items()) if len(errors) > 0
+    }
+
+
 @deprecated(
     "This will be removed in the next breaking release. Please use "
     + "the identical function `detect_corrupt_opus_files` instead."
@@ -210,42 +639,281 @@ def detect_corrupt_ifgs(
     )
 
 
-def load_proffast2_result(path: str) -> pl.DataFrame:
+_PROFFAST2_FILENAME_PATTERN = re.compile(
+    r"comb_invparms_(?P<sensor_id>[a-zA-Z0-9]+)_SN(?P<serial_number>\d+)_"
+    + r"(?P<from_date>\d{6})-(?P<to_date>\d{6})\.csv$"
+)
+
+
+def _scan_proffast2_result(path: str) -> pl.LazyFrame:
+    """Scan a single Proffast 2 output file. The schema is derived from its
+    header line because the available gases differ between Proffast versions."""
+
+    with open(path, "r") as f:
+        column_names = [c.strip() for c in f.readline().split(",")]
+    schema: dict[str, type[pl.DataType]] = {
+        cn: (pl.Utf8 if cn in ["UTC", "LocalTime", "spectrum"] else pl.Float32)
+        for cn in column_names
+    }
+
+    # the header names are replaced by the stripped names of `schema`; the
+    # timestamps are parsed with an explicit format because that is several
+    # times faster than letting the CSV reader infer the datetime format
+    return (
+        pl.scan_csv(path, has_header=True, separator=",", schema=schema)
+        .drop("JulianDate", "UTtimeh", strict=False)
+        .with_columns(
+            pl.col("UTC").str.strptime(dtype=pl.Datetime, format="%Y-%m-%d %H:%M:%S"),
+            pl.col("LocalTime").str.strptime(dtype=pl.Datetime, format=" %Y-%m-%d %H:%M:%S"),
+        )
+    )
+
+
+# increase this when the output of `_scan_proffast2_result` changes
+_PROFFAST2_CACHE_VERSION = 1
+
+
+def _get_proffast2_cache_path(path: str, cache_dir: Optional[str]) -> tuple[str, str]:
+    """Returns the path of the Parquet cache file of a Proffast 2 output file
+    and the glob pattern matching all its (possibly stale) cache files.
+
+    The cache key (schema version, size and modification time of the output
+    file) is part of the filename, so checking whether the cache is valid
+    only requires a single `stat` call."""
+
+    stat = os.stat(path)
+    key = f"v{_PROFFAST2_CACHE_VERSION}-{stat.st_size}-{stat.st_mtime_ns}"
+    if cache_dir is None:
+        directory, prefix = os.path.dirname(path), f".{os.path.basename(path)}."
+    else:
+        path_hash = hashlib.md5(os.path.abspath(path).encode()).hexdigest()[:16]
+        directory, prefix = cache_dir, f"{path_hash}-{os.path.basename(path)}."
+    return (
+        os.path.join(directory, f"{prefix}{key}.parquet"),
+        os.path.join(glob.escape(directory), f"{glob.escape(prefix)}*.parquet"),
+    )
+
+
+def load_proffast2_result(
+    path: str,
+    use_cache: bool = False,
+    cache_dir: Optional[str] = None,
+) -> pl.DataFrame:
     """Loads the output of Proffast 2 into a polars DataFrame.
 
+    With `use_cache=True`, the parsed DataFrame is written to a Parquet
+    file the first time an output file is loaded, and later loads read
+    this Parquet file instead of parsing the CSV file again. The cache
+    file is invalidated when the size or the modification time of the
+    output file changes. Stale cache files are replaced. If the cache
+    file cannot be written (e.g. in a read-only directory), the DataFrame
+    is returned anyway.
+
     Args:
-        path: The path to the Proffast 2 output file.
+        path:      The path to the Proffast 2 output file.
+        use_cache: Whether to use the Parquet cache.
+        cache_dir: The directory to store the cache files in. By default,
+                   the cache file is stored as a hidden file next to the
+                   output file (`.<filename>.v<version>-<size>-<mtime>.parquet`).
 
     Returns:
         A polars DataFrame containing all columns.
     """
 
-    # fmt: off
-    column_names = [
-        "JulianDate", "UTtimeh", "gndP", "gndT", "latdeg", "londeg", "altim",
-        "appSZA", "azimuth", "XH2O", "XAIR", "XCO2", "XCH4", "XCO2_STR", "XCO",
-        "XCH4_S5P", "H2O", "O2", "CO2", "CH4", "CO", "CH4_S5P"
-    ]
-    # fmt: on
-    df = pl.read_csv(
-        path,
-        has_header=True,
-        separator=",",
-        schema_overrides={
-            "UTC": pl.Datetime,
-            " LocalTime": pl.Utf8,
-            " spectrum": pl.Utf8,
-            **{f" {cn}": pl.Float32 for cn in column_names},
-        },
-    ).drop(" JulianDate", " UTtimeh")
-    return df.rename(
-        {
-            " LocalTime": "LocalTime",
-            " spectrum": "spectrum",
-            **{f" {cn}": cn for cn in column_names if f" {cn}" in df.columns},
-        }
-    ).with_columns(
-        pl.col("LocalTime").str.strptime(dtype=pl.Datetime, format=" %Y-%m-%d %H:%M:%S"),
+    if not use_cache:
+        return _scan_proffast2_result(path).collect()
+
+    cache_path, cache_pattern = _get_proffast2_cache_path(path, cache_dir)
+    if os.path.isfile(cache_path):
+        return pl.read_parquet(cache_path, memory_map=True)
+
+    df = _scan_proffast2_result(path).collect()
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(cache_path), suffix=".tmp", delete=False
+        ) as f:
+            tmp_path = f.name
+        try:
+            df.write_parquet(tmp_path)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        for stale_cache_path in glob.glob(cache_pattern):
+            if stale_cache_path != cache_path:
+                os.remove(stale_cache_path)
+    except OSError:
+        pass
+    return df
+
+
+def scan_proffast2_results(
+    glob_or_paths: str | list[str],
+    columns: Optional[list[str]] = None,
+    from_datetime: Optional[datetime.datetime] = None,
+    to_datetime: Optional[datetime.datetime] = None,
+    apply_multipliers: bool = False,
+) -> pl.LazyFrame:
+    """Lazily scans many Proffast 2 output files into a single polars LazyFrame.
+
+    ```python
+    lf = tum_esm_utils.em27.scan_proffast2_results(
+        "/data/results/*/comb_invparms_*.csv",
+        columns=["XCO2", "XCH4"],
+        from_datetime=datetime.datetime(2024, 1, 1),
+        apply_multipliers=True,
+    )
+    df = lf.filter(pl.col("sensor_id") == "ma").collect()
+    ```
+
+    Nothing is read until the LazyFrame is collected. Polars then reads the
+    files in parallel and only parses the selected columns and the rows
+    that pass the filters - including filters added to the LazyFrame later.
+    Files whose date range (from the filename) lies outside of the time
+    filter are skipped entirely.
+
+    Besides the columns of `load_proffast2_result`, the LazyFrame contains
+    the columns `sensor_id` and `serial_number` derived from filenames like
+    `comb_invparms_ma_SN061_210329-210329.csv`. The serial number is taken
+    from `SERIAL_NUMBERS` if the sensor is known. Gases that are missing in
+    some files (e.g. `XCO2_STR`) are null in the rows of these files.
+
+    Args:
+        glob_or_paths:     A glob pattern or a list of paths to the files.
+        columns:           The columns to select besides `UTC`, `sensor_id` and
+                           `serial_number`. Selects all columns if `None`.
+        from_datetime:     Only include rows with `UTC >= from_datetime`.
+                           Naive datetimes are interpreted as UTC.
+        to_datetime:       Only include rows with `UTC <= to_datetime`.
+                           Naive datetimes are interpreted as UTC.
+        apply_multipliers: Whether to multiply the columns with the factors in
+                           `PROFFAST_MULTIPLIERS` (see `PROFFAST_UNITS`).
+
+    Returns:
+        A polars LazyFrame over all files.
+    """
+
+    if isinstance(glob_or_paths, str):
+        paths = sorted(glob.glob(glob_or_paths))
+    else:
+        paths = glob_or_paths
+
+    # the UTC column and the dates in the filenames are naive UTC
+    if (from_datetime is not None) and (from_datetime.tzinfo is not None):
+        from_datetime = from_datetime.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if (to_datetime is not None) and (to_datetime.tzinfo is not None):
+        to_datetime = to_datetime.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    lazy_frames: list[pl.LazyFrame] = []
+    for path in paths:
+        match = _PROFFAST2_FILENAME_PATTERN.search(os.path.basename(path))
+        sensor_id: Optional[str] = None
+        serial_number: Optional[int] = None
+        if match is not None:
+            sensor_id = str(match.group("sensor_id"))
+            serial_number = SERIAL_NUMBERS.get(sensor_id, int(match.group("serial_number")))
+            from_date = datetime.datetime.strptime(match.group("from_date"), "%y%m%d")
+            to_date = datetime.datetime.strptime(match.group("to_date"), "%y%m%d")
+            if (from_datetime is not None) and (
+                to_date + datetime.timedelta(days=1) <= from_datetime
+            ):
+                continue
+            if (to_datetime is not None) and (from_date > to_datetime):
+                continue
+        lazy_frames.append(
+            _scan_proffast2_result(path).with_columns(
+                pl.lit(sensor_id, dtype=pl.Utf8).alias("sensor_id"),
+                pl.lit(serial_number, dtype=pl.Int32).alias("serial_number"),
+            )
+        )
+
+    if len(lazy_frames) == 0:
+        raise FileNotFoundError(f"No Proffast 2 output files found for {glob_or_paths}")
+    lf = pl.concat(lazy_frames, how="diagonal_relaxed")
+
+    if from_datetime is not None:
+        lf = lf.filter(pl.col("UTC") >= from_datetime)
+    if to_datetime is not None:
+        lf = lf.filter(pl.col("UTC") <= to_datetime)
+    if columns is not None:
+        lf = lf.select("UTC", "sensor_id", "serial_number", *[c for c in columns if c != "UTC"])
+    if apply_multipliers:
+        column_names = lf.collect_schema().names()
+        lf = lf.with_columns(
+            [pl.col(c) * m for c, m in PROFFAST_MULTIPLIERS.items() if c in column_names]
+        )
+    return lf
+
+
+def aggregate_proffast2_results(
+    glob_or_paths: str | list[str],
+    gases: list[str] = ["XCO2", "XCH4", "XCO"],
+    every: str | datetime.timedelta = "10m",
+    from_datetime: Optional[datetime.datetime] = None,
+    to_datetime: Optional[datetime.datetime] = None,
+) -> pl.DataFrame:
+    """Computes time-binned statistics of Proffast 2 outputs of many sensors.
+
+    ```python
+    df = tum_esm_utils.em27.aggregate_proffast2_results(
+        "/data/results/*/comb_invparms_*_240101-240101.csv", every="30m"
+    )
+    df.filter(pl.col("gas") == "XCH4").pivot("sensor_id", index="UTC", values="mean")
+    ```
+
+    The files are scanned with `scan_proffast2_results`, the gases are
+    brought to the units in `PROFFAST_UNITS` using `PROFFAST_MULTIPLIERS`,
+    and the mean, standard deviation and number of measurements are
+    computed per sensor, gas and time bin with Polars' `group_by_dynamic`.
+    Everything runs in a single lazy query, so Polars reads the files and
+    aggregates the groups in parallel.
+
+    Args:
+        glob_or_paths: A glob pattern or a list of paths to the files.
+        gases:         The columns to aggregate.
+        every:         The length of the time bins, e.g. `"10m"` or
+                       `datetime.timedelta(hours=1)`.
+        from_datetime: Only include measurements with `UTC >= from_datetime`.
+                       Naive datetimes are interpreted as UTC.
+        to_datetime:   Only include measurements with `UTC <= to_datetime`.
+                       Naive datetimes are interpreted as UTC.
+
+    Returns:
+        A polars DataFrame with the columns `sensor_id`, `gas`, `unit`,
+        `UTC` (start of the time bin), `mean`, `std` and `count`, sorted
+        by sensor, gas and time. Time bins without measurements are omitted.
+    """
+
+    return (
+        scan_proffast2_results(
+            glob_or_paths,
+            columns=gases,
+            from_datetime=from_datetime,
+            to_datetime=to_datetime,
+            apply_multipliers=True,
+        )
+        .unpivot(index=["UTC", "sensor_id"], on=gases, variable_name="gas", value_name="value")
+        # gases that are missing in some files are null in their rows
+        .drop_nulls("value")
+        .with_columns(pl.col("value").cast(pl.Float64))
+        .sort("sensor_id", "gas", "UTC")
+        .group_by_dynamic(
+            "UTC", every=every, group_by=["sensor_id", "gas"], closed="left", label="left"
+        )
+        .agg(
+            pl.col("value").mean().alias("mean"),
+            pl.col("value").std().alias("std"),
+            pl.col("value").count().alias("count"),
+        )
+        .with_columns(
+            pl.col("gas")
+            .replace_strict(PROFFAST_UNITS, default=None, return_dtype=pl.Utf8)
+            .alias("unit")
+        )
+        .select("sensor_id", "gas", "unit", "UTC", "mean", "std", "count")
+        .sort("sensor_id", "gas", "UTC")
+        .collect()
     )
 
 
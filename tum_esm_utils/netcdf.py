@@ -1,6 +1,8 @@
 """A thin wrapper over the netCDF4 library to make working with NetCDF files easier.
 
-Implements: `NetCDFFile`, `remove_elements_from_netcdf_file`, `compress_netcdf_file`.
+Implements: `NetCDFFile`, `NetCDFStreamWriter`, `NetCDFChunkCache`,
+`NetCDFMultiFileDataset`, `remove_elements_from_netcdf_file`,
+`compress_netcdf_file`, `benchmark_compression`, `recommend_compression`.
 
 This requires you to install this utils library with the optional `netcdf` dependencies:
 
@@ -10,9 +12,38 @@ pip install "tum_esm_utils[netcdf]"
 uv add "tum_esm_utils[netcdf]"
 ```"""
 
-from typing import Any, Literal, Optional
+from typing import TYPE_CHECKING, Any, Generator, Literal, Optional
+import collections
+import concurrent.futures
+import datetime
+import glob
+import itertools
+import math
+import multiprocessing
+import operator
 import os
+import tempfile
+import threading
+import time
+import numpy as np
+import numpy.typing as npt
 import netCDF4 as nc
+import pydantic
+
+if TYPE_CHECKING:
+    import polars as pl
+
+_Compression = Literal[
+    "zlib",
+    "szip",
+    "zstd",
+    "bzip2",
+    "blosc_lz",
+    "blosc_lz4",
+    "blosc_lz4hc",
+    "blosc_zlib",
+    "blosc_zstd",
+]
 
 
 class NetCDFFile:
@@ -22,12 +53,16 @@ class NetCDFFile:
         parallel: bool = False,
         diskless: bool = False,
         mode: Literal["r", "w", "r+", "a", "x", "rs", "ws", "r+s", "as"] = "r",
+        chunk_cache: Optional["NetCDFChunkCache"] = None,
     ) -> None:
         """A simple wrapper around netCDF4.Dataset to make the interaction with NetCDF files easier.
 
         If writing to a new file, it will first write to the filepath+ ".tmp" and  rename it to the final
         filepath when closing the file. This ensures that the final filepath will only exist if the file
-        was written completely. In append mode, the filepath is not changes."""
+        was written completely. In append mode, the filepath is not changes.
+
+        `chunk_cache` is the cache used by `read`. By default, each file gets its own cache
+        of 256 MB. Pass the same cache to multiple files to share its memory budget."""
 
         extension = filepath.split(".")[-1]
         self.tmp_filepath = filepath[: -(len(extension) + 1)] + f".tmp.{extension}"
@@ -48,6 +83,8 @@ class NetCDFFile:
         self.dimensions: dict[str, nc.Dimension] = {}
         self.variables: dict[str, nc.Variable[Any]] = {}
         self.attributes: dict[str, str] = {}
+        self.stream_writers: list["NetCDFStreamWriter"] = []
+        self.chunk_cache = NetCDFChunkCache() if chunk_cache is None else chunk_cache
 
         if mode != "w":
             for dim_name, dim in self.ds.dimensions.items():
@@ -57,8 +94,9 @@ class NetCDFFile:
             for attr_name in self.ds.ncattrs():
                 self.attributes[attr_name] = self.ds.getncattr(attr_name)
 
-    def create_dimension(self, name: str, size: int) -> None:
-        """Create a new dimension in the NetCDF file.
+    def create_dimension(self, name: str, size: Optional[int]) -> None:
+        """Create a new dimension in the NetCDF file. A size of `None` creates
+        an unlimited dimension.
 
         Raises:
             ValueError: If the dimension already exists
@@ -83,21 +121,10 @@ class NetCDFFile:
         description: Optional[str] = None,
         fill_value: Optional[float | int] = None,
         chunk_dimensions: list[str] = [],
+        chunk_sizes: Optional[list[int] | Literal["auto"]] = None,
         datatype: Literal["f4", "f8", "i4", "i8"] = "f4",
         zlib: bool = True,
-        compression: Optional[
-            Literal[
-                "zlib",
-                "szip",
-                "zstd",
-                "bzip2",
-                "blosc_lz",
-                "blosc_lz4",
-                "blosc_lz4hc",
-                "blosc_zlib",
-                "blosc_zstd",
-            ]
-        ] = None,
+        compression: Optional[_Compression] = None,
         compression_level: Optional[int] = 2,
     ) -> None:
         """Create a new variable in the NetCDF file.
@@ -108,6 +135,11 @@ class NetCDFFile:
         is set. To disable compression, set `zlib` to `False` and leave
         `compression` at `None`.
 
+        `chunk_dimensions` sets the chunk size of the given dimensions to 1
+        and of all other dimensions to their full size. Use `chunk_sizes` to
+        set the chunk size of each dimension explicitly instead, or set it to
+        `"auto"` to use `compute_chunk_sizes` with its default arguments.
+
         Raises:
             ValueError: If the variable already exists or if a dimension is not found.
             RuntimeError: If the NetCDF file is not opened in write mode."""
@@ -118,35 +150,7 @@ class NetCDFFile:
             zlib = False
 
         if compression_level is not None:
-            if compression == "zlib":
-                if not (0 <= compression_level <= 9):
-                    raise ValueError("Invalid compression level for zlib. Must be between 0 and 9.")
-            elif compression == "szip":
-                if not (0 <= compression_level <= 32):
-                    raise ValueError(
-                        "Invalid compression level for szip. Must be between 0 and 32."
-                    )
-            elif compression == "zstd":
-                if not (1 <= compression_level <= 22):
-                    raise ValueError(
-                        "Invalid compression level for zstd. Must be between 1 and 22."
-                    )
-            elif compression == "bzip2":
-                if not (1 <= compression_level <= 9):
-                    raise ValueError(
-                        "Invalid compression level for bzip2. Must be between 1 and 9."
-                    )
-            elif compression in [
-                "blosc_lz",
-                "blosc_lz4",
-                "blosc_lz4hc",
-                "blosc_zlib",
-                "blosc_zstd",
-            ]:
-                if not (1 <= compression_level <= 9):
-                    raise ValueError(
-                        f"Invalid compression level for {compression}. Must be between 1 and 9."
-                    )
+            _check_compression_level(compression, compression_level)
 
         if self.mode == "r":
             raise RuntimeError("Cannot create dimension in read-only mode")
@@ -165,10 +169,18 @@ class NetCDFFile:
                     raise ValueError(f"Dimension {dimension.name} not found in the NetCDF file")
                 object_dimensions.append(dimension)
 
-        chunk_sizes = [dimension.size for dimension in object_dimensions]
-        for i, dimension in enumerate(object_dimensions):
-            if dimension.name in chunk_dimensions:
-                chunk_sizes[i] = 1
+        if chunk_sizes == "auto":
+            chunk_sizes = self.compute_chunk_sizes(
+                tuple(d.name for d in object_dimensions), datatype=datatype
+            )
+        if chunk_sizes is not None:
+            if len(chunk_sizes) != len(object_dimensions):
+                raise ValueError("chunk_sizes must have one entry per dimension")
+        elif len(chunk_dimensions) > 0:
+            chunk_sizes = [dimension.size for dimension in object_dimensions]
+            for i, dimension in enumerate(object_dimensions):
+                if dimension.name in chunk_dimensions:
+                    chunk_sizes[i] = 1
 
         var: Any = self.ds.createVariable(  # pyright: ignore[reportUnknownMemberType,reportUnknownVariableType]
             name,
@@ -178,7 +190,7 @@ class NetCDFFile:
             zlib=zlib and ((len(dimensions) > 1) or (name != object_dimensions[0].name)),
             complevel=compression_level,  # type: ignore
             fill_value=fill_value,
-            chunksizes=chunk_sizes if len(chunk_dimensions) > 0 else None,
+            chunksizes=chunk_sizes,
         )
         var.units = units
         if long_name is not None:
@@ -187,6 +199,84 @@ class NetCDFFile:
             var.description = description
         self.variables[name] = var
 
+    def compute_chunk_sizes(
+        self,
+        dimensions: tuple[nc.Dimension | str, ...],
+        datatype: Literal["f4", "f8", "i4", "i8"] = "f4",
+        target_chunk_size: int = 1024 * 1024,
+        access_pattern: Literal["slice", "series"] = "slice",
+        expected_length: Optional[int] = None,
+    ) -> Optional[list[int]]:
+        """Compute chunk sizes for a variable so that each chunk holds about
+        `target_chunk_size` bytes (uncompressed).
+
+        The first dimension is treated as the record dimension (e.g. time)
+        along which the data is written and read:
+
+        * `"slice"`: Data is read one or a few records at a time (e.g. the
+          full field of one time step). The chunks span as much of the other
+          dimensions as possible and as many records as fit into the target.
+        * `"series"`: Data is read as long series at a few points (e.g. the
+          time series of one grid cell). The chunks span many records and
+          are small in the other dimensions.
+
+        Args:
+            dimensions:        The dimensions of the variable.
+            datatype:          The datatype of the variable.
+            target_chunk_size: The target size of a chunk in bytes.
+            access_pattern:    The expected access pattern.
+            expected_length:   The expected number of records. Defaults to the
+                               current size of the first dimension, unless it
+                               is unlimited.
+
+        Returns:
+            The chunk size of each dimension, or `None` for scalar variables.
+        """
+
+        if len(dimensions) == 0:
+            return None
+        sizes: list[int] = []
+        for dimension in dimensions:
+            d = self.dimensions[dimension] if isinstance(dimension, str) else dimension
+            sizes.append(0 if d.isunlimited() else d.size)
+        record_length = expected_length if expected_length is not None else sizes[0]
+        other_sizes = [max(1, s) for s in sizes[1:]]
+        target_elements = max(1, target_chunk_size // np.dtype(datatype).itemsize)
+
+        if access_pattern == "slice":
+            # shrink the leading dimensions until a single record fits
+            chunk = list(other_sizes)
+            for i in range(len(chunk)):
+                trailing_elements = math.prod(chunk[i + 1 :])
+                if trailing_elements * chunk[i] > target_elements:
+                    chunk[i] = max(1, target_elements // trailing_elements)
+            records = max(1, target_elements // math.prod(chunk))
+        else:
+            records = target_elements if record_length == 0 else min(record_length, target_elements)
+            remaining_elements = max(1, target_elements // records)
+            chunk = [1] * len(other_sizes)
+            if len(chunk) > 0:
+                edge = max(1, int(remaining_elements ** (1 / len(chunk))))
+                chunk = [min(s, edge) for s in other_sizes]
+
+        if record_length > 0:
+            records = min(records, record_length)
+        return [records, *chunk]
+
+    def create_stream_writer(
+        self,
+        variable_names: list[str],
+        flush_size: Optional[int] = None,
+    ) -> "NetCDFStreamWriter":
+        """Create a `NetCDFStreamWriter` to append records to the given
+        variables. Its remaining records are written when closing the file."""
+
+        if self.mode == "r":
+            raise RuntimeError("Cannot write to a NetCDF file in read-only mode")
+        writer = NetCDFStreamWriter([self.variables[n] for n in variable_names], flush_size)
+        self.stream_writers.append(writer)
+        return writer
+
     def import_dimension(
         self,
         dimension: nc.Dimension,
@@ -211,8 +301,18 @@ class NetCDFFile:
         new_name: Optional[str] = None,
         zlib: bool = True,
         compression_level: int = 2,
+        memory_budget: int = 64 * 1024 * 1024,
+        copy_data: bool = True,
+        compression: Optional[_Compression] = None,
     ) -> None:
-        """Import a variable from another NetCDF file.
+        """Import a variable from another NetCDF file. See `create_variable`
+        for `zlib`, `compression` and `compression_level`.
+
+        The variable gets the same chunk sizes as the source variable (at most
+        the size of each dimension in this file), and
+        its data is copied in blocks of whole chunks, so at most about
+        `memory_budget` bytes of it are held in memory at once. With
+        `copy_data=False`, only the empty variable is created.
 
         Raises:
             ValueError: If the variable already exists.
@@ -224,6 +324,17 @@ class NetCDFFile:
         if variable.name in self.variables:
             raise ValueError(f"Variable {variable.name} already exists in the NetCDF file")
         name = variable.name if new_name is None else new_name
+        chunking = variable.chunking()
+        chunk_sizes: Optional[list[int]] = None
+        if chunking != "contiguous":
+            # imported unlimited dimensions are fixed and can be shorter than the source chunks
+            chunk_sizes = []
+            for c, dimension_name in zip(chunking, variable.dimensions):
+                d = self.dimensions.get(dimension_name)
+                if d is None or d.isunlimited():
+                    chunk_sizes.append(int(c))
+                else:
+                    chunk_sizes.append(max(1, min(int(c), d.size)))
         self.create_variable(
             name=name,
             dimensions=variable.dimensions,
@@ -231,10 +342,14 @@ class NetCDFFile:
             long_name=variable.long_name if hasattr(variable, "long_name") else None,  # pyright: ignore[reportUnknownArgumentType]
             description=variable.description if hasattr(variable, "description") else None,  # pyright: ignore[reportUnknownArgumentType]
             fill_value=float(variable.get_fill_value()),
+            chunk_sizes=chunk_sizes,
             zlib=zlib,
+            compression=compression,
             compression_level=compression_level,
         )
-        self.variables[name][:] = variable[:]
+        if copy_data:
+            for block in _iterate_blocks(variable, memory_budget):
+                self.variables[name][block] = variable[block]
 
     def add_attribute(self, key: str, value: str, allow_overwrite: bool = False) -> None:
         """Add a global attribute to the NetCDF file.
@@ -254,6 +369,8 @@ class NetCDFFile:
     def close(self) -> None:
         """Close the NetCDF file, possibly renaming the temporary file to the final filepath."""
 
+        for writer in self.stream_writers:
+            writer.flush()
         self.ds.close()
         if self.mode == "w":
             if os.path.isfile(self.filepath):
@@ -271,11 +388,778 @@ class NetCDFFile:
 
         del self
 
+    def read(self, name: str, key: Any = ...) -> "np.ma.MaskedArray[Any, Any]":
+        """Read a hyperslab of a variable through the chunk cache.
+
+        ```python
+        ncfile = NetCDFFile("model_output.nc", mode="r")
+        window = ncfile.read("temperature", np.s_[100:200, :, 5])
+        window = ncfile.read("temperature", np.s_[150:250, :, 5])  # 100:200 is cached
+        print(ncfile.chunk_cache.hits, ncfile.chunk_cache.misses)
+        ```
+
+        Works like `variable[key]` (integers, slices with any step and `...`),
+        but reads and decompresses whole chunks and keeps them in
+        `chunk_cache`. Repeated or overlapping reads are served from memory.
+        Contiguous variables are cached per record along their first
+        dimension. In other modes than `"r"`, the data is read directly
+        because it could change.
+
+        Returns:
+            A masked array, like `variable[key]`.
+        """
+
+        variable = self.variables[name]
+        if self.mode != "r" or len(variable.shape) == 0:
+            return np.ma.asarray(variable[key])
+        shape = [int(s) for s in variable.shape]
+        positions = _normalize_key(key, shape)
+        if any(len(p) == 0 for p in positions if isinstance(p, range)):
+            return np.ma.asarray(variable[key])
+
+        chunk_shape = _get_chunk_shape(variable)
+        groups = [_group_by_chunk(p, c) for p, c in zip(positions, chunk_shape)]
+
+        data: Any = None
+        mask: Any = None
+        for group in itertools.product(*groups):
+            chunk_index = tuple(g[0] for g in group)
+            cache_key = (self.filepath, name, chunk_index)
+            chunk = self.chunk_cache.get(cache_key)
+            if chunk is None:
+                chunk = np.ma.asarray(
+                    variable[
+                        tuple(
+                            slice(i * c, min((i + 1) * c, s))
+                            for i, c, s in zip(chunk_index, chunk_shape, shape)
+                        )
+                    ]
+                )
+                self.chunk_cache.put(cache_key, chunk)
+            if data is None:
+                data = np.empty(
+                    [1 if isinstance(p, int) else len(p) for p in positions], chunk.dtype
+                )
+                mask = np.zeros(data.shape, dtype=bool)
+            target = tuple(g[1] for g in group)
+            source = tuple(g[2] for g in group)
+            data[target] = np.ma.getdata(chunk)[source]
+            mask[target] = np.ma.getmaskarray(chunk)[source]
+
+        # drop the dimensions indexed with an integer
+        drop = tuple(0 if isinstance(p, int) else slice(None) for p in positions)
+        return np.ma.MaskedArray(data[drop], mask=mask[drop])
+
     def __getitem__(self, key: str) -> "nc.Variable[Any]":
         """Get a variable from the NetCDF file."""
         return self.variables[key]
 
 
+def _check_compression_level(compression: Optional[_Compression], compression_level: int) -> None:
+    """Check whether a compression codec supports the given level.
+
+    Raises:
+        ValueError: If the level is not supported."""
+
+    if compression == "zlib":
+        if not (0 <= compression_level <= 9):
+            raise ValueError("Invalid compression level for zlib. Must be between 0 and 9.")
+    elif compression == "szip":
+        if not (0 <= compression_level <= 32):
+            raise ValueError("Invalid compression level for szip. Must be between 0 and 32.")
+    elif compression == "zstd":
+        if not (1 <= compression_level <= 22):
+            raise ValueError("Invalid compression level for zstd. Must be between 1 and 22.")
+    elif compression == "bzip2":
+        if not (1 <= compression_level <= 9):
+            raise ValueError("Invalid compression level for bzip2. Must be between 1 and 9.")
+    elif compression in [
+        "blosc_lz",
+        "blosc_lz4",
+        "blosc_lz4hc",
+        "blosc_zlib",
+        "blosc_zstd",
+    ]:
+        if not (1 <= compression_level <= 9):
+            raise ValueError(
+                f"Invalid compression level for {compression}. Must be between 1 and 9."
+            )
+
+
+class NetCDFStreamWriter:
+    def __init__(
+        self,
+        variables: list["nc.Variable[Any]"],
+        flush_size: Optional[int] = None,
+    ) -> None:
+        """Appends records to variables along a shared unlimited dimension.
+
+        Usually created with `NetCDFFile.create_stream_writer`. Records are
+        buffered in memory and written in blocks that end on chunk
+        boundaries of the unlimited dimension, so that every chunk is
+        compressed once instead of being rewritten with every record. Each
+        variable is buffered and written separately, so until the writer is
+        flushed, variables with smaller chunks may be ahead of the others.
+
+        ```python
+        ncfile.create_dimension("time", None)
+        ncfile.create_dimension("lat", 180)
+        ncfile.create_variable("time", ("time",), units="s", datatype="f8", chunk_sizes="auto")
+        ncfile.create_variable("t2m", ("time", "lat"), units="K", chunk_sizes="auto")
+        writer = ncfile.create_stream_writer(["time", "t2m"])
+        for timestamp, field in measurements:
+            writer.append({"time": timestamp, "t2m": field})
+        ncfile.close()  # writes the remaining records
+        ```
+
+        Args:
+            variables:  The variables to write to. All of them must have the
+                        same unlimited dimension as their first dimension.
+            flush_size: The number of records after which the buffer of a
+                        variable is written. Defaults to the chunk size of
+                        each variable along the unlimited dimension.
+
+        Raises:
+            ValueError: If the variables do not share an unlimited first dimension.
+        """
+
+        if len(variables) == 0:
+            raise ValueError("At least one variable is required")
+        dimension_names = set(v.dimensions[0] if len(v.dimensions) > 0 else "" for v in variables)
+        if len(dimension_names) != 1:
+            raise ValueError("All variables must have the same first dimension")
+        dimension = variables[0].get_dims()[0]
+        if not dimension.isunlimited():
+            raise ValueError(f"Dimension {dimension.name} is not unlimited")
+
+        if flush_size is not None and flush_size < 1:
+            raise ValueError("flush_size must be at least 1")
+
+        self.variables = variables
+        self.flush_sizes: dict[str, int] = {}
+        for v in variables:
+            chunking = v.chunking()
+            if flush_size is not None:
+                self.flush_sizes[v.name] = flush_size
+            else:
+                self.flush_sizes[v.name] = 1 if chunking == "contiguous" else int(chunking[0])
+        self.lengths: dict[str, int] = {v.name: len(dimension) for v in variables}
+        self._buffers: dict[str, list[Any]] = {v.name: [] for v in variables}
+        self._buffered_records: dict[str, int] = {v.name: 0 for v in variables}
+
+    @property
+    def buffered_records(self) -> int:
+        """The number of records that have not been written to all variables yet."""
+        return max(self._buffered_records.values())
+
+    def append(self, values: dict[str, Any]) -> None:
+        """Append a single record. `values` maps each variable name to an
+        array with the shape of the variable without its first dimension."""
+
+        self.extend({k: np.ma.asarray(v)[np.newaxis] for k, v in values.items()})
+
+    def extend(self, values: dict[str, Any]) -> None:
+        """Append many records. `values` maps each variable name to an
+        array whose first axis are the records.
+
+        Raises:
+            ValueError: If a variable is missing or the shapes do not match."""
+
+        if set(values.keys()) != set(self._buffers.keys()):
+            raise ValueError(f"Values must be given for exactly {list(self._buffers.keys())}")
+        arrays = {k: np.ma.asarray(v) for k, v in values.items()}
+        if any(a.ndim == 0 for a in arrays.values()):
+            raise ValueError("Values must be arrays of records, use `append` for single records")
+        records = set(a.shape[0] for a in arrays.values())
+        if len(records) != 1:
+            raise ValueError("All values must have the same number of records")
+        for variable in self.variables:
+            if arrays[variable.name].shape[1:] != variable.shape[1:]:
+                raise ValueError(
+                    f"Values of {variable.name} must have the shape "
+                    + f"(n, {', '.join(str(s) for s in variable.shape[1:])})"
+                )
+
+        record_count = records.pop()
+        for name, array in arrays.items():
+            self._buffers[name].append(array)
+            self._buffered_records[name] += record_count
+        self._write(final=False)
+
+    def flush(self) -> None:
+        """Write all buffered records, even if they do not fill a chunk."""
+        self._write(final=True)
+
+    def _write(self, final: bool) -> None:
+        for variable in self.variables:
+            name, flush_size = variable.name, self.flush_sizes[variable.name]
+            while self._buffered_records[name] > 0:
+                length = self.lengths[name]
+                records = flush_size - (length % flush_size)
+                if records > self._buffered_records[name]:
+                    if not final:
+                        break
+                    records = self._buffered_records[name]
+                data = np.ma.MaskedArray(
+                    np.concatenate([np.ma.getdata(a) for a in self._buffers[name]]),
+                    mask=np.concatenate([np.ma.getmaskarray(a) for a in self._buffers[name]]),
+                )
+                variable[length : length + records] = data[:records]
+                self._buffers[name] = [data[records:]]
+                self.lengths[name] += records
+                self._buffered_records[name] -= records
+
+
+class NetCDFChunkCache:
+    def __init__(self, max_size: int = 256 * 1024 * 1024) -> None:
+        """A thread-safe LRU cache of decompressed chunks, used by `NetCDFFile.read`.
+
+        When adding a chunk would exceed `max_size` bytes, the least recently
+        used chunks are evicted. Chunks larger than `max_size` are not cached.
+
+        Args:
+            max_size: The memory budget of the cache in bytes.
+        """
+
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._chunks: collections.OrderedDict[Any, Any] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """The fraction of lookups that were served from the cache."""
+        lookups = self.hits + self.misses
+        return None if lookups == 0 else self.hits / lookups
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Get a chunk and mark it as recently used. Returns `None` on a miss."""
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._chunks.move_to_end(key)
+            return chunk
+
+    def put(self, key: Any, chunk: Any) -> None:
+        """Add a chunk, evicting the least recently used chunks if necessary."""
+        chunk_size = _get_nbytes(chunk)
+        with self._lock:
+            if key in self._chunks:
+                self.size -= _get_nbytes(self._chunks.pop(key))
+            if chunk_size > self.max_size:
+                return
+            while self.size + chunk_size > self.max_size:
+                self.size -= _get_nbytes(self._chunks.popitem(last=False)[1])
+            self._chunks[key] = chunk
+            self.size += chunk_size
+
+    def clear(self) -> None:
+        """Remove all chunks and reset the statistics."""
+        with self._lock:
+            self._chunks.clear()
+            self.size = self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+
+class NetCDFMultiFileDataset:
+    def __init__(
+        self,
+        glob_or_paths: str | list[str],
+        dimension: str = "time",
+        max_open_files: int = 16,
+        chunk_cache: Optional[NetCDFChunkCache] = None,
+    ) -> None:
+        """A read-only virtual view of many NetCDF files that are concatenated
+        along a shared dimension, e.g. one file per day.
+
+        ```python
+        ds = NetCDFMultiFileDataset("data/site-a/*.nc", dimension="time")
+        print(ds.shape("temperature"))
+        window = ds.read("temperature", np.s_[1000:2000, :, 5])
+        arrays = ds.select(
+            datetime.datetime(2025, 3, 1), datetime.datetime(2025, 4, 1), ["temperature"]
+        )
+        df = ds.to_polars(datetime.datetime(2025, 3, 1), datetime.datetime(2025, 4, 1))
+        ```
+
+        On construction, only the headers and the first and last value of the
+        coordinate variable (the variable named like `dimension`) of each file
+        are read. The files are ordered by their first coordinate value and
+        opened lazily when a query touches them. At most `max_open_files`
+        files are open at the same time, the least recently used one is closed
+        when another file is needed. All files share the same `chunk_cache`.
+
+        Variables that do not use `dimension` are read from the first file.
+        All files need the same variables with the same shapes apart from
+        `dimension`.
+
+        Args:
+            glob_or_paths:  A glob pattern or a list of paths to the files.
+            dimension:      The dimension along which the files are concatenated.
+            max_open_files: The maximum number of simultaneously open files.
+            chunk_cache:    The chunk cache used for all reads, see `NetCDFFile.read`.
+
+        Raises:
+            FileNotFoundError: If no files match `glob_or_paths`.
+            ValueError: If the files are not compatible."""
+
+        if max_open_files < 1:
+            raise ValueError("max_open_files must be at least 1")
+        if isinstance(glob_or_paths, str):
+            filepaths = sorted(glob.glob(glob_or_paths))
+        else:
+            filepaths = list(glob_or_paths)
+        if len(filepaths) == 0:
+            raise FileNotFoundError(f"No NetCDF files found for {glob_or_paths}")
+
+        self.dimension = dimension
+        self.max_open_files = max_open_files
+        self.chunk_cache = NetCDFChunkCache() if chunk_cache is None else chunk_cache
+        self._open_files: collections.OrderedDict[str, NetCDFFile] = collections.OrderedDict()
+
+        # filepath, length along the dimension, first and last coordinate value
+        index: list[tuple[str, int, Optional[Any], Optional[Any]]] = []
+        self._dimensions: dict[str, tuple[str, ...]] = {}
+        self._shapes: dict[str, tuple[int, ...]] = {}
+        self._coordinate_units: Optional[str] = None
+        self._coordinate_calendar: str = "standard"
+        for filepath in filepaths:
+            with nc.Dataset(filepath, mode="r") as ds:
+                if dimension not in ds.dimensions:
+                    raise ValueError(f"{filepath} has no dimension {dimension}")
+                length = len(ds.dimensions[dimension])
+                shapes = {
+                    name: (tuple(str(d) for d in v.dimensions), tuple(int(s) for s in v.shape))
+                    for name, v in ds.variables.items()
+                }
+                if len(self._shapes) == 0:
+                    self._dimensions = {name: d for name, (d, _) in shapes.items()}
+                    self._shapes = {name: s for name, (_, s) in shapes.items()}
+                    if dimension in ds.variables:
+                        coordinate = ds.variables[dimension]
+                        self._coordinate_units = getattr(coordinate, "units", None)
+                        self._coordinate_calendar = getattr(coordinate, "calendar", "standard")
+                self._check_shapes(filepath, shapes)
+                first, last = None, None
+                if dimension in ds.variables and length > 0:
+                    first = ds.variables[dimension][0].item()
+                    last = ds.variables[dimension][length - 1].item()
+                index.append((filepath, length, first, last))
+
+        if dimension in self._shapes:
+            if any(first is None for _, length, first, _ in index if length > 0):
+                raise ValueError(f"The coordinate variable {dimension} contains missing values")
+            index.sort(key=lambda f: (f[1] == 0, 0 if f[2] is None else f[2]))
+        self.filepaths = [f[0] for f in index if f[1] > 0]
+        self._lengths = [f[1] for f in index if f[1] > 0]
+        self._bounds = [(f[2], f[3]) for f in index if f[1] > 0]
+        self._offsets = [0, *itertools.accumulate(self._lengths)]
+        self._static_filepath = index[0][0]
+
+    def _check_shapes(
+        self, filepath: str, shapes: dict[str, tuple[tuple[str, ...], tuple[int, ...]]]
+    ) -> None:
+        """Check that the variables of a file match the ones of the first file."""
+
+        if shapes.keys() != self._shapes.keys():
+            raise ValueError(f"{filepath} has different variables than the other files")
+        for name, (dimensions, shape) in shapes.items():
+            if dimensions != self._dimensions[name] or any(
+                a != b
+                for d, a, b in zip(dimensions, shape, self._shapes[name])
+                if d != self.dimension
+            ):
+                raise ValueError(f"Variable {name} in {filepath} has a different shape")
+
+    @property
+    def variable_names(self) -> list[str]:
+        """The names of all variables."""
+        return list(self._shapes.keys())
+
+    def __len__(self) -> int:
+        """The total length along the shared dimension."""
+        return self._offsets[-1]
+
+    def shape(self, name: str) -> tuple[int, ...]:
+        """The shape of a variable in the virtual dataset."""
+        return tuple(
+            len(self) if d == self.dimension else s
+            for d, s in zip(self._dimensions[name], self._shapes[name])
+        )
+
+    def _open(self, filepath: str) -> NetCDFFile:
+        """Get a file from the pool of open files, opening it if necessary."""
+
+        if filepath in self._open_files:
+            self._open_files.move_to_end(filepath)
+            return self._open_files[filepath]
+        while len(self._open_files) >= self.max_open_files:
+            self._open_files.popitem(last=False)[1].close()
+        ncfile = NetCDFFile(filepath, mode="r", chunk_cache=self.chunk_cache)
+        self._open_files[filepath] = ncfile
+        return ncfile
+
+    @property
+    def open_files(self) -> list[str]:
+        """The paths of the currently open files, least recently used first."""
+        return list(self._open_files.keys())
+
+    def close(self) -> None:
+        """Close all open files."""
+        while len(self._open_files) > 0:
+            self._open_files.popitem()[1].close()
+
+    def __enter__(self) -> "NetCDFMultiFileDataset":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def read(self, name: str, key: Any = ...) -> "np.ma.MaskedArray[Any, Any]":
+        """Read a hyperslab of a variable, indexed like a single concatenated
+        variable (integers, slices with any step and `...`). Only the files
+        that contain the selected positions along the shared dimension are
+        opened and read.
+
+        Returns:
+            A masked array, like `variable[key]`."""
+
+        if name not in self._shapes:
+            raise KeyError(f"Variable {name} does not exist")
+        if self.dimension not in self._dimensions[name]:
+            return self._open(self._static_filepath).read(name, key)
+
+        positions = _normalize_key(key, list(self.shape(name)))
+        axis = self._dimensions[name].index(self.dimension)
+        position = positions[axis]
+        global_indices = np.atleast_1d(np.array(position))
+        file_indices = np.searchsorted(self._offsets, global_indices, side="right") - 1
+
+        parts: list["np.ma.MaskedArray[Any, Any]"] = []
+        boundaries = np.flatnonzero(np.diff(file_indices)) + 1
+        for group in np.split(np.arange(len(global_indices)), boundaries):
+            if len(group) == 0:
+                continue
+            file_index = int(file_indices[group[0]])
+            first = int(global_indices[group[0]]) - self._offsets[file_index]
+            local_key: list[int | slice] = [
+                p if isinstance(p, int) else slice(p.start, None if p.stop < 0 else p.stop, p.step)
+                for p in positions
+            ]
+            if isinstance(position, int):
+                local_key[axis] = first
+            else:
+                last = int(global_indices[group[-1]]) - self._offsets[file_index]
+                stop = last + (1 if position.step > 0 else -1)
+                local_key[axis] = slice(first, None if stop < 0 else stop, position.step)
+            ncfile = self._open(self.filepaths[file_index])
+            parts.append(ncfile.read(name, tuple(local_key)))
+
+        if len(parts) == 0:
+            shape = [len(p) for p in positions if isinstance(p, range)]
+            return np.ma.MaskedArray(np.empty(shape, dtype=self._get_dtype(name)))
+        if len(parts) == 1:
+            return parts[0]
+        output_axis = sum(isinstance(p, range) for p in positions[:axis])
+        return np.ma.MaskedArray(
+            np.concatenate([np.ma.getdata(p) for p in parts], axis=output_axis),
+            mask=np.concatenate([np.ma.getmaskarray(p) for p in parts], axis=output_axis),
+        )
+
+    def _get_dtype(self, name: str) -> Any:
+        return self._open(self._static_filepath).variables[name].dtype
+
+    def _to_coordinate_value(self, value: Any) -> Any:
+        """Convert a datetime to the units and calendar of the coordinate variable."""
+
+        if not isinstance(value, datetime.datetime):
+            return value
+        if self._coordinate_units is None:
+            raise ValueError(f"The coordinate variable {self.dimension} has no units")
+        converted: Any = nc.date2num(  # pyright: ignore[reportUnknownMemberType]
+            value, units=self._coordinate_units, calendar=self._coordinate_calendar
+        )
+        return converted
+
+    def get_range(
+        self,
+        start: Optional[float | datetime.datetime] = None,
+        end: Optional[float | datetime.datetime] = None,
+    ) -> slice:
+        """The positions along the shared dimension whose coordinate values
+        are in `[start, end)`. Datetimes are converted using the `units` and
+        `calendar` attributes of the coordinate variable. Only the coordinate
+        values of the files at the boundaries of the range are read.
+
+        Raises:
+            ValueError: If there is no coordinate variable."""
+
+        if self.dimension not in self._shapes:
+            raise ValueError(f"There is no coordinate variable {self.dimension}")
+        lower, upper = self._to_coordinate_value(start), self._to_coordinate_value(end)
+
+        def locate(value: Any) -> int:
+            for i, (first, last) in enumerate(self._bounds):
+                if value <= first:
+                    return self._offsets[i]
+                if value <= last:
+                    coordinate: npt.NDArray[Any] = np.ma.getdata(
+                        self._open(self.filepaths[i]).read(self.dimension)
+                    )
+                    return self._offsets[i] + int(np.searchsorted(coordinate, float(value)))
+            return len(self)
+
+        start_index = 0 if lower is None else locate(lower)
+        end_index = len(self) if upper is None else locate(upper)
+        return slice(start_index, max(start_index, end_index))
+
+    def select(
+        self,
+        start: Optional[float | datetime.datetime] = None,
+        end: Optional[float | datetime.datetime] = None,
+        variable_names: Optional[list[str]] = None,
+    ) -> dict[str, "np.ma.MaskedArray[Any, Any]"]:
+        """Read all variables along the shared dimension whose coordinate
+        values are in `[start, end)`. See `get_range`.
+
+        Args:
+            start:          The start of the range (inclusive), `None` for no limit.
+            end:            The end of the range (exclusive), `None` for no limit.
+            variable_names: The variables to read. Defaults to all variables
+                            that use the shared dimension.
+
+        Returns:
+            A dictionary of masked arrays, one per variable."""
+
+        if variable_names is None:
+            variable_names = [n for n, d in self._dimensions.items() if self.dimension in d]
+        selection = self.get_range(start, end)
+        arrays: dict[str, "np.ma.MaskedArray[Any, Any]"] = {}
+        for name in variable_names:
+            if name not in self._shapes:
+                raise KeyError(f"Variable {name} does not exist")
+            if self.dimension not in self._dimensions[name]:
+                raise ValueError(f"Variable {name} does not use the dimension {self.dimension}")
+            key = tuple(
+                selection if d == self.dimension else slice(None) for d in self._dimensions[name]
+            )
+            arrays[name] = self.read(name, key)
+        return arrays
+
+    def to_polars(
+        self,
+        start: Optional[float | datetime.datetime] = None,
+        end: Optional[float | datetime.datetime] = None,
+        variable_names: Optional[list[str]] = None,
+    ) -> "pl.DataFrame":
+        """Like `select`, but returns a Polars DataFrame with one column per
+        variable. Masked values become nulls. Defaults to all variables that
+        only use the shared dimension.
+
+        This requires the `polars` library, which is installed with the
+        optional `em27` dependency.
+
+        Raises:
+            ValueError: If a variable has other dimensions than the shared one."""
+
+        import polars as pl
+
+        if variable_names is None:
+            variable_names = [n for n, d in self._dimensions.items() if d == (self.dimension,)]
+        for name in variable_names:
+            if self._dimensions.get(name, (self.dimension,)) != (self.dimension,):
+                raise ValueError(
+                    f"Variable {name} cannot be converted to a column because it "
+                    + f"has other dimensions than {self.dimension}"
+                )
+
+        columns: list[pl.Series] = []
+        for name, array in self.select(start, end, variable_names).items():
+            column = pl.Series(name, np.ma.getdata(array))
+            mask = np.ma.getmaskarray(array)
+            if mask.any():
+                column = column.scatter(np.flatnonzero(mask), None)
+            columns.append(column)
+        return pl.DataFrame(columns)
+
+
+def _get_nbytes(chunk: Any) -> int:
+    """The memory used by a (masked) array, including its mask."""
+    nbytes = int(np.ma.getdata(chunk).nbytes)
+    mask: npt.NDArray[np.bool_] = np.ma.getmaskarray(chunk)
+    return nbytes + (int(mask.nbytes) if np.ma.is_masked(chunk) else 0)
+
+
+def _get_chunk_shape(variable: "nc.Variable[Any]") -> list[int]:
+    """The chunk shape of a variable. Contiguous variables are treated as if
+    they were chunked along their first dimension."""
+
+    shape = [int(s) for s in variable.shape]
+    chunking = variable.chunking()
+    if chunking == "contiguous":
+        return [1, *shape[1:]]
+    return [max(1, min(int(c), s)) for c, s in zip(chunking, shape)]
+
+
+def _group_by_chunk(position: int | range, chunk_size: int) -> list[tuple[int, slice, slice]]:
+    """Split the selected positions along one dimension by chunk. Returns
+    the chunk index, the positions in the output and the positions in the
+    chunk for each chunk that contains at least one selected position."""
+
+    if isinstance(position, int):
+        offset = position % chunk_size
+        return [(position // chunk_size, slice(0, 1), slice(offset, offset + 1))]
+
+    groups: list[tuple[int, slice, slice]] = []
+    step, i = position.step, 0
+    while i < len(position):
+        chunk_index = position[i] // chunk_size
+        offset = position[i] - chunk_index * chunk_size
+        if step > 0:
+            count = min(len(position) - i, (chunk_size - offset - 1) // step + 1)
+        else:
+            count = min(len(position) - i, offset // -step + 1)
+        stop = offset + (count - 1) * step + (1 if step > 0 else -1)
+        groups.append(
+            (chunk_index, slice(i, i + count), slice(offset, None if stop < 0 else stop, step))
+        )
+        i += count
+    return groups
+
+
+def _normalize_key(key: Any, shape: list[int]) -> list[int | range]:
+    """Turn an index (integers, slices and `...`) into the selected
+    positions along each dimension.
+
+    Raises:
+        IndexError: If the index is invalid."""
+
+    items: list[Any] = list(key) if isinstance(key, tuple) else [key]  # pyright: ignore[reportUnknownArgumentType]
+    ellipses = [i for i, k in enumerate(items) if k is Ellipsis]
+    if len(ellipses) > 1:
+        raise IndexError("An index can only have a single ellipsis")
+    if len(ellipses) == 1:
+        i = ellipses[0]
+        items[i : i + 1] = [slice(None)] * (len(shape) - len(items) + 1)
+    if len(items) > len(shape):
+        raise IndexError(f"Too many indices for a variable with {len(shape)} dimensions")
+    items += [slice(None)] * (len(shape) - len(items))
+
+    positions: list[int | range] = []
+    for k, size in zip(items, shape):
+        if isinstance(k, slice):
+            indices: tuple[int, int, int] = k.indices(size)
+            positions.append(range(*indices))
+        else:
+            try:
+                index = operator.index(k)
+            except TypeError:
+                raise IndexError(
+                    f"Unsupported index {k}, only integers, slices and ... are supported"
+                )
+            index += size if index < 0 else 0
+            if not (0 <= index < size):
+                raise IndexError(f"Index {k} is out of bounds for a dimension of size {size}")
+            positions.append(index)
+    return positions
+
+
+def _iterate_blocks(
+    variable: "nc.Variable[Any]",
+    block_size: int,
+) -> Generator[tuple[slice, ...], None, None]:
+    """Split a variable into blocks of whole chunks of at most `block_size`
+    bytes (but at least one chunk) in C order.
+
+    Blocks grow along the last dimension first, so that each block covers
+    a contiguous range of chunks. Contiguous variables are treated as if
+    they were chunked along their first dimension."""
+
+    shape = [int(s) for s in variable.shape]
+    if len(shape) == 0:
+        yield ()
+        return
+    if any(s == 0 for s in shape):
+        return
+
+    chunk_shape = _get_chunk_shape(variable)
+    block_shape = list(chunk_shape)
+    max_elements = max(1, block_size // variable.dtype.itemsize)
+    for i in reversed(range(len(shape))):
+        other_elements = math.prod(block_shape) // block_shape[i]
+        chunks_per_block = max(1, max_elements // (other_elements * chunk_shape[i]))
+        block_shape[i] = min(shape[i], chunks_per_block * chunk_shape[i])
+        if block_shape[i] < shape[i]:
+            break
+
+    for start in itertools.product(*[range(0, s, b) for s, b in zip(shape, block_shape)]):
+        yield tuple(slice(a, min(a + b, s)) for a, b, s in zip(start, block_shape, shape))
+
+
+_worker_dataset: Optional[nc.Dataset] = None
+
+
+def _open_dataset_in_worker(filepath: str) -> None:
+    global _worker_dataset
+    _worker_dataset = nc.Dataset(filepath, mode="r")
+
+
+def _read_block_in_worker(variable_name: str, block: tuple[slice, ...]) -> Any:
+    assert _worker_dataset is not None
+    return _worker_dataset.variables[variable_name][block]
+
+
+def _copy_variables_in_parallel(
+    source_filepath: str,
+    source_variables: list["nc.Variable[Any]"],
+    destination_variables: list["nc.Variable[Any]"],
+    max_workers: int,
+    memory_budget: int,
+) -> None:
+    """Copy the data of many variables. Worker processes read and decompress
+    the blocks while this process writes and compresses the previous ones.
+    At most `2 * max_workers` blocks are in flight at once.
+
+    The compression runs on a single core: netCDF4 compresses the chunks
+    inside HDF5 when they are written, and only one process can write to
+    the destination file."""
+
+    max_in_flight = 2 * max_workers
+    blocks = (
+        (source.name, destination, block)
+        for source, destination in zip(source_variables, destination_variables)
+        for block in _iterate_blocks(source, memory_budget // max_in_flight)
+    )
+
+    # HDF5 is not fork-safe, so the workers are started from scratch
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_open_dataset_in_worker,
+        initargs=(source_filepath,),
+    ) as executor:
+        in_flight: collections.deque[
+            tuple["nc.Variable[Any]", tuple[slice, ...], concurrent.futures.Future[Any]]
+        ] = collections.deque()
+        for variable_name, destination, block in blocks:
+            if len(in_flight) >= max_in_flight:
+                d, b, future = in_flight.popleft()
+                d[b] = future.result()
+            in_flight.append(
+                (destination, block, executor.submit(_read_block_in_worker, variable_name, block))
+            )
+        while len(in_flight) > 0:
+            d, b, future = in_flight.popleft()
+            d[b] = future.result()
+
+
 def remove_elements_from_netcdf_file(
     source_filepath: str,
     destination_filepath: str,
@@ -283,9 +1167,20 @@ def remove_elements_from_netcdf_file(
     dimensions_to_remove: list[str] = [],
     attributes_to_remove: list[str] = [],
     compression_level: int = 2,
+    max_workers: int = 1,
+    memory_budget: int = 256 * 1024 * 1024,
+    compression: Optional[_Compression] = None,
 ) -> None:
     """Create a new NetCDF file by copying an existing one, but removing specified variables, dimensions, and attributes. This is useful because NetCDF4 does not support removing elements from an existing file.
 
+    The variables are copied in blocks of whole chunks (see `NetCDFFile.import_variable`),
+    so at most about `memory_budget` bytes of data are held in memory at once. With
+    `max_workers > 1`, the blocks are read and decompressed in that many worker processes
+    while the main process writes and compresses them. The compression itself still
+    runs on a single core, so `max_workers` helps most when reading and decompressing
+    the source file is the slower part. The variables are compressed with `compression`
+    (default: zlib) at `compression_level`.
+
     Raises:
         FileNotFoundError: If the source file does not exist.
         FileExistsError: If the destination file already exists.
@@ -295,6 +1190,8 @@ def remove_elements_from_netcdf_file(
         raise FileNotFoundError(f"Source file {source_filepath} does not exist.")
     if os.path.isfile(destination_filepath):
         raise FileExistsError(f"Destination file {destination_filepath} already exists.")
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
 
     src_nc = NetCDFFile(source_filepath, mode="r")
     dest_nc = NetCDFFile(destination_filepath, mode="w")
@@ -314,9 +1211,29 @@ def remove_elements_from_netcdf_file(
             dest_nc.import_dimension(dim)
 
     # Copy variables
-    for var_name, var in src_nc.variables.items():
-        if var_name not in variables_to_remove:
-            dest_nc.import_variable(var, compression_level=compression_level)
+    if max_workers == 1:
+        for var in vars:
+            dest_nc.import_variable(
+                var,
+                compression=compression,
+                compression_level=compression_level,
+                memory_budget=memory_budget,
+            )
+    else:
+        for var in vars:
+            dest_nc.import_variable(
+                var,
+                compression=compression,
+                compression_level=compression_level,
+                copy_data=False,
+            )
+        _copy_variables_in_parallel(
+            source_filepath,
+            vars,
+            [dest_nc.variables[var.name] for var in vars],
+            max_workers=max_workers,
+            memory_budget=memory_budget,
+        )
 
     # Copy attributes
     for attr_name, attr_value in src_nc.attributes.items():
@@ -331,9 +1248,15 @@ def compress_netcdf_file(
     source_filepath: str,
     destination_filepath: str,
     compression_level: int = 2,
+    max_workers: int = 1,
+    memory_budget: int = 256 * 1024 * 1024,
+    compression: Optional[_Compression] = None,
 ) -> None:
     """Compress an existing NetCDF file by creating a new one with the specified compression level. This is useful because some NetCDF4 files given to you might not be (very well) compressed.
 
+    See `remove_elements_from_netcdf_file` for the other arguments. Use `benchmark_compression`
+    to find a good `compression` and `compression_level` for your data.
+
     Raises:
         FileNotFoundError: If the source file does not exist.
         FileExistsError: If the destination file already exists.
@@ -343,4 +1266,190 @@ def compress_netcdf_file(
         source_filepath,
         destination_filepath,
         compression_level=compression_level,
+        max_workers=max_workers,
+        memory_budget=memory_budget,
+        compression=compression,
     )
+
+
+class CompressionBenchmarkResult(pydantic.BaseModel):
+    """The result of one configuration in `benchmark_compression`."""
+
+    compression: Optional[str]
+    compression_level: Optional[int]
+    chunk_sizes: Optional[list[int]]
+    compression_ratio: float
+    """Uncompressed size divided by the size of the written file."""
+    write_throughput: float
+    """Uncompressed megabytes (10^6 bytes) written per second."""
+    read_throughput: float
+    """Uncompressed megabytes (10^6 bytes) read per second."""
+
+
+def benchmark_compression(
+    variable_or_array: "nc.Variable[Any] | npt.NDArray[Any]",
+    codecs: list[Optional[_Compression]] = [None, "zlib", "zstd", "blosc_lz4", "blosc_zstd"],
+    levels: list[int] = [1, 4, 9],
+    chunk_sizes: list[Optional[list[int]]] = [None],
+    sample_size: int = 64 * 1024 * 1024,
+) -> list[CompressionBenchmarkResult]:
+    """Measure the compression ratio and the write and read throughput of
+    different compression codecs, levels and chunk sizes on your data.
+
+    ```python
+    ncfile = NetCDFFile("model_output.nc", mode="r")
+    results = benchmark_compression(ncfile.variables["temperature"])
+    ncfile.close()
+    best = recommend_compression(results, min_write_throughput=50)
+    compress_netcdf_file(
+        "model_output.nc",
+        "model_output.compressed.nc",
+        compression=best.compression,
+        compression_level=best.compression_level,
+    )
+    ```
+
+    Each configuration writes a sample of the data (the leading records of
+    at most `sample_size` bytes) to a temporary file and reads it back.
+    The compression ratio is estimated from the file size, so it includes
+    the small overhead of the file header. `None` in `codecs` measures the
+    uncompressed baseline (only once). Combinations of codec and level
+    that the codec does not support are skipped, as well as codecs that
+    are not available in your netCDF installation. Chunk sizes larger than
+    the sample are shortened to its shape.
+
+    Args:
+        variable_or_array: The data to benchmark with.
+        codecs:            The compression codecs to try.
+        levels:            The compression levels to try.
+        chunk_sizes:       The chunk sizes to try. `None` uses the default
+                           chunking of the netCDF library.
+        sample_size:       The maximum number of bytes of data to use.
+
+    Returns:
+        The results of all configurations, sorted by compression ratio in
+        descending order.
+
+    Raises:
+        ValueError: If the datatype of the data is not supported or if the
+                    chunk sizes do not match the dimensions of the data.
+    """
+
+    datatypes: dict[str, Literal["f4", "f8", "i4", "i8"]] = {
+        "float32": "f4",
+        "float64": "f8",
+        "int32": "i4",
+        "int64": "i8",
+    }
+    dtype = np.dtype(variable_or_array.dtype)
+    if dtype.name not in datatypes:
+        raise ValueError(f"Unsupported datatype {dtype.name}, must be one of {list(datatypes)}")
+    shape = [int(s) for s in variable_or_array.shape]
+    if len(shape) == 0:
+        raise ValueError("Cannot benchmark scalar data")
+    record_size = math.prod(shape[1:]) * dtype.itemsize
+    records = max(1, min(shape[0], sample_size // max(1, record_size)))
+    sample: Any = variable_or_array[:records]
+    shape[0] = records
+    uncompressed_size = math.prod(shape) * dtype.itemsize
+
+    sample_chunk_sizes: list[Optional[list[int]]] = []
+    for c in chunk_sizes:
+        if c is not None:
+            if len(c) != len(shape) or any(size < 1 for size in c):
+                raise ValueError(f"Invalid chunk sizes {c} for data with the shape {shape}")
+            c = [min(size, length) for size, length in zip(c, shape)]
+        sample_chunk_sizes.append(c)
+
+    results: list[CompressionBenchmarkResult] = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with nc.Dataset(os.path.join(tmpdir, "probe.nc"), mode="w") as probe:
+            unavailable_codecs: set[Optional[_Compression]] = set()
+            if not probe.has_szip_filter():
+                unavailable_codecs.add("szip")
+            if not probe.has_zstd_filter():
+                unavailable_codecs.add("zstd")
+            if not probe.has_bzip2_filter():
+                unavailable_codecs.add("bzip2")
+            if not probe.has_blosc_filter():
+                unavailable_codecs.update(
+                    ["blosc_lz", "blosc_lz4", "blosc_lz4hc", "blosc_zlib", "blosc_zstd"]
+                )
+
+        configurations: list[tuple[Optional[_Compression], Optional[int], Optional[list[int]]]] = []
+        for c in sample_chunk_sizes:
+            for codec in codecs:
+                if codec is None:
+                    configurations.append((None, None, c))
+                elif codec not in unavailable_codecs:
+                    for codec_level in levels:
+                        try:
+                            _check_compression_level(codec, codec_level)
+                        except ValueError:
+                            continue
+                        configurations.append((codec, codec_level, c))
+
+        for i, (codec, level, c) in enumerate(configurations):
+            filepath = os.path.join(tmpdir, f"benchmark-{i}.nc")
+            t1 = time.perf_counter()
+            ncfile = NetCDFFile(filepath, mode="w")
+            for j, size in enumerate(shape):
+                ncfile.create_dimension(f"d{j}", size)
+            ncfile.create_variable(
+                "data",
+                dimensions=tuple(f"d{j}" for j in range(len(shape))),
+                units="1",
+                datatype=datatypes[dtype.name],
+                zlib=False,
+                compression=codec,
+                compression_level=level,
+                chunk_sizes=c,
+            )
+            ncfile.variables["data"][:] = sample
+            ncfile.close()
+            t2 = time.perf_counter()
+            ncfile = NetCDFFile(filepath, mode="r")
+            ncfile.variables["data"][:]
+            ncfile.close()
+            t3 = time.perf_counter()
+
+            results.append(
+                CompressionBenchmarkResult(
+                    compression=codec,
+                    compression_level=level,
+                    chunk_sizes=c,
+                    compression_ratio=uncompressed_size / os.path.getsize(filepath),
+                    write_throughput=uncompressed_size / 1e6 / (t2 - t1),
+                    read_throughput=uncompressed_size / 1e6 / (t3 - t2),
+                )
+            )
+            os.remove(filepath)
+
+    return sorted(results, key=lambda r: r.compression_ratio, reverse=True)
+
+
+def recommend_compression(
+    results: list[CompressionBenchmarkResult],
+    min_write_throughput: Optional[float] = None,
+    min_read_throughput: Optional[float] = None,
+) -> CompressionBenchmarkResult:
+    """Pick the configuration with the highest compression ratio among the
+    results of `benchmark_compression` that write and read at least the
+    given number of megabytes per second. If no configuration is fast
+    enough, the one with the highest minimum of write and read throughput
+    is returned.
+
+    Raises:
+        ValueError: If `results` is empty."""
+
+    if len(results) == 0:
+        raise ValueError("No benchmark results given")
+    fast_enough = [
+        r
+        for r in results
+        if (min_write_throughput is None or r.write_throughput >= min_write_throughput)
+        and (min_read_throughput is None or r.read_throughput >= min_read_throughput)
+    ]
+    if len(fast_enough) == 0:
+        return max(results, key=lambda r: min(r.write_throughput, r.read_throughput))
+    return max(fast_enough, key=lambda r: r.compression_ratio)
@@ -1,6 +1,8 @@
 """Functions for interacting with OPUS files.
 
-Implements: `OpusFile`, `OpusHTTPInterface`.
+Implements: `OpusFile`, `read_many`, `OpusIndex`, `export_metadata`,
+`OpusHTTPInterface`, `OpusHTTPClient`, `AsyncOpusHTTPInterface`,
+`OpusMacroWatcher`, `FakeOpusHTTPServer`.
 
 Read https://tccon-wiki.caltech.edu/Main/I2SAndOPUSHeaders for more information
 about the file parameters. This requires you to install this utils library with
@@ -17,6 +19,23 @@ format."""
 
 from . import file_interface as file_interface
 from .file_interface import OpusFile as OpusFile
+from .file_interface import OpusFileHandle as OpusFileHandle
+from .file_interface import OpusReadResult as OpusReadResult
+from .file_interface import read_many as read_many
+
+from . import index as index
+from .index import OpusIndex as OpusIndex
+
+from . import export as export
+from .export import export_metadata as export_metadata
 
 from . import http_interface as http_interface
+from .http_interface import OpusHTTPClient as OpusHTTPClient
 from .http_interface import OpusHTTPInterface as OpusHTTPInterface
+from .http_interface import AsyncOpusHTTPInterface as AsyncOpusHTTPInterface
+from .http_interface import OpusParameterResults as OpusParameterResults
+from .http_interface import OpusMacroWatcher as OpusMacroWatcher
+from .http_interface import OpusLatencyHistogram as OpusLatencyHistogram
+
+from . import fake_http_server as fake_http_server
+from .fake_http_server import FakeOpusHTTPServer as FakeOpusHTTPServer
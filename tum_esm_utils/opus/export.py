@@ -0,0 +1,158 @@
+"""Export the metadata of many OPUS files into a single Polars DataFrame.
+
+Implements: `export_metadata`.
+
+This requires the `polars` library, which is installed with the optional
+`em27` dependency."""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Literal, Optional
+import concurrent.futures
+import datetime
+import os
+
+from .file_interface import OpusFile
+
+if TYPE_CHECKING:
+    import polars as pl
+
+# column prefixes of the parameter blocks (same naming as `OpusChannelParameters`)
+_BLOCK_COLUMN_PREFIXES: dict[str, str] = {
+    "DBTDSTAT": "spectrum",
+    "DBTINSTR": "instrument",
+    "DBTAQPAR": "acquisition",
+    "DBTPRCPAR": "optics",
+    "DBTORGPAR": "sample",
+    "DBTFTPAR": "fourier_transform",
+}
+
+_Row = dict[str, Optional[str | float | int | datetime.datetime]]
+
+
+def _read_metadata_rows(
+    filepath: str,
+    measurement_timestamp_mode: Literal["start", "end"],
+    read_all_channels: bool,
+) -> tuple[list[_Row], dict[str, int], Optional[str]]:
+    """Read one row per channel of an OPUS file. Returns the rows, the OPUS
+    data type of each parameter column and an error message if reading failed."""
+
+    try:
+        metadata = OpusFile.read_metadata(filepath, read_all_channels=read_all_channels)
+        measurement_times = metadata.parse_measurement_times(measurement_timestamp_mode)
+    except Exception as e:
+        return [], {}, f"{type(e).__name__}: {e}"
+
+    rows: list[_Row] = []
+    column_types: dict[str, int] = {}
+    for channel, (parameters, parameter_types) in enumerate(
+        zip(metadata.channel_parameters, metadata.channel_parameter_types)
+    ):
+        row: _Row = {
+            "filepath": filepath,
+            "channel": channel,
+            "measurement_time": measurement_times[channel],
+        }
+        for category, prefix in _BLOCK_COLUMN_PREFIXES.items():
+            for name, value in parameters[category].items():
+                row[f"{prefix}.{name}"] = value
+                column_types[f"{prefix}.{name}"] = parameter_types[category][name]
+        rows.append(row)
+    return rows, column_types, None
+
+
+def export_metadata(
+    filepaths: list[str],
+    parquet_path: Optional[str] = None,
+    measurement_timestamp_mode: Literal["start", "end"] = "start",
+    read_all_channels: bool = True,
+    workers: int = 1,
+    skip_invalid_files: bool = False,
+) -> pl.DataFrame:
+    """Collect the parameters of many OPUS files into a single DataFrame.
+
+    The DataFrame has one row per file and channel with the columns
+    `filepath`, `channel`, `measurement_time` and one column per parameter,
+    named like `instrument.INS` or `spectrum.NPT` (see
+    `OpusChannelParameters`). The column dtypes are derived from the OPUS
+    data types: INT32 parameters become `Int32`, REAL64 parameters become
+    `Float64` and all others become `String`. Columns whose data type
+    differs between files are stored as `String`.
+
+    ```python
+    df = tum_esm_utils.opus.export_metadata(filepaths, parquet_path="metadata.parquet")
+    df.group_by("instrument.INS").agg(pl.col("acquisition.NSS").unique())
+    ```
+
+    Args:
+        filepaths:                  Paths to the OPUS files.
+        parquet_path:               If set, the DataFrame is also written to this
+                                    Parquet file.
+        measurement_timestamp_mode: See `OpusFile.read`.
+        read_all_channels:          See `OpusFile.read`.
+        workers:                    Number of processes used to read the files.
+        skip_invalid_files:         Whether to skip files that cannot be read
+                                    instead of raising an exception.
+
+    Returns:
+        A Polars DataFrame with one row per file and channel."""
+
+    import polars as pl
+
+    if workers < 1:
+        raise ValueError("The number of workers must be at least 1")
+
+    modes: list[Literal["start", "end"]] = [measurement_timestamp_mode] * len(filepaths)
+    channel_options = [read_all_channels] * len(filepaths)
+    if workers > 1 and len(filepaths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _read_metadata_rows,
+                    filepaths,
+                    modes,
+                    channel_options,
+                    chunksize=max(1, min(256, len(filepaths) // (4 * workers))),
+                )
+            )
+    else:
+        results = list(map(_read_metadata_rows, filepaths, modes, channel_options))
+
+    rows: list[_Row] = []
+    column_types: dict[str, set[int]] = {}
+    for filepath, (file_rows, file_column_types, error) in zip(filepaths, results):
+        if error is not None:
+            if skip_invalid_files:
+                continue
+            raise RuntimeError(f"Could not read {filepath}: {error}")
+        rows.extend(file_rows)
+        for column, data_type in file_column_types.items():
+            column_types.setdefault(column, set()).add(data_type)
+
+    schema: dict[str, pl.DataType] = {
+        "filepath": pl.String(),
+        "channel": pl.Int32(),
+        "measurement_time": pl.Datetime(time_unit="us", time_zone="UTC"),
+    }
+    for column, data_types in column_types.items():
+        if data_types == {0}:
+            schema[column] = pl.Int32()
+        elif data_types == {1}:
+            schema[column] = pl.Float64()
+        else:
+            schema[column] = pl.String()
+
+    columns: dict[str, list[Optional[str | float | int | datetime.datetime]]] = {}
+    for column, dtype in schema.items():
+        values = [row.get(column) for row in rows]
+        if dtype == pl.String():
+            columns[column] = [None if v is None else str(v) for v in values]
+        else:
+            columns[column] = values
+
+    df = pl.DataFrame(columns, schema=schema)
+    if parquet_path is not None:
+        parent_directory = os.path.dirname(os.path.abspath(parquet_path))
+        os.makedirs(parent_directory, exist_ok=True)
+        df.write_parquet(parquet_path)
+    return df
@@ -0,0 +1,272 @@
+"""A local stand-in for the OPUS HTTP interface.
+
+Implements: `FakeOpusHTTPServer`.
+
+It answers in the same non-standard format as OPUS (plain answer lines
+without any HTTP headers, then closing the connection) and can simulate
+latency, dropped connections and running macros. Use it to test and
+benchmark code that uses `OpusHTTPClient` or `AsyncOpusHTTPInterface`
+without a Windows machine running OPUS."""
+
+from __future__ import annotations
+from typing import Any, Optional
+import collections
+import os
+import random
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+
+# the functions reported by `FIND_FUNCTION` for the threads of running macros
+_MACRO_FUNCTIONS = ["MeasureSample", "MeasureRepeated", "Timer"]
+
+
+class _FakeOpusRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        assert isinstance(self.server, _FakeOpusTCPServer)
+        connection: socket.socket = self.request
+        connection.settimeout(5)
+        raw_request = b""
+        try:
+            while b"\r\n" not in raw_request:
+                chunk = connection.recv(65536)
+                if len(chunk) == 0:
+                    return
+                raw_request += chunk
+        except OSError:
+            return
+        self.server.fake_opus.handle_raw_request(connection, raw_request)
+
+
+class _FakeOpusTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address: tuple[str, int], fake_opus: FakeOpusHTTPServer) -> None:
+        self.fake_opus = fake_opus
+        super().__init__(address, _FakeOpusRequestHandler)
+
+
+class FakeOpusHTTPServer:
+    """A threaded fake OPUS HTTP server.
+
+    ```python
+    with FakeOpusHTTPServer(latency=0.02, macro_duration=1.0) as server:
+        client = OpusHTTPClient(host=server.host, port=server.port)
+        macro_id = client.start_macro("C:/macros/measure.mtx")
+        assert client.macro_is_running(macro_id)
+    ```
+
+    Macros started with `RUN_MACRO` run for `macro_duration` seconds or until
+    they are stopped with `KILL_MACRO`. While a macro is running, its thread
+    shows up in the answers to `FIND_FUNCTION` of common measurement
+    functions, and `MACRO_RESULTS` returns 0. Parameters can be read and
+    written per parameter mode (`FILE_PARAMETERS`/`OPUS_PARAMETERS`).
+
+    Args:
+        host:           The host to listen on.
+        port:           The port to listen on. 0 selects a free port.
+        latency:        The time to wait before answering each request.
+        latency_jitter: A random time between 0 and this value is added to
+                        the latency of each request.
+        drop_rate:      The probability of closing a connection without
+                        answering.
+        macro_duration: How long a macro runs after it has been started.
+        parameters:     The initial parameters, used for both parameter modes.
+        seed:           Seed for the random latency and dropped connections.
+        concurrent:     Whether to answer requests in parallel. OPUS answers
+                        one request at a time, so by default, each request
+                        waits until the previous one has been answered.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        drop_rate: float = 0.0,
+        macro_duration: float = 5.0,
+        parameters: Optional[dict[str, str]] = None,
+        seed: Optional[int] = None,
+        concurrent: bool = False,
+    ) -> None:
+        if not (0 <= drop_rate <= 1):
+            raise ValueError("drop_rate must be between 0 and 1")
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.drop_rate = drop_rate
+        self.macro_duration = macro_duration
+        self.concurrent = concurrent
+        self.main_thread_id = 1000
+        self.parameter_mode = "OPUS"
+        self.parameters: dict[str, dict[str, str]] = {
+            "OPUS": dict(parameters or {}),
+            "FILE": dict(parameters or {}),
+        }
+        self.loaded_experiment: Optional[str] = None
+        self.is_closed = False
+
+        # macro id -> (macro path, thread id, end time)
+        self.macros: dict[int, tuple[str, int, float]] = {}
+        self.request_counts: collections.Counter[str] = collections.Counter()
+        self.dropped_requests = 0
+
+        # the most requests that were answered at the same time
+        self.max_concurrent_requests = 0
+        self._concurrent_requests = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._serial_lock = threading.Lock()
+        self._next_macro_id = 1
+        self._server = _FakeOpusTCPServer((host, port), self)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return str(self._server.server_address[0])
+
+    @property
+    def port(self) -> int:
+        return int(self._server.server_address[1])
+
+    def start(self) -> None:
+        """Serve requests in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving requests and close the socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> FakeOpusHTTPServer:
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def running_macro_ids(self) -> list[int]:
+        """The IDs of all currently running macros."""
+        now = time.time()
+        with self._lock:
+            return [i for i, (_, _, end_time) in self.macros.items() if end_time > now]
+
+    def handle_raw_request(self, connection: socket.socket, raw_request: bytes) -> None:
+        """Answer a single raw request and close the connection."""
+
+        if self.concurrent:
+            self._handle_raw_request(connection, raw_request)
+        else:
+            with self._serial_lock:
+                self._handle_raw_request(connection, raw_request)
+
+    def _handle_raw_request(self, connection: socket.socket, raw_request: bytes) -> None:
+        request_line = raw_request.split(b"\r\n")[0].decode("utf-8", errors="replace")
+        try:
+            url = request_line.split(" ")[1]
+            command = urllib.parse.unquote(url.split("?", 1)[1])
+        except IndexError:
+            command = ""
+
+        with self._lock:
+            self.request_counts[command.split(" ")[0]] += 1
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            drop = self._random.random() < self.drop_rate
+            if drop:
+                self.dropped_requests += 1
+            self._concurrent_requests += 1
+            self.max_concurrent_requests = max(
+                self.max_concurrent_requests, self._concurrent_requests
+            )
+        try:
+            if delay > 0:
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self._concurrent_requests -= 1
+        if drop:
+            return
+
+        answer_lines = self.answer(command)
+        try:
+            connection.sendall(("\r\n".join(answer_lines) + "\r\n").encode("utf-8"))
+        except OSError:
+            pass
+
+    def answer(self, command: str) -> list[str]:
+        """Compute the answer lines to a command."""
+
+        name, _, argument = command.partition(" ")
+        with self._lock:
+            now = time.time()
+            if name == "GET_VERSION":
+                return ["20190310"]
+            if name == "GET_VERSION_EXTENDED":
+                return ["8.2 Build: 8, 2, 28 20190310"]
+            if name == "COMMAND_SAY":
+                return [argument]
+            if name == "FIND_FUNCTION":
+                if argument == "0":
+                    return ["OK", str(self.main_thread_id)]
+                thread_ids = [self.main_thread_id]
+                if argument in _MACRO_FUNCTIONS:
+                    thread_ids += [t for _, t, end_time in self.macros.values() if end_time > now]
+                return ["OK", *[str(t) for t in thread_ids]]
+            if name == "LOAD_EXPERIMENT":
+                self.loaded_experiment = argument
+                xpp, exp = os.path.split(argument)
+                for mode in self.parameters.values():
+                    mode["XPP"], mode["EXP"] = xpp, exp
+                return ["OK"]
+            if name == "RUN_MACRO":
+                macro_id = self._next_macro_id
+                self._next_macro_id += 1
+                self.macros[macro_id] = (
+                    argument,
+                    self.main_thread_id + macro_id,
+                    now + self.macro_duration,
+                )
+                return ["OK", str(macro_id)]
+            if name == "MACRO_RESULTS":
+                if not argument.isdigit() or int(argument) not in self.macros:
+                    return ["ERROR"]
+                return ["OK", "0" if self.macros[int(argument)][2] > now else "1"]
+            if name == "KILL_MACRO":
+                for macro_id, (path, thread_id, end_time) in self.macros.items():
+                    if argument in [str(macro_id), os.path.basename(path)] and end_time > now:
+                        self.macros[macro_id] = (path, thread_id, now)
+                return ["OK"]
+            if name in ["FILE_PARAMETERS", "OPUS_PARAMETERS"]:
+                self.parameter_mode = name.split("_")[0]
+                return ["OK"]
+            if name == "READ_PARAMETER":
+                value = self.parameters[self.parameter_mode].get(argument)
+                return ["ERROR"] if value is None else ["OK", value]
+            if name == "WRITE_PARAMETER":
+                parameter, _, value = argument.partition(" ")
+                self.parameters[self.parameter_mode][parameter] = value
+                return ["OK"]
+            if name == "GET_LANGUAGE":
+                return ["OK", "ENGLISH"]
+            if name == "GET_USERNAME":
+                return ["OK", "Default"]
+            if name in ["GET_OPUSPATH", "GET_BASEPATH", "GET_DATAPATH", "GET_WORKPATH"]:
+                return ["OK", "C:\\OPUS"]
+            if name in ["SET_COMMAND_MODE", "SET_EXECUTE_MODE", "SET_REQUEST_MODE"]:
+                return ["OK"]
+            if name == "COMMAND_LINE":
+                return ["OK"]
+            if name == "CLOSE_OPUS":
+                self.is_closed = True
+                return ["OK"]
+            return ["ERROR"]
@@ -1,7 +1,14 @@
 """Functions for interacting with OPUS files."""
 
 from __future__ import annotations
-from typing import Optional, Literal
+from typing import Any, Generator, Mapping, Optional, Literal
+from multiprocessing import shared_memory
+from types import MappingProxyType
+import collections
+import concurrent.futures
+import dataclasses
+import io
+import os
 import warnings
 import numpy as np
 import numpy.typing as npt
@@ -22,6 +29,12 @@ class OpusFile(pydantic.BaseModel):
     channel_parameters: list[types.OpusChannelParameters]
     measurement_times: list[datetime.datetime]
     interferogram: Optional[npt.NDArray[np.float64]] = pydantic.Field(default=None, exclude=True)
+    raw_interferogram: Optional[npt.NDArray[np.float32]] = pydantic.Field(
+        default=None, exclude=True
+    )
+    interferogram_scaling_factors: Optional[npt.NDArray[np.float64]] = pydantic.Field(
+        default=None, exclude=True
+    )
 
     # serialization of measurement times
     @pydantic.field_serializer("measurement_times")
@@ -32,7 +45,7 @@ class OpusFile(pydantic.BaseModel):
     def read(
         filepath: str,
         measurement_timestamp_mode: Literal["start", "end"] = "start",
-        interferogram_mode: Literal["skip", "validate", "read"] = "read",
+        interferogram_mode: Literal["skip", "validate", "read", "map"] = "read",
         read_all_channels: bool = True,
     ) -> OpusFile:
         """Read an interferogram file.
@@ -47,118 +60,779 @@ class OpusFile(pydantic.BaseModel):
                                         for errors during writing, "read" will read
                                         the entire interferogram. "read" takes about
                                         11-12 times longer than "skip", "validate" is
-                                        about 20% slower than "skip".
+                                        about 20% slower than "skip". "map" will
+                                        memory-map the interferogram without reading
+                                        or copying it: `raw_interferogram` is a
+                                        read-only float32 view over the file and
+                                        `interferogram_scaling_factors` contains the
+                                        CSF of each channel.
             read_all_channels:          Whether to read all channels in the file or
                                         only the first one.
 
         Returns:
-            An OpusFile object, optionally containing the interferogram data (in read mode)
+            An OpusFile object, optionally containing the interferogram data (in read
+            mode) or the raw memory-mapped interferogram data (in map mode).
         """
 
-        # what to copy when only manipulating the interferogram
-        # 4 (MAGIC) + struct.calcsize('<dIII') + len(opus_dirs) * struct.calcsize('<III')
-        # for each opus dirs:
-        # f.seek(opus_directory_entry.block_pointer)
-        # f.read(4 * opus_directory_entry.block_length)
-
         with open(filepath, "rb") as f:
-            opus_header = utils.read_opus_header(f)
-            f.seek(opus_header.dir_pointer)
-            opus_dirs = [utils.read_opus_dir_entry(f) for _ in range(opus_header.dir_size)]
-
-            block_indices: dict[
-                str,
-                list[int],
-            ] = {
-                "": [],
-                "DBTDSTAT": [],
-                "DBTINSTR": [],
-                "DBTAQPAR": [],
-                "DBTPRCPAR": [],
-                "DBTFTPAR": [],
-                "DBTORGPAR": [],
-            }
-            for i, ode in enumerate(opus_dirs):
-                for key in block_indices.keys():
-                    if ode.block_category == key:
-                        block_indices[key].append(i)
-
-            # write all blocks with empty category that are close to the expected length
-            # to the interferogram block. ignore all other blocks
-            block_indices["interferogram"] = [
-                i for i in block_indices[""] if abs(opus_dirs[i].block_length - 228512) < 200
-            ]
-            del block_indices[""]
-
-            for key in block_indices:
-                if len(block_indices[key]) == 0:
-                    raise RuntimeError(f"Could not find a {key} block!")
-
-            # check number of blocks
-            assert len(block_indices["DBTDSTAT"]) >= 1, (
-                f"found {len(block_indices['DBTDSTAT'])} DBTDSTAT blocks"
-            )
-            for b in ["DBTINSTR", "DBTAQPAR", "DBTPRCPAR", "DBTFTPAR", "DBTORGPAR"]:
-                assert len(block_indices[b]) == 1, f"found {len(block_indices[b])} {b} blocks"
-
-            parameters_ch1 = types.OpusChannelParameters.model_validate(
-                {
-                    k: utils.read_opus_block(
-                        f, opus_dirs[block_indices[k][0]], types.OpusParameterBlock
-                    ).data
-                    for k in [
-                        "DBTAQPAR",
-                        "DBTORGPAR",
-                        "DBTDSTAT",
-                        "DBTINSTR",
-                        "DBTPRCPAR",
-                        "DBTFTPAR",
-                    ]
-                }
-            )
-
-            channel_parameter_count = len(block_indices["DBTDSTAT"]) if read_all_channels else 1
-            interferogram_count = len(block_indices["interferogram"]) if read_all_channels else 1
-
-            if channel_parameter_count != interferogram_count:
-                warnings.warn(
-                    f'There are {channel_parameter_count} "DBTDSTAT" blocks, but {interferogram_count} interferogram blocks. File is still readable.'
-                )
-
-            # all channels share the same parameters, except for the spectrum
-            channel_parameters = [parameters_ch1]
-            for i in range(1, channel_parameter_count):
-                p = parameters_ch1.model_copy(deep=True)
-                p.spectrum = utils.read_opus_block(
-                    f,
-                    opus_dirs[block_indices["DBTDSTAT"][i]],
-                    types.OpusParameterBlock,
-                ).data
-                channel_parameters.append(p)
-
-            interferogram: Optional[npt.NDArray[np.float64]] = None
+            metadata = _read_opus_file_metadata(f, read_all_channels=read_all_channels)
+            opus_file = metadata.to_opus_file(measurement_timestamp_mode)
+            ifg_opus_dirs = [metadata.directory[i] for i in metadata.interferogram_block_indices]
+            spectrum_opus_dirs = [metadata.directory[i] for i in metadata.spectrum_block_indices]
 
             # validate = only check if the block is fully present
             if interferogram_mode == "validate":
-                for block_index in block_indices["interferogram"]:
-                    utils.read_opus_block(f, opus_dirs[block_index], types.OpusDataBlock)
+                for ifg_opus_dir in ifg_opus_dirs:
+                    utils.read_opus_block(f, ifg_opus_dir.to_model(), types.OpusDataBlock)
 
             # read = read the entire interferogram
             if interferogram_mode == "read":
-                interferogram = utils.read_interferogram(
+                opus_file.interferogram = utils.read_interferogram(
+                    f,
+                    channel_parameters=opus_file.channel_parameters,
+                    ifg_opus_dirs=ifg_opus_dirs,
+                    read_all_channels=read_all_channels,
+                    spectrum_opus_dirs=spectrum_opus_dirs,
+                )
+
+            # map = memory-map the interferogram without scaling or copying it
+            if interferogram_mode == "map":
+                (
+                    opus_file.raw_interferogram,
+                    opus_file.interferogram_scaling_factors,
+                ) = utils.map_interferogram(
                     f,
-                    channel_parameters=channel_parameters,
-                    ifg_opus_dirs=[opus_dirs[i] for i in block_indices["interferogram"]][
-                        :interferogram_count
-                    ],
+                    channel_parameters=opus_file.channel_parameters,
+                    ifg_opus_dirs=ifg_opus_dirs,
                     read_all_channels=read_all_channels,
+                    spectrum_opus_dirs=spectrum_opus_dirs,
                 )
 
+        return opus_file
+
+    def write(
+        self,
+        filepath: str,
+        source_filepath: str,
+    ) -> None:
+        """Write this file's `interferogram` into a copy of the OPUS file it
+        has been read from. See `OpusFile.rewrite_interferogram`.
+
+        Args:
+            filepath:        Path of the OPUS file to write.
+            source_filepath: Path of the OPUS file this object has been read from.
+        """
+
+        if self.interferogram is None:
+            raise ValueError("This OpusFile does not contain an interferogram")
+        OpusFile.rewrite_interferogram(
+            source_filepath,
+            self.interferogram,
+            target_filepath=filepath,
+            read_all_channels=len(self.interferogram) > 1,
+        )
+
+    @staticmethod
+    def rewrite_interferogram(
+        source_filepath: str,
+        interferogram: npt.NDArray[np.floating[Any]],
+        target_filepath: Optional[str] = None,
+        read_all_channels: bool = True,
+    ) -> None:
+        """Replace the interferogram data of an OPUS file.
+
+        The header, the directory and all parameter blocks are copied
+        byte-for-byte. The interferogram is divided by the CSF of each
+        channel and stored as float32, so reading the new file with
+        `OpusFile.read` returns `interferogram` (up to float32 precision).
+        The source file is read once and the target file is written with a
+        single buffered write. Without `target_filepath`, only the data
+        blocks of the source file are overwritten in place.
+
+        Changing the number of points or channels is not supported because
+        this would require rewriting the block directory and parameters.
+
+        ```python
+        opus_file = OpusFile.read(filepath)
+        assert opus_file.interferogram is not None
+        OpusFile.rewrite_interferogram(
+            filepath, opus_file.interferogram * 2, target_filepath=output_filepath
+        )
+        ```
+
+        Args:
+            source_filepath:   Path to the OPUS file to rewrite.
+            interferogram:     The new `(channels, NPT)` interferogram.
+            target_filepath:   Where to write the new file. Defaults to
+                               rewriting the source file in place.
+            read_all_channels: Whether to replace all channels or only the
+                               first one.
+        """
+
+        with open(source_filepath, "rb") as f:
+            metadata = _read_opus_file_metadata(f, read_all_channels=read_all_channels)
+            ifg_opus_dirs = [metadata.directory[i] for i in metadata.interferogram_block_indices]
+            mapped_interferogram, scaling_factors = utils.map_interferogram(
+                f,
+                channel_parameters=metadata.to_opus_file().channel_parameters,
+                ifg_opus_dirs=ifg_opus_dirs,
+                read_all_channels=read_all_channels,
+                spectrum_opus_dirs=[metadata.directory[i] for i in metadata.spectrum_block_indices],
+            )
+            expected_shape = mapped_interferogram.shape
+            spectrum_length = expected_shape[1]
+            ifg_opus_dirs = ifg_opus_dirs[: expected_shape[0]]
+            del mapped_interferogram
+            if interferogram.shape != expected_shape:
+                raise ValueError(
+                    f"The interferogram has the shape {interferogram.shape}, but the "
+                    + f"OPUS file requires the shape {expected_shape}"
+                )
+
+            raw_interferogram = np.empty(shape=expected_shape, dtype="<f4")
+            np.divide(
+                interferogram,
+                scaling_factors[:, np.newaxis],
+                out=raw_interferogram,
+                casting="unsafe",
+            )
+
+            if target_filepath is None:
+                content = None
+            else:
+                content = bytearray(os.fstat(f.fileno()).st_size)
+                f.seek(0)
+                if f.readinto(content) != len(content):
+                    raise RuntimeError(f"Could not read the entire file {source_filepath}")
+
+        if content is None:
+            with open(source_filepath, "r+b") as f:
+                for ifg_opus_dir, channel in zip(ifg_opus_dirs, raw_interferogram):
+                    f.seek(ifg_opus_dir.block_pointer)
+                    f.write(channel.data)
+        else:
+            assert target_filepath is not None
+            content_array = np.frombuffer(content, dtype=np.uint8)
+            for ifg_opus_dir, channel in zip(ifg_opus_dirs, raw_interferogram):
+                content_array[
+                    ifg_opus_dir.block_pointer : ifg_opus_dir.block_pointer + 4 * spectrum_length
+                ] = channel.view(np.uint8)
+            del content_array
+            with open(target_filepath, "wb") as f:
+                f.write(content)
+
+    @staticmethod
+    def open(
+        filepath: str,
+        measurement_timestamp_mode: Literal["start", "end"] = "start",
+        read_all_channels: bool = True,
+    ) -> OpusFileHandle:
+        """Open an OPUS file and decode its parameter blocks lazily.
+
+        Only the header and the directory are read up front. Reading the
+        measurement time of a channel then only decodes its "DBTDSTAT" and
+        the "DBTINSTR" block. See `OpusFileHandle`.
+
+        Args:
+            filepath:                   Path to the OPUS file.
+            measurement_timestamp_mode: See `OpusFile.read`.
+            read_all_channels:          Whether to expose all channels in the file
+                                        or only the first one.
+
+        Returns:
+            An OpusFileHandle object, which should be closed after use."""
+
+        return OpusFileHandle(filepath, measurement_timestamp_mode, read_all_channels)
+
+    @staticmethod
+    def iter_interferogram(
+        filepath: str,
+        window_size: int = 65536,
+        dtype: Literal["float32", "float64"] = "float64",
+        read_all_channels: bool = True,
+    ) -> Generator[npt.NDArray[np.floating[Any]], None, None]:
+        """Iterate over fixed-size windows of the interferogram with bounded memory.
+
+        Instead of allocating the full `(channels, NPT)` array, each window is
+        read straight from the file offsets and scaled on the fly. This is
+        useful for running FFTs or quality checks on low-memory machines.
+
+        ```python
+        for window in OpusFile.iter_interferogram(filepath, window_size=8192, dtype="float32"):
+            assert window.shape[1] <= 8192
+        ```
+
+        Args:
+            filepath:          Path to the OPUS file.
+            window_size:       Number of points per channel in each window. The
+                               last window may be shorter.
+            dtype:             The dtype of the windows. "float32" halves the
+                               memory usage if its precision is sufficient.
+            read_all_channels: Whether to read all channels in the file or
+                               only the first one.
+
+        Returns:
+            A generator of `(channels, window_size)` arrays.
+        """
+
+        with open(filepath, "rb") as f:
+            metadata = _read_opus_file_metadata(f, read_all_channels=read_all_channels)
+            yield from utils.iter_interferogram(
+                f,
+                channel_parameters=metadata.to_opus_file().channel_parameters,
+                ifg_opus_dirs=[metadata.directory[i] for i in metadata.interferogram_block_indices],
+                read_all_channels=read_all_channels,
+                window_size=window_size,
+                dtype=dtype,
+                spectrum_opus_dirs=[metadata.directory[i] for i in metadata.spectrum_block_indices],
+            )
+
+    @staticmethod
+    def read_metadata(
+        filepath: str,
+        read_all_channels: bool = True,
+    ) -> OpusFileMetadata:
+        """Read the header, directory and parameter blocks of an OPUS file
+        without any pydantic validation.
+
+        This is considerably faster than `OpusFile.read(..., interferogram_mode="skip")`
+        when scanning the metadata of many files. Use `OpusFileMetadata.to_opus_file`
+        to convert the result into an `OpusFile` object.
+
+        Args:
+            filepath:          Path to the OPUS file.
+            read_all_channels: Whether to read all channels in the file or
+                               only the first one.
+
+        Returns:
+            An OpusFileMetadata object.
+        """
+
+        with open(filepath, "rb") as f:
+            return _read_opus_file_metadata(f, read_all_channels=read_all_channels)
+
+
+@dataclasses.dataclass(slots=True)
+class OpusFileMetadata:
+    """Lightweight, unvalidated metadata of an OPUS file.
+
+    `channel_parameters` contains one dictionary per channel that maps the
+    block categories ("DBTDSTAT", "DBTINSTR", "DBTAQPAR", "DBTPRCPAR",
+    "DBTORGPAR", "DBTFTPAR") to the decoded parameters. All channels share
+    the same parameter dictionaries except for "DBTDSTAT". The directory
+    indices of the "DBTDSTAT" blocks of each channel are stored in
+    `spectrum_block_indices`. The channels are in the order of the
+    interferogram blocks, so channel i belongs to the i-th row of the
+    interferogram, even if the "DBTDSTAT" blocks are stored in a different
+    order. `channel_parameter_types` has the same
+    structure as `channel_parameters` but contains the OPUS data type of
+    each parameter (0 = INT32, 1 = REAL64, 2-4 = STRING, ENUM, SENUM)."""
+
+    header: types.RawOpusHeader
+    directory: list[types.RawOpusDirectoryEntry]
+    channel_parameters: list[dict[str, dict[str, Optional[str | float | int]]]]
+    interferogram_block_indices: list[int]
+    spectrum_block_indices: list[int]
+    channel_parameter_types: list[dict[str, dict[str, int]]] = dataclasses.field(
+        default_factory=lambda: list[dict[str, dict[str, int]]]()
+    )
+
+    def parse_measurement_times(
+        self,
+        measurement_timestamp_mode: Literal["start", "end"] = "start",
+    ) -> list[datetime.datetime]:
+        """Parse the measurement time of each channel."""
+
+        return [
+            types.parse_measurement_datetime(
+                p["DBTDSTAT"], p["DBTINSTR"], measurement_timestamp_mode
+            )
+            for p in self.channel_parameters
+        ]
+
+    def to_opus_file(
+        self,
+        measurement_timestamp_mode: Literal["start", "end"] = "start",
+    ) -> OpusFile:
+        """Convert the metadata into an `OpusFile` object without interferogram."""
+
         return OpusFile(
-            header=opus_header,
-            channel_parameters=channel_parameters,
-            measurement_times=[
-                p.parse_measurement_datetime(measurement_timestamp_mode) for p in channel_parameters
+            header=self.header.to_model(),
+            channel_parameters=[
+                types.OpusChannelParameters.model_construct(
+                    spectrum=dict(p["DBTDSTAT"]),
+                    instrument=dict(p["DBTINSTR"]),
+                    acquisition=dict(p["DBTAQPAR"]),
+                    optics=dict(p["DBTPRCPAR"]),
+                    sample=dict(p["DBTORGPAR"]),
+                    fourier_transform=dict(p["DBTFTPAR"]),
+                )
+                for p in self.channel_parameters
+            ],
+            measurement_times=self.parse_measurement_times(measurement_timestamp_mode),
+        )
+
+
+_PARAMETER_BLOCK_CATEGORIES = [
+    "DBTAQPAR",
+    "DBTORGPAR",
+    "DBTDSTAT",
+    "DBTINSTR",
+    "DBTPRCPAR",
+    "DBTFTPAR",
+]
+
+
+def _locate_opus_blocks(
+    opus_dirs: list[types.RawOpusDirectoryEntry],
+    read_all_channels: bool,
+) -> tuple[dict[str, list[int]], int]:
+    """Find the directory indices of the parameter and interferogram blocks.
+
+    Returns the block indices per category (the interferogram indices are
+    stored under "interferogram" and truncated to the channels to read) and
+    the number of channels."""
+
+    block_indices: dict[str, list[int]] = {"": [], **{c: [] for c in _PARAMETER_BLOCK_CATEGORIES}}
+    for i, ode in enumerate(opus_dirs):
+        if ode.block_category in block_indices:
+            block_indices[ode.block_category].append(i)
+
+    # write all blocks with empty category that are close to the expected length
+    # to the interferogram block. ignore all other blocks
+    block_indices["interferogram"] = [
+        i for i in block_indices[""] if abs(opus_dirs[i].block_length - 228512) < 200
+    ]
+    del block_indices[""]
+
+    # order the "DBTDSTAT" blocks like the interferogram blocks they belong to, so
+    # that channel i is described by the i-th "DBTDSTAT" block (see
+    # `utils._match_channel_parameters`). Unmatched blocks keep their order at the end
+    spectrum_indices = {opus_dirs[i].block_type: i for i in block_indices["DBTDSTAT"]}
+    matched_indices = [
+        spectrum_indices.get(utils.get_parameter_block_type(opus_dirs[i].block_type))
+        for i in block_indices["interferogram"]
+    ]
+    ordered_indices = list(dict.fromkeys(i for i in matched_indices if i is not None))
+    block_indices["DBTDSTAT"] = ordered_indices + [
+        i for i in block_indices["DBTDSTAT"] if i not in ordered_indices
+    ]
+
+    for key in block_indices:
+        if len(block_indices[key]) == 0:
+            raise RuntimeError(f"Could not find a {key} block!")
+
+    # check number of blocks
+    assert len(block_indices["DBTDSTAT"]) >= 1, (
+        f"found {len(block_indices['DBTDSTAT'])} DBTDSTAT blocks"
+    )
+    for b in ["DBTINSTR", "DBTAQPAR", "DBTPRCPAR", "DBTFTPAR", "DBTORGPAR"]:
+        assert len(block_indices[b]) == 1, f"found {len(block_indices[b])} {b} blocks"
+
+    channel_parameter_count = len(block_indices["DBTDSTAT"]) if read_all_channels else 1
+    interferogram_count = len(block_indices["interferogram"]) if read_all_channels else 1
+
+    if channel_parameter_count != interferogram_count:
+        warnings.warn(
+            f'There are {channel_parameter_count} "DBTDSTAT" blocks, but {interferogram_count} interferogram blocks. File is still readable.'
+        )
+
+    block_indices["interferogram"] = block_indices["interferogram"][:interferogram_count]
+    return block_indices, channel_parameter_count
+
+
+def _read_opus_file_metadata(
+    f: io.BufferedReader,
+    read_all_channels: bool,
+) -> OpusFileMetadata:
+    """Read the header, directory and parameter blocks from an open OPUS file."""
+
+    opus_header = utils.read_raw_opus_header(f)
+    opus_dirs = utils.read_raw_opus_directory(f, opus_header)
+    block_indices, channel_parameter_count = _locate_opus_blocks(opus_dirs, read_all_channels)
+
+    blocks_ch1 = {
+        k: utils.read_raw_opus_parameter_block(f, opus_dirs[block_indices[k][0]])
+        for k in _PARAMETER_BLOCK_CATEGORIES
+    }
+    parameters_ch1 = {k: b.data for k, b in blocks_ch1.items()}
+    parameter_types_ch1 = {k: b.data_types for k, b in blocks_ch1.items()}
+
+    # all channels share the same parameters, except for the spectrum
+    channel_parameters = [parameters_ch1]
+    channel_parameter_types = [parameter_types_ch1]
+    for i in range(1, channel_parameter_count):
+        spectrum_block = utils.read_raw_opus_parameter_block(
+            f, opus_dirs[block_indices["DBTDSTAT"][i]]
+        )
+        channel_parameters.append({**parameters_ch1, "DBTDSTAT": spectrum_block.data})
+        channel_parameter_types.append(
+            {**parameter_types_ch1, "DBTDSTAT": spectrum_block.data_types}
+        )
+
+    return OpusFileMetadata(
+        header=opus_header,
+        directory=opus_dirs,
+        channel_parameters=channel_parameters,
+        interferogram_block_indices=block_indices["interferogram"],
+        spectrum_block_indices=block_indices["DBTDSTAT"][:channel_parameter_count],
+        channel_parameter_types=channel_parameter_types,
+    )
+
+
+class OpusFileHandle:
+    """An open OPUS file whose parameter blocks are decoded lazily.
+
+    Only the header and the directory are read when opening the file. Each
+    parameter block is decoded on first access and cached. Blocks that are
+    shared between channels (all except "DBTDSTAT") are decoded once and
+    the same read-only mapping is returned for every channel.
+
+    ```python
+    with OpusFile.open(filepath) as handle:
+        print(handle.channels[0].spectrum["DAT"], handle.measurement_times[0])
+    ```
+
+    Use `OpusFile.open` to create a handle."""
+
+    def __init__(
+        self,
+        filepath: str,
+        measurement_timestamp_mode: Literal["start", "end"] = "start",
+        read_all_channels: bool = True,
+    ) -> None:
+        self.filepath = filepath
+        self.measurement_timestamp_mode: Literal["start", "end"] = measurement_timestamp_mode
+        self.read_all_channels = read_all_channels
+        self._file = open(filepath, "rb")
+        try:
+            self.raw_header = utils.read_raw_opus_header(self._file)
+            self.directory = utils.read_raw_opus_directory(self._file, self.raw_header)
+            self._block_indices, channel_count = _locate_opus_blocks(
+                self.directory, read_all_channels
+            )
+        except Exception:
+            self._file.close()
+            raise
+        self._blocks: dict[int, Mapping[str, Optional[str | float | int]]] = {}
+        self.channels = [OpusChannelHandle(self, i) for i in range(channel_count)]
+
+    @property
+    def header(self) -> types.OpusHeader:
+        return self.raw_header.to_model()
+
+    @property
+    def interferogram_block_indices(self) -> list[int]:
+        return self._block_indices["interferogram"]
+
+    @property
+    def spectrum_block_indices(self) -> list[int]:
+        return self._block_indices["DBTDSTAT"][: len(self.channels)]
+
+    def get_parameter_block(
+        self,
+        category: str,
+        channel: int = 0,
+    ) -> Mapping[str, Optional[str | float | int]]:
+        """Decode (or return the cached) parameter block of a channel.
+
+        Args:
+            category: One of "DBTDSTAT", "DBTINSTR", "DBTAQPAR", "DBTPRCPAR",
+                      "DBTORGPAR" and "DBTFTPAR".
+            channel:  The channel index. Only relevant for "DBTDSTAT".
+
+        Returns:
+            A read-only mapping of the parameters in the block."""
+
+        if category not in _PARAMETER_BLOCK_CATEGORIES:
+            raise ValueError(f"Unknown parameter block category: {category}")
+        if not (0 <= channel < len(self.channels)):
+            raise ValueError(f"Channel {channel} does not exist in this file")
+
+        index = self._block_indices[category][channel if category == "DBTDSTAT" else 0]
+        block = self._blocks.get(index)
+        if block is None:
+            if self._file.closed:
+                raise ValueError("The file handle has already been closed")
+            block = MappingProxyType(
+                utils.read_raw_opus_parameter_block(self._file, self.directory[index]).data
+            )
+            self._blocks[index] = block
+        return block
+
+    @property
+    def measurement_times(self) -> list[datetime.datetime]:
+        """The measurement time of each channel. Only decodes the "DBTDSTAT"
+        and "DBTINSTR" blocks."""
+
+        return [c.measurement_time for c in self.channels]
+
+    def read_interferogram(self) -> npt.NDArray[np.float64]:
+        """Read the scaled `(channels, NPT)` interferogram."""
+
+        return utils.read_interferogram(
+            self._file,
+            channel_parameters=self.to_opus_file().channel_parameters,
+            ifg_opus_dirs=[self.directory[i] for i in self.interferogram_block_indices],
+            read_all_channels=self.read_all_channels,
+            spectrum_opus_dirs=[self.directory[i] for i in self.spectrum_block_indices],
+        )
+
+    def to_opus_file(self) -> OpusFile:
+        """Decode all remaining blocks and convert them into an `OpusFile`
+        object without interferogram."""
+
+        return OpusFileMetadata(
+            header=self.raw_header,
+            directory=self.directory,
+            channel_parameters=[
+                {k: dict(self.get_parameter_block(k, i)) for k in _PARAMETER_BLOCK_CATEGORIES}
+                for i in range(len(self.channels))
             ],
-            interferogram=interferogram,
+            interferogram_block_indices=self.interferogram_block_indices,
+            spectrum_block_indices=self.spectrum_block_indices,
+        ).to_opus_file(self.measurement_timestamp_mode)
+
+    def close(self) -> None:
+        """Close the underlying file. Blocks decoded before remain accessible."""
+
+        self._file.close()
+
+    def __enter__(self) -> OpusFileHandle:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class OpusChannelHandle:
+    """The lazily decoded parameter blocks of a single channel of an
+    `OpusFileHandle`. The attribute names match `types.OpusChannelParameters`."""
+
+    def __init__(self, handle: OpusFileHandle, channel: int) -> None:
+        self.handle = handle
+        self.channel = channel
+
+    @property
+    def spectrum(self) -> Mapping[str, Any]:
+        return self.handle.get_parameter_block("DBTDSTAT", self.channel)
+
+    @property
+    def instrument(self) -> Mapping[str, Any]:
+        return self.handle.get_parameter_block("DBTINSTR", self.channel)
+
+    @property
+    def acquisition(self) -> Mapping[str, Any]:
+        return self.handle.get_parameter_block("DBTAQPAR", self.channel)
+
+    @property
+    def optics(self) -> Mapping[str, Any]:
+        return self.handle.get_parameter_block("DBTPRCPAR", self.channel)
+
+    @property
+    def sample(self) -> Mapping[str, Any]:
+        return self.handle.get_parameter_block("DBTORGPAR", self.channel)
+
+    @property
+    def fourier_transform(self) -> Mapping[str, Any]:
+        return self.handle.get_parameter_block("DBTFTPAR", self.channel)
+
+    @property
+    def measurement_time(self) -> datetime.datetime:
+        return types.parse_measurement_datetime(
+            self.spectrum, self.instrument, self.handle.measurement_timestamp_mode
+        )
+
+
+class OpusReadResult(pydantic.BaseModel):
+    """The result of reading a single OPUS file with `read_many`. Exactly one
+    of `opus_file` and `error` is set."""
+
+    filepath: str
+    opus_file: Optional[OpusFile] = None
+    error: Optional[str] = None
+
+
+def _read_opus_file_in_worker(
+    filepath: str,
+    measurement_timestamp_mode: Literal["start", "end"],
+    interferogram_mode: Literal["skip", "validate", "read"],
+    read_all_channels: bool,
+    shared_memory_name: Optional[str],
+) -> tuple[Optional[OpusFile], Optional[tuple[int, ...]], Optional[str]]:
+    """Read an OPUS file and write its scaled interferogram into the shared
+    memory block allocated by the parent process.
+
+    Returns the OpusFile without interferogram, the shape of the interferogram
+    in the shared memory and an error message if reading failed."""
+
+    try:
+        opus_file = OpusFile.read(
+            filepath,
+            measurement_timestamp_mode=measurement_timestamp_mode,
+            interferogram_mode="map" if interferogram_mode == "read" else interferogram_mode,
+            read_all_channels=read_all_channels,
+        )
+        if interferogram_mode != "read":
+            return opus_file, None, None
+
+        assert opus_file.raw_interferogram is not None
+        assert opus_file.interferogram_scaling_factors is not None
+        if shared_memory_name is None:
+            raise RuntimeError("No shared memory block has been allocated for this file")
+
+        shape = opus_file.raw_interferogram.shape
+        shm = shared_memory.SharedMemory(name=shared_memory_name)
+        try:
+            interferogram: npt.NDArray[np.float64] = np.ndarray(
+                shape, dtype=np.float64, buffer=shm.buf
+            )
+            np.multiply(
+                opus_file.raw_interferogram,
+                opus_file.interferogram_scaling_factors[:, np.newaxis],
+                out=interferogram,
+            )
+            del interferogram
+        finally:
+            shm.close()
+
+        return (
+            opus_file.model_copy(
+                update={"raw_interferogram": None, "interferogram_scaling_factors": None}
+            ),
+            shape,
+            None,
         )
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+
+
+def _collect_read_result(
+    filepath: str,
+    shm: Optional[shared_memory.SharedMemory],
+    future: concurrent.futures.Future[
+        tuple[Optional[OpusFile], Optional[tuple[int, ...]], Optional[str]]
+    ],
+) -> OpusReadResult:
+    """Turn a finished worker future into a result object and release its shared memory."""
+
+    try:
+        opus_file, shape, error = future.result()
+        if error is not None:
+            return OpusReadResult(filepath=filepath, error=error)
+        assert opus_file is not None
+        if shape is not None:
+            assert shm is not None
+            shared_interferogram: npt.NDArray[np.float64] = np.ndarray(
+                shape, dtype=np.float64, buffer=shm.buf
+            )
+            opus_file.interferogram = shared_interferogram.copy()
+            del shared_interferogram
+        return OpusReadResult(filepath=filepath, opus_file=opus_file)
+    except Exception as e:
+        return OpusReadResult(filepath=filepath, error=f"{type(e).__name__}: {e}")
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+def read_many(
+    filepaths: list[str],
+    workers: Optional[int] = None,
+    measurement_timestamp_mode: Literal["start", "end"] = "start",
+    interferogram_mode: Literal["skip", "validate", "read"] = "read",
+    read_all_channels: bool = True,
+    ordered: bool = True,
+) -> Generator[OpusReadResult, None, None]:
+    """Read many OPUS files in parallel using a process pool.
+
+    Failures do not abort the batch but are returned as results with an
+    `error` message. In "read" mode, the interferograms are written into
+    shared memory blocks by the worker processes instead of being pickled.
+    At most `2 * workers` files are in flight at any time, so memory usage
+    stays bounded even when the results are consumed slowly.
+
+    ```python
+    for result in tum_esm_utils.opus.read_many(filepaths, workers=8):
+        if result.error is not None:
+            print(f"Could not read {result.filepath}: {result.error}")
+    ```
+
+    Args:
+        filepaths:                  Paths to the OPUS files.
+        workers:                    Number of worker processes. Defaults to the
+                                    number of CPUs.
+        measurement_timestamp_mode: See `OpusFile.read`.
+        interferogram_mode:         See `OpusFile.read`. The "map" mode is not
+                                    supported because memory maps cannot be
+                                    shared with the parent process.
+        read_all_channels:          See `OpusFile.read`.
+        ordered:                    Whether to yield the results in the order of
+                                    `filepaths` or as soon as they are ready.
+
+    Returns:
+        A generator of `OpusReadResult` objects, one per file."""
+
+    max_workers = workers if workers is not None else (os.cpu_count() or 1)
+    if max_workers < 1:
+        raise ValueError("The number of workers must be at least 1")
+    max_in_flight = 2 * max_workers
+
+    pending: collections.OrderedDict[
+        concurrent.futures.Future[
+            tuple[Optional[OpusFile], Optional[tuple[int, ...]], Optional[str]]
+        ],
+        tuple[str, Optional[shared_memory.SharedMemory]],
+    ] = collections.OrderedDict()
+    filepath_iterator = iter(filepaths)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+
+    try:
+        while True:
+            # keep the pool busy without allocating memory for all files at once
+            for filepath in filepath_iterator:
+                shm: Optional[shared_memory.SharedMemory] = None
+                if interferogram_mode == "read":
+                    # the float64 interferogram takes at most twice the
+                    # space of the float32 values stored in the file
+                    try:
+                        shm = shared_memory.SharedMemory(
+                            create=True, size=max(2 * os.path.getsize(filepath), 1)
+                        )
+                    except OSError:
+                        shm = None
+                future = executor.submit(
+                    _read_opus_file_in_worker,
+                    filepath,
+                    measurement_timestamp_mode,
+                    interferogram_mode,
+                    read_all_channels,
+                    None if shm is None else shm.name,
+                )
+                pending[future] = (filepath, shm)
+                if len(pending) >= max_in_flight:
+                    break
+
+            if len(pending) == 0:
+                break
+
+            if ordered:
+                future = next(iter(pending))
+                concurrent.futures.wait([future])
+                done = [future]
+            else:
+                done_set, _ = concurrent.futures.wait(
+                    list(pending.keys()), return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                done = [f for f in pending.keys() if f in done_set]
+
+            for future in done:
+                filepath, shm = pending.pop(future)
+                yield _collect_read_result(filepath, shm, future)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for _, shm in pending.values():
+            if shm is not None:
+                shm.close()
+                shm.unlink()
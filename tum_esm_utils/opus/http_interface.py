@@ -1,11 +1,480 @@
 """Provides a HTTP interface to OPUS."""
 
 from __future__ import annotations
-from typing import Literal, Optional
+from typing import Any, Literal, Optional
+import asyncio
+import bisect
+import concurrent.futures
 import os
+import socket
+import threading
 import time
+import pydantic
 import tenacity
 
+# some common functions executed inside Macro routines that take some time
+_COMMON_MACRO_FUNCTIONS = [
+    "MeasureReference",
+    "MeasureSample",
+    "MeasureRepeated",
+    "MeasureRapidTRS",
+    "MeasureStepScanTrans",
+    "UserDialog",
+    "Baseline",
+    "PeakPick",
+    "Timer",
+    "SendCommand",
+]
+
+
+def _encode_request(request: str, host: str) -> bytes:
+    url = f"/OpusCommand.htm?{request.replace(' ', '%20')}"
+    return f"GET {url}\r\nHost: {host}\r\n\r\n".encode("utf-8")
+
+
+def _parse_answer(raw_answer: bytes, expect_ok: bool) -> list[str]:
+    """Split the raw answer of OPUS into its non-empty lines."""
+
+    # OPUS always answers something, so an empty answer means that the
+    # connection has been closed before OPUS could answer
+    if len(raw_answer) == 0:
+        raise ConnectionError("Invalid response from OPUS HTTP interface: no answer")
+
+    answer_lines: Optional[list[str]] = None
+    try:
+        answer = raw_answer.decode("utf-8").strip("\r\n\t ")
+        answer_lines = [l.strip(" \r\t") for l in answer.split("\n")]
+        answer_lines = [l for l in answer_lines if len(l) > 0]
+        if expect_ok:
+            assert len(answer_lines) >= 1
+            assert answer_lines[0] == "OK"
+        return answer_lines
+    except:
+        raise ConnectionError(
+            "Invalid response from OPUS HTTP interface: "
+            + ("no answer" if answer_lines is None else str(answer_lines))
+        )
+
+
+def _parse_active_thread_ids(answers: list[list[str]]) -> set[int]:
+    """Collect the thread IDs from the answers of `FIND_FUNCTION` requests."""
+
+    active_thread_ids: set[int] = set()
+    for answer in answers:
+        try:
+            if answer[0] == "OK":
+                for thread_id in answer[1:]:
+                    active_thread_ids.add(int(thread_id))
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+    return active_thread_ids
+
+
+class OpusParameterResults(pydantic.BaseModel):
+    """The result of `read_parameters` or `write_parameters`. Every requested
+    parameter is either in `values` or in `errors`."""
+
+    values: dict[str, str] = {}
+    errors: dict[str, str] = {}
+
+
+def _collect_parameter_results(
+    parameters: dict[str, str],
+    answers: list[list[str] | ConnectionError],
+    read: bool,
+) -> OpusParameterResults:
+    """Sort the answers to `READ_PARAMETER` or `WRITE_PARAMETER` requests
+    into values and errors. `parameters` maps the parameter names to the
+    written values (ignored when reading)."""
+
+    results = OpusParameterResults()
+    for (parameter, value), answer in zip(parameters.items(), answers):
+        if isinstance(answer, ConnectionError):
+            results.errors[parameter] = str(answer)
+        elif len(answer) < (2 if read else 1) or answer[0] != "OK":
+            results.errors[parameter] = f"Invalid response from OPUS HTTP interface: {answer}"
+        else:
+            results.values[parameter] = answer[1] if read else value
+    return results
+
+
+class OpusHTTPClient:
+    """Client for the HTTP interface of a single OPUS instance.
+
+    OPUS answers every request without any framing headers and closes the
+    connection after the answer has been sent, so connections cannot be
+    reused. The client reads each answer until OPUS closes the connection
+    instead of expecting it in a single packet.
+
+    OPUS answers one request at a time, so by default, the requests of
+    `request_many` are sent one after another and cost one round trip each.
+    With a higher `max_connections`, they are sent over concurrent
+    connections, which only saves time if the server answers requests in
+    parallel.
+
+    The client holds no connection state and can be shared between threads.
+    It only remembers the last parameter mode set through it, so that
+    `read_parameters` and `write_parameters` do not have to set it again.
+
+    Args:
+        host:            The host running OPUS.
+        port:            The port of the OPUS HTTP interface.
+        timeout:         The time to wait for each answer.
+        retry_attempts:  How often `request` tries to send a request.
+        retry_wait:      The time to wait between two attempts.
+        max_connections: The maximum number of concurrent connections used
+                         by `request_many`.
+
+    Raises:
+        ConnectionError: If the connection to the OPUS HTTP interface fails or
+                         if the response is invalid.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 80,
+        timeout: float = 10.0,
+        retry_attempts: int = 3,
+        retry_wait: float = 5.0,
+        max_connections: int = 1,
+    ) -> None:
+        if retry_attempts < 1:
+            raise ValueError("retry_attempts must be at least 1")
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retry_attempts = retry_attempts
+        self.retry_wait = retry_wait
+        self.max_connections = max_connections
+        self.parameter_mode: Optional[Literal["file", "opus"]] = None
+
+    def request_without_retry(
+        self,
+        request: str,
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[str]:
+        """Send a request to the OPUS HTTP interface and return the answer.
+
+        Commands will be sent to `GET http://<host>:<port>/OpusCommand.htm?<request>`.
+
+        Args:
+            request:    The request to send.
+            expect_ok:  Whether the first line of the answer should be "OK".
+            timeout:    The time to wait for the answer. Defaults to the
+                        timeout of the client.
+
+        Returns:
+            The answer lines.
+        """
+
+        chunks: list[bytes] = []
+        try:
+            with socket.create_connection(
+                (self.host, self.port), timeout=self.timeout if timeout is None else timeout
+            ) as s:
+                s.sendall(_encode_request(request, self.host))
+                while True:
+                    chunk = s.recv(65536)
+                    if len(chunk) == 0:
+                        break
+                    chunks.append(chunk)
+        except OSError:
+            # a timeout or reset before OPUS closed the connection can truncate the answer
+            raise ConnectionError(
+                "Invalid response from OPUS HTTP interface: "
+                + ("no answer" if len(chunks) == 0 else "incomplete answer")
+            )
+        return _parse_answer(b"".join(chunks), expect_ok)
+
+    def request(
+        self,
+        request: str,
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[str]:
+        """Like `request_without_retry`, but retries the request on a
+        `ConnectionError` (`retry_attempts` times, waiting `retry_wait`
+        seconds inbetween)."""
+
+        for attempt in tenacity.Retrying(
+            retry=tenacity.retry_if_exception_type(ConnectionError),
+            reraise=True,
+            stop=tenacity.stop_after_attempt(self.retry_attempts),
+            wait=tenacity.wait_fixed(self.retry_wait),
+        ):
+            with attempt:
+                return self.request_without_retry(request, expect_ok=expect_ok, timeout=timeout)
+        raise ConnectionError("Invalid response from OPUS HTTP interface: no answer")
+
+    def request_many(
+        self,
+        requests: list[str],
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[list[str]]:
+        """Send multiple independent requests (with retries) over up to
+        `max_connections` concurrent connections and return their answers
+        in the same order.
+
+        Do not use this for commands that depend on each other, because OPUS
+        may process them in any order.
+
+        Args:
+            requests:   The requests to send.
+            expect_ok:  Whether the first line of each answer should be "OK".
+            timeout:    The time to wait for each answer. Defaults to the
+                        timeout of the client.
+
+        Returns:
+            The answer lines of each request.
+        """
+
+        answers: list[list[str]] = []
+        for answer in self._request_many_or_errors(requests, expect_ok, timeout):
+            if isinstance(answer, ConnectionError):
+                raise answer
+            answers.append(answer)
+        return answers
+
+    def _request_many_or_errors(
+        self,
+        requests: list[str],
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[list[str] | ConnectionError]:
+        """Like `request_many`, but returns the `ConnectionError` of failed
+        requests instead of raising it."""
+
+        def request_or_error(request: str) -> list[str] | ConnectionError:
+            try:
+                return self.request(request, expect_ok=expect_ok, timeout=timeout)
+            except ConnectionError as e:
+                return e
+
+        if len(requests) <= 1:
+            return [request_or_error(r) for r in requests]
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(self.max_connections, len(requests))
+        ) as executor:
+            return list(executor.map(request_or_error, requests))
+
+    def get_version(self) -> str:
+        """Get the version number, like `20190310`."""
+        answer = self.request("GET_VERSION")
+        try:
+            return answer[0]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def get_version_extended(self) -> str:
+        """Get the extended version number, like `8.2 Build: 8, 2, 28 20190310`."""
+        answer = self.request("GET_VERSION_EXTENDED")
+        try:
+            return answer[0]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def is_working(self) -> bool:
+        """Check if the OPUS HTTP interface is working. Does NOT raise a
+        `ConnectionError` but only returns `True` or `False`."""
+        try:
+            answer = self.request("COMMAND_SAY hello")
+            assert answer[0] == "hello"
+            return True
+        except:
+            return False
+
+    def get_main_thread_id(self) -> int:
+        """Get the process ID of the main thread of OPUS."""
+        answer = self.request("FIND_FUNCTION 0", expect_ok=True)
+        try:
+            return int(answer[1])
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def some_macro_is_running(self, check_interval: float = 0.5) -> bool:
+        """Check if any macro is currently running.
+
+        Looks for threads other than the main thread that execute a function
+        commonly used in macros. The `FIND_FUNCTION` requests of one check
+        are sent with `request_many`. The check is done twice,
+        `check_interval` seconds apart, to catch macros that are between two
+        functions. In total, it takes `check_interval` seconds plus 21 round
+        trips, or fewer with a higher `max_connections` if the server answers
+        requests in parallel. The default interval is shorter than the 3
+        seconds of the static `OpusHTTPInterface.some_macro_is_running`; pass
+        `check_interval=3` for the same behavior.
+
+        In theory, we could also check whether the correct macro is running using
+        `READ_PARAMETER MPT` and `READ_PARAMETER MFN`. However, these variables do
+        not seem to be updated right away, so we cannot rely on them."""
+
+        requests = [f"FIND_FUNCTION {function}" for function in _COMMON_MACRO_FUNCTIONS]
+        answers = self.request_many(["FIND_FUNCTION 0", *requests])
+        try:
+            assert answers[0][0] == "OK"
+            main_thread_id = int(answers[0][1])
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answers[0]}")
+        active_thread_ids = _parse_active_thread_ids(answers[1:])
+        time.sleep(check_interval)
+        active_thread_ids.update(_parse_active_thread_ids(self.request_many(requests)))
+
+        # the main thread always runs some common functions for some reason
+        active_thread_ids.discard(main_thread_id)
+
+        # if there is any thread that is not the main thread, then a macro is running
+        return len(active_thread_ids) > 0
+
+    def get_loaded_experiment(self) -> str:
+        """Get the path to the currently loaded experiment."""
+        results = self.read_parameters(["XPP", "EXP"], mode="opus")
+        if len(results.errors) > 0:
+            raise ConnectionError(next(iter(results.errors.values())))
+        return os.path.join(results.values["XPP"], results.values["EXP"])
+
+    def load_experiment(self, experiment_path: str) -> None:
+        """Load an experiment file."""
+        self.request(f"LOAD_EXPERIMENT {experiment_path}", expect_ok=True)
+
+    def start_macro(self, macro_path: str) -> int:
+        """Start a macro. Returns the macro ID."""
+        answer = self.request(f"RUN_MACRO {macro_path}", expect_ok=True)
+        try:
+            return int(answer[1])
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def macro_is_running(self, macro_id: int) -> bool:
+        """Check if the given macro is running. See `OpusHTTPInterface.macro_is_running`."""
+        answer = self.request(f"MACRO_RESULTS {macro_id}", expect_ok=True)
+        try:
+            return int(answer[1]) == 0
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def stop_macro(self, macro_path_or_id: str | int) -> None:
+        """Stop a macro given by its path or ID. See `OpusHTTPInterface.stop_macro`."""
+        if isinstance(macro_path_or_id, int):
+            self.request(f"KILL_MACRO {macro_path_or_id}", expect_ok=True)
+        else:
+            self.request(f"KILL_MACRO {os.path.basename(macro_path_or_id)}", expect_ok=True)
+
+    def unload_all_files(self) -> None:
+        """Unload all files. This should be done before closing it."""
+        self.command_line("UnloadAll()")
+
+    def close_opus(self) -> None:
+        """Close OPUS."""
+        self.request("CLOSE_OPUS", expect_ok=True)
+
+    def set_parameter_mode(self, variant: Literal["file", "opus"]) -> None:
+        """Set the parameter mode to `FILE_PARAMETERS` or `OPUS_PARAMETERS`."""
+        self.parameter_mode = None
+        self.request(f"{variant.upper()}_PARAMETERS", expect_ok=True)
+        self.parameter_mode = variant
+
+    def read_parameter(self, parameter: str) -> str:
+        """Read the value of a parameter."""
+        answer = self.request(f"READ_PARAMETER {parameter}", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def write_parameter(self, parameter: str, value: str | int | float) -> None:
+        """Update the value of a parameter."""
+        self.request(f"WRITE_PARAMETER {parameter} {value}", expect_ok=True)
+
+    def read_parameters(
+        self,
+        parameters: list[str],
+        mode: Optional[Literal["file", "opus"]] = None,
+    ) -> OpusParameterResults:
+        """Read the values of many parameters with `request_many`. This takes
+        one round trip per parameter, or one per `max_connections`
+        parameters if the server answers requests in parallel.
+
+        ```python
+        results = client.read_parameters(["NSS", "RES", "APT"], mode="opus")
+        print(results.values)  # {"NSS": "10", "RES": "0.5", "APT": "0.5 mm"}
+        print(results.errors)  # {}
+        ```
+
+        A parameter that cannot be read does not fail the whole call but
+        ends up in `errors`. Answers of OPUS other than "OK" are not retried.
+
+        Args:
+            parameters: The names of the parameters.
+            mode:       The parameter mode to read from. It is only set if the
+                        client has not set it before; `None` keeps the
+                        current mode of OPUS.
+
+        Returns:
+            The values and errors per parameter.
+        """
+
+        if mode is not None and mode != self.parameter_mode:
+            self.set_parameter_mode(mode)
+        parameters = list(dict.fromkeys(parameters))
+        answers = self._request_many_or_errors([f"READ_PARAMETER {p}" for p in parameters])
+        return _collect_parameter_results({p: "" for p in parameters}, answers, read=True)
+
+    def write_parameters(
+        self,
+        values: dict[str, str | int | float],
+        mode: Optional[Literal["file", "opus"]] = None,
+    ) -> OpusParameterResults:
+        """Update the values of many parameters with `request_many`. Works like
+        `read_parameters`; `values` of the result contains the written
+        values of the successfully updated parameters."""
+
+        if mode is not None and mode != self.parameter_mode:
+            self.set_parameter_mode(mode)
+        answers = self._request_many_or_errors(
+            [f"WRITE_PARAMETER {p} {v}" for p, v in values.items()]
+        )
+        return _collect_parameter_results(
+            {p: str(v) for p, v in values.items()}, answers, read=False
+        )
+
+    def get_language(self) -> str:
+        """Get the current language."""
+        answer = self.request("GET_LANGUAGE", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def get_username(self) -> str:
+        """Get the current username."""
+        answer = self.request("GET_USERNAME", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def get_path(self, literal: Literal["opus", "base", "data", "work"]) -> str:
+        """Get the path to the given directory."""
+        answer = self.request(f"GET_{literal.upper()}PATH", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    def set_processing_mode(self, mode: Literal["command", "execute", "request"]) -> None:
+        """Set the processing mode to `COMMAND_MODE`, `EXECUTE_MODE`, or `REQUEST_MODE`."""
+        self.request(f"SET_{mode.upper()}_MODE", expect_ok=True)
+
+    def command_line(self, command: str) -> Optional[str]:
+        """Execute a command line command, i.e. `COMMAND_LINE <command>`."""
+        answer = self.request(f"COMMAND_LINE {command}", expect_ok=True)
+        return None if len(answer) == 1 else answer[1]
+
 
 class OpusHTTPInterface:
     """Interface to the OPUS HTTP interface.
@@ -14,11 +483,18 @@ class OpusHTTPInterface:
     return valid HTTP/1 or HTTP/2 headers. It opens and closes a new socket
     because OPUS closes the socket after the answer has been sent.
 
+    All methods talk to OPUS on `localhost:80`. Use `OpusHTTPClient` to
+    connect to another host or port. The static methods share one client,
+    so `read_parameters` and `write_parameters` only set the parameter mode
+    when it differs from the last one set through the static methods.
+
     Raises:
         ConnectionError: If the connection to the OPUS HTTP interface fails or
                          if the response is invalid.
     """
 
+    _client = OpusHTTPClient()
+
     @staticmethod
     @tenacity.retry(
         retry=tenacity.retry_if_exception_type(ConnectionError),
@@ -69,28 +545,7 @@ class OpusHTTPInterface:
             The answer lines.
         """
 
-        import socket
-
-        answer_lines: Optional[list[str]] = None
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(timeout)
-            s.connect(("localhost", 80))
-            url = f"/OpusCommand.htm?{request.replace(' ', '%20')}"
-            s.sendall(f"GET {url}\r\nHost: localhost\r\n\r\n".encode("utf-8"))
-            answer = s.recv(4096).decode("utf-8").strip("\r\n\t ")
-            answer_lines = [l.strip(" \r\t") for l in answer.split("\n")]
-            answer_lines = [l for l in answer_lines if len(l) > 0]
-            if expect_ok:
-                assert len(answer_lines) >= 1
-                assert answer_lines[0] == "OK"
-            s.close()
-            return answer_lines
-        except:
-            raise ConnectionError(
-                "Invalid response from OPUS HTTP interface: "
-                + ("no answer" if answer_lines is None else str(answer_lines))
-            )
+        return OpusHTTPClient(timeout=timeout).request_without_retry(request, expect_ok=expect_ok)
 
     @staticmethod
     def get_version() -> str:
@@ -131,49 +586,19 @@ class OpusHTTPInterface:
             raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
 
     @staticmethod
-    def some_macro_is_running() -> bool:
+    def some_macro_is_running(check_interval: float = 3.0) -> bool:
         """Check if any macro is currently running.
 
+        The `FIND_FUNCTION` requests are sent one after another. The check is
+        done twice, `check_interval` seconds apart, to catch macros that are
+        between two functions, so it takes `check_interval` seconds plus 21
+        round trips.
+
         In theory, we could also check whether the correct macro is running using
         `READ_PARAMETER MPT` and `READ_PARAMETER MFN`. However, these variables do
         not seem to be updated right away, so we cannot rely on them."""
 
-        main_thread_id = OpusHTTPInterface.get_main_thread_id()
-        active_thread_ids: set[int] = set()
-
-        # some common functions executed inside Macro routines that take some time
-        common_functions = [
-            "MeasureReference",
-            "MeasureSample",
-            "MeasureRepeated",
-            "MeasureRapidTRS",
-            "MeasureStepScanTrans",
-            "UserDialog",
-            "Baseline",
-            "PeakPick",
-            "Timer",
-            "SendCommand",
-        ]
-
-        # check twice for any thread that is executing a common function
-        for i in range(2):
-            for function in common_functions:
-                answer = OpusHTTPInterface.request(f"FIND_FUNCTION {function}")
-                try:
-                    if answer[0] == "OK":
-                        for thread_id in answer[1:]:
-                            active_thread_ids.add(int(thread_id))
-                except:
-                    raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
-            if i == 0:
-                time.sleep(3)
-
-        # the main thread always runs some common functions for some reason
-        if main_thread_id in active_thread_ids:
-            active_thread_ids.remove(main_thread_id)
-
-        # if there is any thread that is not the main thread, then a macro is running
-        return len(active_thread_ids) > 0
+        return OpusHTTPInterface._client.some_macro_is_running(check_interval=check_interval)
 
     @staticmethod
     def get_loaded_experiment() -> str:
@@ -236,7 +661,7 @@ class OpusHTTPInterface:
     @staticmethod
     def set_parameter_mode(variant: Literal["file", "opus"]) -> None:
         """Set the parameter mode to `FILE_PARAMETERS` or `OPUS_PARAMETERS`."""
-        OpusHTTPInterface.request(f"{variant.upper()}_PARAMETERS", expect_ok=True)
+        OpusHTTPInterface._client.set_parameter_mode(variant)
 
     @staticmethod
     def read_parameter(parameter: str) -> str:
@@ -252,6 +677,24 @@ class OpusHTTPInterface:
         """Update the value of a parameter."""
         OpusHTTPInterface.request(f"WRITE_PARAMETER {parameter} {value}", expect_ok=True)
 
+    @staticmethod
+    def read_parameters(
+        parameters: list[str],
+        mode: Optional[Literal["file", "opus"]] = None,
+    ) -> OpusParameterResults:
+        """Read the values of many parameters, one round trip per parameter.
+        See `OpusHTTPClient.read_parameters`."""
+        return OpusHTTPInterface._client.read_parameters(parameters, mode=mode)
+
+    @staticmethod
+    def write_parameters(
+        values: dict[str, str | int | float],
+        mode: Optional[Literal["file", "opus"]] = None,
+    ) -> OpusParameterResults:
+        """Update the values of many parameters, one round trip per parameter.
+        See `OpusHTTPClient.write_parameters`."""
+        return OpusHTTPInterface._client.write_parameters(values, mode=mode)
+
     @staticmethod
     def get_language() -> str:
         """Get the current language."""
@@ -289,3 +732,544 @@ class OpusHTTPInterface:
         """Execute a command line command, i.e. `COMMAND_LINE <command>`."""
         answer = OpusHTTPInterface.request(f"COMMAND_LINE {command}", expect_ok=True)
         return None if len(answer) == 1 else answer[1]
+
+
+class AsyncOpusHTTPInterface:
+    """Asynchronous interface to the HTTP interface of a single OPUS instance.
+
+    Offers the same commands as `OpusHTTPClient`, but uses `asyncio` streams
+    and waits between retries without blocking the event loop, so a single
+    event loop can control many OPUS instances at once. Like the client, it
+    sends the requests of `request_many` one after another by default.
+
+    ```python
+    async def main() -> None:
+        interfaces = [AsyncOpusHTTPInterface(host=h) for h in ["10.0.0.1", "10.0.0.2"]]
+        versions = await asyncio.gather(*[i.get_version() for i in interfaces])
+    ```
+
+    Args:
+        host:            The host running OPUS.
+        port:            The port of the OPUS HTTP interface.
+        timeout:         The time to wait for each answer.
+        retry_attempts:  How often `request` tries to send a request.
+        retry_wait:      The time to wait before the first retry. The time
+                         doubles with every further retry.
+        max_retry_wait:  The maximum time to wait between two retries.
+        max_connections: The maximum number of concurrent connections used
+                         by `request_many`.
+
+    Raises:
+        ConnectionError: If the connection to the OPUS HTTP interface fails or
+                         if the response is invalid.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 80,
+        timeout: float = 10.0,
+        retry_attempts: int = 3,
+        retry_wait: float = 1.0,
+        max_retry_wait: float = 10.0,
+        max_connections: int = 1,
+    ) -> None:
+        if retry_attempts < 1:
+            raise ValueError("retry_attempts must be at least 1")
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retry_attempts = retry_attempts
+        self.retry_wait = retry_wait
+        self.max_retry_wait = max_retry_wait
+        self.max_connections = max_connections
+        self.parameter_mode: Optional[Literal["file", "opus"]] = None
+
+    async def request_without_retry(
+        self,
+        request: str,
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[str]:
+        """Send a request to the OPUS HTTP interface and return the answer.
+
+        Commands will be sent to `GET http://<host>:<port>/OpusCommand.htm?<request>`.
+
+        Args:
+            request:    The request to send.
+            expect_ok:  Whether the first line of the answer should be "OK".
+            timeout:    The time to wait for the answer. Defaults to the
+                        timeout of the interface.
+
+        Returns:
+            The answer lines.
+        """
+
+        async def send_request() -> bytes:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                writer.write(_encode_request(request, self.host))
+                await writer.drain()
+                return await reader.read()
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+        try:
+            raw_answer = await asyncio.wait_for(
+                send_request(), timeout=self.timeout if timeout is None else timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            raise ConnectionError("Invalid response from OPUS HTTP interface: no answer")
+        return _parse_answer(raw_answer, expect_ok)
+
+    async def request(
+        self,
+        request: str,
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[str]:
+        """Like `request_without_retry`, but retries the request on a
+        `ConnectionError` with an exponential backoff."""
+
+        async for attempt in tenacity.AsyncRetrying(
+            retry=tenacity.retry_if_exception_type(ConnectionError),
+            reraise=True,
+            stop=tenacity.stop_after_attempt(self.retry_attempts),
+            wait=tenacity.wait_exponential(multiplier=self.retry_wait, max=self.max_retry_wait),
+        ):
+            with attempt:
+                return await self.request_without_retry(
+                    request, expect_ok=expect_ok, timeout=timeout
+                )
+        raise ConnectionError("Invalid response from OPUS HTTP interface: no answer")
+
+    async def request_many(
+        self,
+        requests: list[str],
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[list[str]]:
+        """Send multiple independent requests (with retries) over up to
+        `max_connections` concurrent connections and return their answers
+        in the same order. See `OpusHTTPClient.request_many`."""
+
+        answers: list[list[str]] = []
+        for answer in await self._request_many_or_errors(requests, expect_ok, timeout):
+            if isinstance(answer, ConnectionError):
+                raise answer
+            answers.append(answer)
+        return answers
+
+    async def _request_many_or_errors(
+        self,
+        requests: list[str],
+        expect_ok: bool = False,
+        timeout: Optional[float] = None,
+    ) -> list[list[str] | ConnectionError]:
+        """Like `request_many`, but returns the `ConnectionError` of failed
+        requests instead of raising it."""
+
+        semaphore = asyncio.Semaphore(self.max_connections)
+
+        async def limited_request(r: str) -> list[str] | ConnectionError:
+            async with semaphore:
+                try:
+                    return await self.request(r, expect_ok=expect_ok, timeout=timeout)
+                except ConnectionError as e:
+                    return e
+
+        return list(await asyncio.gather(*[limited_request(r) for r in requests]))
+
+    async def get_version(self) -> str:
+        """Get the version number, like `20190310`."""
+        answer = await self.request("GET_VERSION")
+        try:
+            return answer[0]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def get_version_extended(self) -> str:
+        """Get the extended version number, like `8.2 Build: 8, 2, 28 20190310`."""
+        answer = await self.request("GET_VERSION_EXTENDED")
+        try:
+            return answer[0]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def is_working(self) -> bool:
+        """Check if the OPUS HTTP interface is working. Does NOT raise a
+        `ConnectionError` but only returns `True` or `False`."""
+        try:
+            answer = await self.request("COMMAND_SAY hello")
+            assert answer[0] == "hello"
+            return True
+        except:
+            return False
+
+    async def get_main_thread_id(self) -> int:
+        """Get the process ID of the main thread of OPUS."""
+        answer = await self.request("FIND_FUNCTION 0", expect_ok=True)
+        try:
+            return int(answer[1])
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def some_macro_is_running(self, check_interval: float = 0.5) -> bool:
+        """Check if any macro is currently running. See
+        `OpusHTTPClient.some_macro_is_running`."""
+
+        requests = [f"FIND_FUNCTION {function}" for function in _COMMON_MACRO_FUNCTIONS]
+        answers = await self.request_many(["FIND_FUNCTION 0", *requests])
+        try:
+            assert answers[0][0] == "OK"
+            main_thread_id = int(answers[0][1])
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answers[0]}")
+        active_thread_ids = _parse_active_thread_ids(answers[1:])
+        await asyncio.sleep(check_interval)
+        active_thread_ids.update(_parse_active_thread_ids(await self.request_many(requests)))
+
+        # the main thread always runs some common functions for some reason
+        active_thread_ids.discard(main_thread_id)
+
+        # if there is any thread that is not the main thread, then a macro is running
+        return len(active_thread_ids) > 0
+
+    async def get_loaded_experiment(self) -> str:
+        """Get the path to the currently loaded experiment."""
+        results = await self.read_parameters(["XPP", "EXP"], mode="opus")
+        if len(results.errors) > 0:
+            raise ConnectionError(next(iter(results.errors.values())))
+        return os.path.join(results.values["XPP"], results.values["EXP"])
+
+    async def load_experiment(self, experiment_path: str) -> None:
+        """Load an experiment file."""
+        await self.request(f"LOAD_EXPERIMENT {experiment_path}", expect_ok=True)
+
+    async def start_macro(self, macro_path: str) -> int:
+        """Start a macro. Returns the macro ID."""
+        answer = await self.request(f"RUN_MACRO {macro_path}", expect_ok=True)
+        try:
+            return int(answer[1])
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def macro_is_running(self, macro_id: int) -> bool:
+        """Check if the given macro is running. See `OpusHTTPInterface.macro_is_running`."""
+        answer = await self.request(f"MACRO_RESULTS {macro_id}", expect_ok=True)
+        try:
+            return int(answer[1]) == 0
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def stop_macro(self, macro_path_or_id: str | int) -> None:
+        """Stop a macro given by its path or ID. See `OpusHTTPInterface.stop_macro`."""
+        if isinstance(macro_path_or_id, int):
+            await self.request(f"KILL_MACRO {macro_path_or_id}", expect_ok=True)
+        else:
+            await self.request(f"KILL_MACRO {os.path.basename(macro_path_or_id)}", expect_ok=True)
+
+    async def unload_all_files(self) -> None:
+        """Unload all files. This should be done before closing it."""
+        await self.command_line("UnloadAll()")
+
+    async def close_opus(self) -> None:
+        """Close OPUS."""
+        await self.request("CLOSE_OPUS", expect_ok=True)
+
+    async def set_parameter_mode(self, variant: Literal["file", "opus"]) -> None:
+        """Set the parameter mode to `FILE_PARAMETERS` or `OPUS_PARAMETERS`."""
+        self.parameter_mode = None
+        await self.request(f"{variant.upper()}_PARAMETERS", expect_ok=True)
+        self.parameter_mode = variant
+
+    async def read_parameter(self, parameter: str) -> str:
+        """Read the value of a parameter."""
+        answer = await self.request(f"READ_PARAMETER {parameter}", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def write_parameter(self, parameter: str, value: str | int | float) -> None:
+        """Update the value of a parameter."""
+        await self.request(f"WRITE_PARAMETER {parameter} {value}", expect_ok=True)
+
+    async def read_parameters(
+        self,
+        parameters: list[str],
+        mode: Optional[Literal["file", "opus"]] = None,
+    ) -> OpusParameterResults:
+        """Read the values of many parameters with `request_many`. See
+        `OpusHTTPClient.read_parameters`."""
+
+        if mode is not None and mode != self.parameter_mode:
+            await self.set_parameter_mode(mode)
+        parameters = list(dict.fromkeys(parameters))
+        answers = await self._request_many_or_errors([f"READ_PARAMETER {p}" for p in parameters])
+        return _collect_parameter_results({p: "" for p in parameters}, answers, read=True)
+
+    async def write_parameters(
+        self,
+        values: dict[str, str | int | float],
+        mode: Optional[Literal["file", "opus"]] = None,
+    ) -> OpusParameterResults:
+        """Update the values of many parameters with `request_many`. See
+        `OpusHTTPClient.write_parameters`."""
+
+        if mode is not None and mode != self.parameter_mode:
+            await self.set_parameter_mode(mode)
+        answers = await self._request_many_or_errors(
+            [f"WRITE_PARAMETER {p} {v}" for p, v in values.items()]
+        )
+        return _collect_parameter_results(
+            {p: str(v) for p, v in values.items()}, answers, read=False
+        )
+
+    async def get_language(self) -> str:
+        """Get the current language."""
+        answer = await self.request("GET_LANGUAGE", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def get_username(self) -> str:
+        """Get the current username."""
+        answer = await self.request("GET_USERNAME", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def get_path(self, literal: Literal["opus", "base", "data", "work"]) -> str:
+        """Get the path to the given directory."""
+        answer = await self.request(f"GET_{literal.upper()}PATH", expect_ok=True)
+        try:
+            return answer[1]
+        except:
+            raise ConnectionError(f"Invalid response from OPUS HTTP interface: {answer}")
+
+    async def set_processing_mode(self, mode: Literal["command", "execute", "request"]) -> None:
+        """Set the processing mode to `COMMAND_MODE`, `EXECUTE_MODE`, or `REQUEST_MODE`."""
+        await self.request(f"SET_{mode.upper()}_MODE", expect_ok=True)
+
+    async def command_line(self, command: str) -> Optional[str]:
+        """Execute a command line command, i.e. `COMMAND_LINE <command>`."""
+        answer = await self.request(f"COMMAND_LINE {command}", expect_ok=True)
+        return None if len(answer) == 1 else answer[1]
+
+
+class OpusLatencyHistogram:
+    """A histogram of durations with fixed buckets.
+
+    Args:
+        bucket_bounds: The upper bounds of the buckets in seconds in ascending
+                       order. Durations above the last bound are counted in an
+                       additional overflow bucket. Defaults to 1 ms, 2 ms,
+                       4 ms, ..., 16.4 s.
+    """
+
+    def __init__(self, bucket_bounds: Optional[list[float]] = None) -> None:
+        self.bucket_bounds = bucket_bounds or [0.001 * 2**i for i in range(15)]
+        if any(a >= b for a, b in zip(self.bucket_bounds[:-1], self.bucket_bounds[1:])):
+            raise ValueError("bucket_bounds must be in ascending order")
+        self.counts = [0] * (len(self.bucket_bounds) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, duration: float) -> None:
+        """Add a duration to the histogram."""
+        self.counts[bisect.bisect_left(self.bucket_bounds, duration)] += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
+
+    @property
+    def count(self) -> int:
+        """The number of recorded durations."""
+        return sum(self.counts)
+
+    @property
+    def mean(self) -> Optional[float]:
+        """The mean of all recorded durations."""
+        return None if self.count == 0 else self.total / self.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile (0 to 1) as the upper bound of the bucket it
+        falls into, e.g. `quantile(0.95)`."""
+
+        if not (0 <= q <= 1):
+            raise ValueError("q must be between 0 and 1")
+        if self.count == 0:
+            return None
+        cumulative_count = 0
+        for bucket_bound, count in zip(self.bucket_bounds, self.counts):
+            cumulative_count += count
+            if cumulative_count >= q * self.count and cumulative_count > 0:
+                return min(bucket_bound, self.maximum)
+        return self.maximum
+
+
+class _WatchedMacro:
+    def __init__(self, watch_time: float, next_poll: float) -> None:
+        self.future: concurrent.futures.Future[int] = concurrent.futures.Future()
+        self.interval_index = 0
+        self.next_poll = next_poll
+        self.last_running_time = watch_time
+
+
+class OpusMacroWatcher:
+    """Waits for many OPUS macros at once in a background thread.
+
+    ```python
+    client = OpusHTTPClient(host="10.0.0.1")
+    with OpusMacroWatcher(client) as watcher:
+        macro_id = client.start_macro("C:/macros/measure.mtx")
+        future = watcher.watch(macro_id)
+        future.add_done_callback(lambda f: print(f"macro {f.result()} has finished"))
+        future.result(timeout=600)
+    print(watcher.detection_latencies.quantile(0.95))
+    ```
+
+    Each macro is polled with `MACRO_RESULTS`, first after
+    `poll_intervals[0]` seconds, then with the next interval in
+    `poll_intervals` after each poll that finds it still running. Short
+    macros are detected quickly, while long macros do not flood OPUS with
+    requests. Due polls of different macros are sent over up to
+    `client.max_connections` concurrent connections.
+
+    `watch` returns a future that resolves to the macro ID once the macro
+    has finished, or fails with a `ConnectionError` if polling fails.
+    Cancelling the future stops watching the macro.
+
+    Two histograms help to tune `poll_intervals`: `request_latencies`
+    contains the duration of every `MACRO_RESULTS` request, and
+    `detection_latencies` contains the time between the last poll that
+    found a macro running and the poll that found it finished, i.e. an
+    upper bound of the delay until its completion was detected.
+
+    Args:
+        client:         The client used to poll OPUS.
+        poll_intervals: The intervals between polls of one macro in seconds.
+    """
+
+    def __init__(
+        self,
+        client: OpusHTTPClient,
+        poll_intervals: list[float] = [0.1, 0.2, 0.5, 1, 2, 5],
+    ) -> None:
+        if len(poll_intervals) == 0 or any(i < 0 for i in poll_intervals):
+            raise ValueError("poll_intervals must be a non-empty list of non-negative numbers")
+        self.client = client
+        self.poll_intervals = poll_intervals
+        self.request_latencies = OpusLatencyHistogram()
+        self.detection_latencies = OpusLatencyHistogram()
+
+        self._macros: dict[int, _WatchedMacro] = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=client.max_connections)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def watch(self, macro_id: int) -> concurrent.futures.Future[int]:
+        """Start watching a macro. Returns the same future when the macro
+        is already being watched."""
+
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("The watcher has been stopped")
+            if macro_id not in self._macros:
+                now = time.monotonic()
+                self._macros[macro_id] = _WatchedMacro(now, now + self.poll_intervals[0])
+                self._condition.notify()
+            return self._macros[macro_id].future
+
+    def watched_macro_ids(self) -> list[int]:
+        """The IDs of all macros that have not finished yet."""
+        with self._condition:
+            return list(self._macros.keys())
+
+    def stop(self) -> None:
+        """Stop the background thread and cancel all pending futures."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self._executor.shutdown()
+        for watched_macro in self._macros.values():
+            watched_macro.future.cancel()
+        self._macros.clear()
+
+    def __enter__(self) -> OpusMacroWatcher:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def _poll(self, macro_id: int) -> tuple[bool | ConnectionError, float]:
+        """Returns whether the macro is running (or the error) and the time
+        of the answer."""
+
+        t = time.monotonic()
+        try:
+            is_running: bool | ConnectionError = self.client.macro_is_running(macro_id)
+        except ConnectionError as e:
+            is_running = e
+        answer_time = time.monotonic()
+        with self._condition:
+            self.request_latencies.record(answer_time - t)
+        return is_running, answer_time
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    for macro_id in [i for i, m in self._macros.items() if m.future.cancelled()]:
+                        del self._macros[macro_id]
+                    now = time.monotonic()
+                    next_poll = min([m.next_poll for m in self._macros.values()], default=None)
+                    if next_poll is not None and next_poll <= now:
+                        break
+                    self._condition.wait(None if next_poll is None else next_poll - now)
+                due_macro_ids = [i for i, m in self._macros.items() if m.next_poll <= now]
+
+            results = list(self._executor.map(self._poll, due_macro_ids))
+
+            finished_macros: list[tuple[int, _WatchedMacro, bool | ConnectionError]] = []
+            with self._condition:
+                for macro_id, (is_running, answer_time) in zip(due_macro_ids, results):
+                    watched_macro = self._macros[macro_id]
+                    if is_running is True:
+                        watched_macro.last_running_time = answer_time
+                        watched_macro.interval_index = min(
+                            watched_macro.interval_index + 1, len(self.poll_intervals) - 1
+                        )
+                        watched_macro.next_poll = (
+                            answer_time + self.poll_intervals[watched_macro.interval_index]
+                        )
+                    else:
+                        del self._macros[macro_id]
+                        finished_macros.append((macro_id, watched_macro, is_running))
+                        if not isinstance(is_running, ConnectionError):
+                            self.detection_latencies.record(
+                                answer_time - watched_macro.last_running_time
+                            )
+
+            # resolve the futures outside of the lock because this runs their callbacks
+            for macro_id, watched_macro, is_running in finished_macros:
+                try:
+                    if isinstance(is_running, ConnectionError):
+                        watched_macro.future.set_exception(is_running)
+                    else:
+                        watched_macro.future.set_result(macro_id)
+                except concurrent.futures.InvalidStateError:
+                    pass  # the future has been cancelled in the meantime
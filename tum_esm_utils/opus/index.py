@@ -0,0 +1,377 @@
+"""A persistent metadata index for directories of OPUS files.
+
+Implements: `OpusIndex`, `OpusIndexEntry`."""
+
+from __future__ import annotations
+from typing import Any, Literal, Optional
+import concurrent.futures
+import datetime
+import fnmatch
+import json
+import os
+import re
+import sqlite3
+import pydantic
+
+from . import types
+from .file_interface import OpusFile
+
+# increment this when the parser or the table layout changes
+_INDEX_VERSION = 1
+
+_BLOCK_CATEGORY_FIELDS: dict[str, str] = {
+    "DBTDSTAT": "spectrum",
+    "DBTINSTR": "instrument",
+    "DBTAQPAR": "acquisition",
+    "DBTPRCPAR": "optics",
+    "DBTORGPAR": "sample",
+    "DBTFTPAR": "fourier_transform",
+}
+
+_PARAMETER_KEY_PATTERN = re.compile(
+    r"^(" + "|".join(_BLOCK_CATEGORY_FIELDS.values()) + r")\.([A-Za-z0-9_]+)$"
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    filepath TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    instrument TEXT NOT NULL,
+    header TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    filepath TEXT NOT NULL REFERENCES files(filepath) ON DELETE CASCADE,
+    channel INTEGER NOT NULL,
+    measurement_time REAL NOT NULL,
+    parameters TEXT NOT NULL,
+    PRIMARY KEY (filepath, channel)
+);
+CREATE INDEX IF NOT EXISTS measurements_time ON measurements(measurement_time);
+CREATE INDEX IF NOT EXISTS files_instrument ON files(instrument);
+"""
+
+
+class OpusIndexEntry(pydantic.BaseModel):
+    """A file in the `OpusIndex` that matched a query."""
+
+    filepath: str
+    instrument: str
+    header: types.OpusHeader
+    measurement_times: list[datetime.datetime]
+    channel_parameters: list[types.OpusChannelParameters]
+
+
+def _get_instrument_id(filepath: str) -> str:
+    """The leading letters of the filename, e.g. "ma" for "ma20240514s0e00a.0975"."""
+
+    match = re.match(r"^[A-Za-z]+", os.path.basename(filepath))
+    return "" if match is None else match.group(0)
+
+
+def _parse_file_for_index(
+    filepath: str,
+    measurement_timestamp_mode: Literal["start", "end"],
+) -> tuple[Optional[str], list[tuple[float, str]], Optional[str]]:
+    """Parse the metadata of a single file. Returns the header as JSON,
+    the measurement time and parameters (as JSON) of each channel, and
+    an error message if the file could not be parsed."""
+
+    try:
+        metadata = OpusFile.read_metadata(filepath)
+        header = json.dumps(metadata.header._asdict())
+        measurements = [
+            (
+                measurement_time.timestamp(),
+                json.dumps({_BLOCK_CATEGORY_FIELDS[k]: v for k, v in parameters.items()}),
+            )
+            for measurement_time, parameters in zip(
+                metadata.parse_measurement_times(measurement_timestamp_mode),
+                metadata.channel_parameters,
+            )
+        ]
+        return header, measurements, None
+    except Exception as e:
+        return None, [], f"{type(e).__name__}: {e}"
+
+
+def _load_channel_parameters(raw_parameters: str) -> types.OpusChannelParameters:
+    p = json.loads(raw_parameters)
+    return types.OpusChannelParameters.model_construct(
+        spectrum=p["spectrum"],
+        instrument=p["instrument"],
+        acquisition=p["acquisition"],
+        optics=p["optics"],
+        sample=p["sample"],
+        fourier_transform=p["fourier_transform"],
+    )
+
+
+class OpusIndex:
+    """A persistent SQLite index of the header, measurement times and channel
+    parameters of OPUS files.
+
+    Files are keyed by their path, size and modification time, so updating
+    the index only parses new or changed files. Queries by time range,
+    instrument and parameter values are answered from the index without
+    touching the OPUS files.
+
+    ```python
+    with tum_esm_utils.opus.OpusIndex("ifgs.sqlite") as index:
+        index.update("/data/ifgs", filename_pattern="*.0*")
+        entries = index.query(
+            from_datetime=datetime.datetime(2024, 5, 14, 10, tzinfo=datetime.timezone.utc),
+            to_datetime=datetime.datetime(2024, 5, 14, 11, tzinfo=datetime.timezone.utc),
+            instrument="ma",
+            parameters={"instrument.INS": "EM27/SUN"},
+        )
+    ```
+
+    The instrument of a file is the sequence of letters at the beginning of
+    its filename, e.g. "ma" for "ma20240514s0e00a.0975"."""
+
+    def __init__(
+        self,
+        index_path: str,
+        measurement_timestamp_mode: Literal["start", "end"] = "start",
+        timeout: float = 30,
+    ) -> None:
+        """Open or create an index.
+
+        If the index has been created by a different version of this library
+        or with a different `measurement_timestamp_mode`, it is cleared and
+        all files will be parsed again on the next update.
+
+        Args:
+            index_path:                 The path to the SQLite database file.
+            measurement_timestamp_mode: See `OpusFile.read`.
+            timeout:                    How long to wait for other processes
+                                        writing to the same index in seconds.
+        """
+
+        self.index_path = index_path
+        self.measurement_timestamp_mode: Literal["start", "end"] = measurement_timestamp_mode
+
+        dirpath = os.path.dirname(index_path)
+        if dirpath != "":
+            os.makedirs(dirpath, exist_ok=True)
+
+        self.conn: sqlite3.Connection = sqlite3.connect(index_path, timeout=timeout)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+            expected_metadata = {
+                "version": str(_INDEX_VERSION),
+                "measurement_timestamp_mode": measurement_timestamp_mode,
+            }
+            current_metadata = dict(self.conn.execute("SELECT key, value FROM metadata").fetchall())
+            if current_metadata != expected_metadata:
+                self.conn.execute("DELETE FROM files")
+                self.conn.execute("DELETE FROM metadata")
+                self.conn.executemany(
+                    "INSERT INTO metadata (key, value) VALUES (?, ?)",
+                    list(expected_metadata.items()),
+                )
+
+    def update(
+        self,
+        directory: str,
+        filename_pattern: str = "*",
+        recursive: bool = True,
+        workers: int = 1,
+    ) -> int:
+        """Add new and changed files in a directory to the index and remove
+        deleted files from it. Files that cannot be parsed are indexed as
+        invalid, so they are not parsed again until they change.
+
+        Args:
+            directory:        The directory to scan.
+            filename_pattern: Only index files whose name matches this
+                              Unix shell-style pattern.
+            recursive:        Whether to scan subdirectories.
+            workers:          Number of processes used to parse the files.
+
+        Returns:
+            The number of files that have been parsed.
+        """
+
+        directory = os.path.abspath(directory)
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Directory {directory} does not exist.")
+
+        current_files: dict[str, tuple[int, int]] = {}
+        for root, dirnames, filenames in os.walk(directory):
+            if not recursive:
+                dirnames.clear()
+            for filename in fnmatch.filter(filenames, filename_pattern):
+                filepath = os.path.join(root, filename)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                current_files[filepath] = (stat.st_size, stat.st_mtime_ns)
+
+        indexed_files: dict[str, tuple[int, int]] = {
+            filepath: (size, mtime_ns)
+            for filepath, size, mtime_ns in self.conn.execute(
+                "SELECT filepath, size, mtime_ns FROM files"
+            )
+            if filepath.startswith(directory + os.sep)
+            and (recursive or os.path.dirname(filepath) == directory)
+            and fnmatch.fnmatch(os.path.basename(filepath), filename_pattern)
+        }
+
+        removed_filepaths = [fp for fp in indexed_files if fp not in current_files]
+        changed_filepaths = sorted(
+            fp for fp, key in current_files.items() if indexed_files.get(fp) != key
+        )
+
+        if workers > 1 and len(changed_filepaths) > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed_files = list(
+                    executor.map(
+                        _parse_file_for_index,
+                        changed_filepaths,
+                        [self.measurement_timestamp_mode] * len(changed_filepaths),
+                        chunksize=max(1, min(256, len(changed_filepaths) // (4 * workers))),
+                    )
+                )
+        else:
+            parsed_files = [
+                _parse_file_for_index(fp, self.measurement_timestamp_mode)
+                for fp in changed_filepaths
+            ]
+
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM files WHERE filepath = ?",
+                [(fp,) for fp in removed_filepaths + changed_filepaths],
+            )
+            self.conn.executemany(
+                "INSERT INTO files (filepath, size, mtime_ns, instrument, header, error) "
+                + "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (fp, *current_files[fp], _get_instrument_id(fp), header, error)
+                    for fp, (header, _, error) in zip(changed_filepaths, parsed_files)
+                ],
+            )
+            self.conn.executemany(
+                "INSERT INTO measurements (filepath, channel, measurement_time, parameters) "
+                + "VALUES (?, ?, ?, ?)",
+                [
+                    (fp, channel, measurement_time, parameters)
+                    for fp, (_, measurements, _) in zip(changed_filepaths, parsed_files)
+                    for channel, (measurement_time, parameters) in enumerate(measurements)
+                ],
+            )
+
+        return len(changed_filepaths)
+
+    def query(
+        self,
+        from_datetime: Optional[datetime.datetime] = None,
+        to_datetime: Optional[datetime.datetime] = None,
+        instrument: Optional[str] = None,
+        parameters: dict[str, str | int | float] = {},
+    ) -> list[OpusIndexEntry]:
+        """Find all valid files with at least one channel matching all given
+        conditions, ordered by their first measurement time.
+
+        Args:
+            from_datetime: Only include measurements at or after this time.
+                           Naive datetimes are interpreted as UTC.
+            to_datetime:   Only include measurements before this time.
+                           Naive datetimes are interpreted as UTC.
+            instrument:    Only include files of this instrument.
+            parameters:    Only include measurements with these parameter
+                           values. The keys are "<block>.<parameter>", e.g.
+                           "instrument.INS" or "spectrum.NPT", where the block
+                           is a field of `OpusChannelParameters`.
+
+        Returns:
+            The matching files.
+        """
+
+        conditions: list[str] = ["f.error IS NULL"]
+        arguments: list[Any] = []
+        if from_datetime is not None:
+            if from_datetime.tzinfo is None:
+                from_datetime = from_datetime.replace(tzinfo=datetime.timezone.utc)
+            conditions.append("m.measurement_time >= ?")
+            arguments.append(from_datetime.timestamp())
+        if to_datetime is not None:
+            if to_datetime.tzinfo is None:
+                to_datetime = to_datetime.replace(tzinfo=datetime.timezone.utc)
+            conditions.append("m.measurement_time < ?")
+            arguments.append(to_datetime.timestamp())
+        if instrument is not None:
+            conditions.append("f.instrument = ?")
+            arguments.append(instrument)
+        for key, value in parameters.items():
+            match = _PARAMETER_KEY_PATTERN.match(key)
+            if match is None:
+                raise ValueError(
+                    f"Invalid parameter key {key}, expected '<block>.<parameter>' "
+                    + f"with block in {list(_BLOCK_CATEGORY_FIELDS.values())}"
+                )
+            conditions.append("json_extract(m.parameters, ?) = ?")
+            arguments.extend([f"$.{match.group(1)}.{match.group(2)}", value])
+
+        matching_files = (
+            "SELECT f.filepath, f.instrument, f.header, MIN(m.measurement_time) AS t "
+            + "FROM files f JOIN measurements m ON f.filepath = m.filepath "
+            + f"WHERE {' AND '.join(conditions)} "
+            + "GROUP BY f.filepath"
+        )
+        files = self.conn.execute(f"{matching_files} ORDER BY t, f.filepath", arguments).fetchall()
+        measurements: dict[str, list[tuple[float, str]]] = {fp: [] for fp, _, _, _ in files}
+        for filepath, measurement_time, channel_parameters in self.conn.execute(
+            "SELECT filepath, measurement_time, parameters FROM measurements "
+            + f"WHERE filepath IN (SELECT filepath FROM ({matching_files})) "
+            + "ORDER BY filepath, channel",
+            arguments,
+        ):
+            measurements[filepath].append((measurement_time, channel_parameters))
+
+        return [
+            OpusIndexEntry(
+                filepath=filepath,
+                instrument=instrument,
+                header=types.OpusHeader.model_validate_json(header),
+                measurement_times=[
+                    datetime.datetime.fromtimestamp(t, tz=datetime.timezone.utc)
+                    for t, _ in measurements[filepath]
+                ],
+                channel_parameters=[_load_channel_parameters(p) for _, p in measurements[filepath]],
+            )
+            for filepath, instrument, header, _ in files
+        ]
+
+    def get_invalid_files(self) -> dict[str, str]:
+        """Get all indexed files that could not be parsed.
+
+        Returns:
+            A dictionary mapping the filepaths to their error messages.
+        """
+
+        return dict(
+            self.conn.execute(
+                "SELECT filepath, error FROM files WHERE error IS NOT NULL ORDER BY filepath"
+            ).fetchall()
+        )
+
+    def close(self) -> None:
+        """Close the connection to the index."""
+
+        self.conn.close()
+
+    def __enter__(self) -> OpusIndex:
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.close()
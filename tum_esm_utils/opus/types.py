@@ -1,7 +1,7 @@
 """Types for interacting with OPUS files."""
 
 from __future__ import annotations
-from typing import Any, Literal, Optional
+from typing import Any, Literal, Mapping, NamedTuple, Optional
 import math
 import datetime
 import pydantic
@@ -19,6 +19,23 @@ class OpusHeader(pydantic.BaseModel):
     dir_size: int = pydantic.Field(..., ge=0, description="Used number of OPUS directory entries")
 
 
+class RawOpusHeader(NamedTuple):
+    """Lightweight, unvalidated version of `OpusHeader`."""
+
+    version: int
+    dir_pointer: int
+    max_dir_size: int
+    dir_size: int
+
+    def to_model(self) -> OpusHeader:
+        return OpusHeader(
+            version=self.version,
+            dir_pointer=self.dir_pointer,
+            max_dir_size=self.max_dir_size,
+            dir_size=self.dir_size,
+        )
+
+
 class OpusParameterBlock(pydantic.BaseModel):
     data: dict[str, Optional[str | float | int]]
     data_types: dict[str, int]
@@ -43,6 +60,67 @@ class OpusDirectoryEntry(pydantic.BaseModel):
     )
 
 
+class RawOpusDirectoryEntry(NamedTuple):
+    """Lightweight, unvalidated version of `OpusDirectoryEntry`."""
+
+    block_type: int
+    block_length: int
+    block_pointer: int
+    block_category: str
+
+    def to_model(self) -> OpusDirectoryEntry:
+        return OpusDirectoryEntry(
+            block_type=self.block_type,
+            block_length=self.block_length,
+            block_pointer=self.block_pointer,
+            block_category=self.block_category,
+        )
+
+
+class RawOpusParameterBlock(NamedTuple):
+    """Lightweight, unvalidated version of `OpusParameterBlock`."""
+
+    data: dict[str, Optional[str | float | int]]
+    data_types: dict[str, int]
+    parameter_order: list[str]
+    raw_data: bytes
+
+    def to_model(self) -> OpusParameterBlock:
+        return OpusParameterBlock(
+            data=self.data,
+            data_types=self.data_types,
+            parameter_order=self.parameter_order,
+            raw_data=self.raw_data,
+        )
+
+
+def parse_measurement_datetime(
+    spectrum: Mapping[str, Any],
+    instrument: Mapping[str, Any],
+    measurement_timestamp_mode: Literal["start", "end"] = "start",
+) -> datetime.datetime:
+    """Parse the measurement time from the `DBTDSTAT` and `DBTINSTR` parameter blocks."""
+
+    DAT, TIM, DUR = spectrum["DAT"], spectrum["TIM"], instrument["DUR"]
+    seconds = float(TIM.split(":")[2].split(" ")[0])
+    utc_offset = tum_esm_utils.timing.parse_timezone_string(TIM.split(" ")[-1].strip("()"))
+    dt = datetime.datetime(
+        year=int(DAT.split("/")[2]),
+        month=int(DAT.split("/")[1]),
+        day=int(DAT.split("/")[0]),
+        hour=int(TIM.split(":")[0]),
+        minute=int(TIM.split(":")[1]),
+        second=math.floor(seconds),
+        microsecond=round((seconds % 1) * 1_000_000),
+        tzinfo=datetime.timezone.utc,
+    ) - datetime.timedelta(hours=utc_offset)
+    if measurement_timestamp_mode == "start":
+        dt = dt + datetime.timedelta(seconds=DUR / 2)
+    else:
+        dt = dt - datetime.timedelta(seconds=DUR / 2)
+    return dt
+
+
 class OpusChannelParameters(pydantic.BaseModel):
     spectrum: dict[str, Any] = pydantic.Field(..., validation_alias="DBTDSTAT")
     instrument: dict[str, Any] = pydantic.Field(..., validation_alias="DBTINSTR")
@@ -55,21 +133,6 @@ class OpusChannelParameters(pydantic.BaseModel):
         self,
         measurement_timestamp_mode: Literal["start", "end"] = "start",
     ) -> datetime.datetime:
-        DAT, TIM, DUR = self.spectrum["DAT"], self.spectrum["TIM"], self.instrument["DUR"]
-        seconds = float(TIM.split(":")[2].split(" ")[0])
-        utc_offset = tum_esm_utils.timing.parse_timezone_string(TIM.split(" ")[-1].strip("()"))
-        dt = datetime.datetime(
-            year=int(DAT.split("/")[2]),
-            month=int(DAT.split("/")[1]),
-            day=int(DAT.split("/")[0]),
-            hour=int(TIM.split(":")[0]),
-            minute=int(TIM.split(":")[1]),
-            second=math.floor(seconds),
-            microsecond=round((seconds % 1) * 1_000_000),
-            tzinfo=datetime.timezone.utc,
-        ) - datetime.timedelta(hours=utc_offset)
-        if measurement_timestamp_mode == "start":
-            dt = dt + datetime.timedelta(seconds=DUR / 2)
-        else:
-            dt = dt - datetime.timedelta(seconds=DUR / 2)
-        return dt
+        return parse_measurement_datetime(
+            self.spectrum, self.instrument, measurement_timestamp_mode
+        )
@@ -1,7 +1,8 @@
 """Utilities for interacting with OPUS files."""
 
 from __future__ import annotations
-from typing import Optional, TypeVar
+from typing import Any, Generator, Literal, Optional, Sequence, TypeVar
+import os
 import warnings
 import numpy as np
 import numpy.typing as npt
@@ -33,22 +34,54 @@ DBFPARM: list[str] = [
 assert len(DBFPARM) == DBMPARM + 1
 
 
-def read_opus_header(f: io.BufferedReader) -> types.OpusHeader:
-    """Read OPUS file header from a file."""
+def read_raw_opus_header(f: io.BufferedReader) -> types.RawOpusHeader:
+    """Read OPUS file header from a file without validating it."""
 
     magic_sequence = f.read(4)
     if magic_sequence != FILE_MAGIC:
         raise RuntimeError(f'Magic sequence not found, found {magic_sequence.decode()}" instead')
-    x = struct.unpack("<dIII", f.read(struct.calcsize("<dIII")))
-    assert len(x) >= 4
-    return types.OpusHeader(
-        version=x[0],
+    raw_header = f.read(struct.calcsize("<dIII"))
+    if len(raw_header) != struct.calcsize("<dIII"):
+        raise RuntimeError("File header is incomplete")
+    x = struct.unpack("<dIII", raw_header)
+    return types.RawOpusHeader(
+        version=int(x[0]),
         dir_pointer=x[1],
         max_dir_size=x[2],
         dir_size=x[3],
     )
 
 
+def read_opus_header(f: io.BufferedReader) -> types.OpusHeader:
+    """Read OPUS file header from a file."""
+
+    return read_raw_opus_header(f).to_model()
+
+
+def read_raw_opus_directory(
+    f: io.BufferedReader,
+    opus_header: types.RawOpusHeader | types.OpusHeader,
+) -> list[types.RawOpusDirectoryEntry]:
+    """Read all OPUS directory entries from a file without validating them.
+
+    The directory is read with a single `read` call and decoded with a
+    single `struct.iter_unpack` call."""
+
+    f.seek(opus_header.dir_pointer)
+    raw_directory = f.read(opus_header.dir_size * struct.calcsize("<III"))
+    if len(raw_directory) != opus_header.dir_size * struct.calcsize("<III"):
+        raise RuntimeError(f"OPUS directory is incomplete, expected {opus_header.dir_size} entries")
+    return [
+        types.RawOpusDirectoryEntry(
+            block_type=block_type,
+            block_length=block_length,
+            block_pointer=block_pointer,
+            block_category=DBFPARM[(block_type >> DBSPARM) & DBMPARM],
+        )
+        for block_type, block_length, block_pointer in struct.iter_unpack("<III", raw_directory)
+    ]
+
+
 def read_opus_dir_entry(f: io.BufferedReader) -> types.OpusDirectoryEntry:
     """Read a single OPUS directory entry object from file at current position."""
 
@@ -70,23 +103,8 @@ def read_opus_dir_entry(f: io.BufferedReader) -> types.OpusDirectoryEntry:
     )
 
 
-T = TypeVar("T", types.OpusParameterBlock, types.OpusDataBlock)
-
-
-def read_opus_block(
-    f: io.BufferedReader,
-    opus_directory_entry: types.OpusDirectoryEntry,
-    expected_block_type: type[T],
-) -> T:
-    f.seek(opus_directory_entry.block_pointer)
-    raw_data = f.read(4 * opus_directory_entry.block_length)
-
-    block: types.OpusParameterBlock | types.OpusDataBlock
-    if opus_directory_entry.block_category == "":
-        block = types.OpusDataBlock(raw_data=raw_data)
-        if not isinstance(block, expected_block_type):
-            raise RuntimeError(f"Expected a {expected_block_type}, but got a {type(block)}")
-        return block
+def parse_opus_parameter_block(raw_data: bytes) -> types.RawOpusParameterBlock:
+    """Decode the parameters of a raw OPUS parameter block."""
 
     data: dict[str, Optional[int | float | str]] = {}
     data_types: dict[str, int] = {}
@@ -135,29 +153,112 @@ def read_opus_block(
         data_types[parameter_name] = ptype
         parameter_order.append(parameter_name)
 
-    block = types.OpusParameterBlock(
+    return types.RawOpusParameterBlock(
         data=data,
         data_types=data_types,
         parameter_order=parameter_order,
         raw_data=raw_data,
     )
+
+
+def read_raw_opus_parameter_block(
+    f: io.BufferedReader,
+    opus_directory_entry: types.RawOpusDirectoryEntry | types.OpusDirectoryEntry,
+) -> types.RawOpusParameterBlock:
+    """Read and decode an OPUS parameter block without validating it."""
+
+    if opus_directory_entry.block_category == "":
+        raise RuntimeError("Expected a parameter block, but got a data block")
+    f.seek(opus_directory_entry.block_pointer)
+    return parse_opus_parameter_block(f.read(4 * opus_directory_entry.block_length))
+
+
+T = TypeVar("T", types.OpusParameterBlock, types.OpusDataBlock)
+
+
+def read_opus_block(
+    f: io.BufferedReader,
+    opus_directory_entry: types.OpusDirectoryEntry,
+    expected_block_type: type[T],
+) -> T:
+    f.seek(opus_directory_entry.block_pointer)
+    raw_data = f.read(4 * opus_directory_entry.block_length)
+
+    block: types.OpusParameterBlock | types.OpusDataBlock
+    if opus_directory_entry.block_category == "":
+        block = types.OpusDataBlock(raw_data=raw_data)
+    else:
+        block = parse_opus_parameter_block(raw_data).to_model()
     if not isinstance(block, expected_block_type):
         raise RuntimeError(f"Expected a {expected_block_type}, but got a {type(block)}")
     return block
 
 
-def read_interferogram(
+def get_parameter_block_type(data_block_type: int) -> int:
+    """The block type of the "DBTDSTAT" block of a data block: the same block
+    type, except that the parameter bits (4-9) are set to 1."""
+
+    return (data_block_type & ~(63 << 4)) | (1 << 4)
+
+
+def _match_channel_parameters(
+    channel_parameters: list[types.OpusChannelParameters],
+    ifg_opus_dirs: Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry],
+    spectrum_opus_dirs: Optional[
+        Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry]
+    ] = None,
+) -> list[types.OpusChannelParameters]:
+    """Find the channel parameters belonging to each interferogram block.
+
+    The "DBTDSTAT" block of a data block has the same block type, except
+    that the parameter bits (4-9) are set to 1. `spectrum_opus_dirs` are the
+    directory entries of the "DBTDSTAT" blocks in the same order as
+    `channel_parameters`. Without them, or if no matching block exists, the
+    parameters are matched by position."""
+
+    if spectrum_opus_dirs is None:
+        return channel_parameters[: len(ifg_opus_dirs)]
+    if len(spectrum_opus_dirs) != len(channel_parameters):
+        raise ValueError("There must be one DBTDSTAT directory entry per channel parameters")
+
+    parameter_indices = {d.block_type: i for i, d in enumerate(spectrum_opus_dirs)}
+    return [
+        channel_parameters[
+            parameter_indices.get(get_parameter_block_type(ifg_opus_dir.block_type), i)
+        ]
+        for i, ifg_opus_dir in enumerate(ifg_opus_dirs)
+    ]
+
+
+def _check_interferogram_blocks(
     f: io.BufferedReader,
     channel_parameters: list[types.OpusChannelParameters],
-    ifg_opus_dirs: list[types.OpusDirectoryEntry],
-    read_all_channels: bool = True,
-) -> npt.NDArray[np.float64]:
+    ifg_opus_dirs: Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry],
+    read_all_channels: bool,
+    spectrum_opus_dirs: Optional[
+        Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry]
+    ] = None,
+) -> tuple[
+    list[types.OpusChannelParameters],
+    Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry],
+    int,
+]:
+    """Check that the interferogram blocks are consistent with the channel
+    parameters and fully present in the file.
+
+    Returns the channel parameters of each interferogram block to read
+    (see `_match_channel_parameters`), the interferogram blocks to read
+    and the length of the interferogram."""
+
     if len(channel_parameters) < len(ifg_opus_dirs):
         raise RuntimeError("There are fewer channel parameter blocks than interferogram blocks!")
 
     if len(channel_parameters) == 0:
         raise RuntimeError("No channel parameters found!")
 
+    channel_parameters = _match_channel_parameters(
+        channel_parameters, ifg_opus_dirs, spectrum_opus_dirs
+    )
     if not read_all_channels:
         channel_parameters = channel_parameters[:1]
         ifg_opus_dirs = ifg_opus_dirs[:1]
@@ -172,28 +273,147 @@ def read_interferogram(
     if len(ifg_opus_dirs) not in [1, 2]:
         raise RuntimeError(f"Invalid number of interferogram blocks found: {len(ifg_opus_dirs)}")
 
+    file_size = os.fstat(f.fileno()).st_size
     for ifg_opus_dir in ifg_opus_dirs:
         if ifg_opus_dir.block_length != spectrum_length:
             raise RuntimeError(
                 f"Interferogram block has length {ifg_opus_dir.block_length}, "
                 f"but expected {spectrum_length}"
             )
+        if ifg_opus_dir.block_pointer + 4 * spectrum_length > file_size:
+            raise RuntimeError(
+                f"Interferogram block at byte {ifg_opus_dir.block_pointer} exceeds "
+                f"the file size of {file_size} bytes"
+            )
 
-    full_ifg = np.zeros(
-        shape=(len(ifg_opus_dirs), spectrum_length),
-        dtype=np.float64,
+    return channel_parameters, ifg_opus_dirs, spectrum_length
+
+
+def map_interferogram(
+    f: io.BufferedReader,
+    channel_parameters: list[types.OpusChannelParameters],
+    ifg_opus_dirs: Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry],
+    read_all_channels: bool = True,
+    spectrum_opus_dirs: Optional[
+        Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry]
+    ] = None,
+) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.float64]]:
+    """Memory-map the interferogram blocks of an OPUS file without copying them.
+
+    Returns a tuple of the raw `(channels, NPT)` float32 interferogram and the
+    scaling factors (CSF) per channel. The raw interferogram is a read-only view
+    directly over the file's block offsets - nothing is read from disk until it
+    is accessed. The scaled interferogram is `raw * scaling_factors[:, np.newaxis]`.
+
+    The underlying memory map is closed once the returned array is garbage
+    collected. On Windows, the file cannot be deleted or moved before that.
+
+    Pass the directory entries of the "DBTDSTAT" blocks (in the order of
+    `channel_parameters`) as `spectrum_opus_dirs` to scale every block with
+    the CSF of its own "DBTDSTAT" block instead of matching them by position."""
+
+    channel_parameters, ifg_opus_dirs, spectrum_length = _check_interferogram_blocks(
+        f, channel_parameters, ifg_opus_dirs, read_all_channels, spectrum_opus_dirs
     )
-    for channel_index in range(len(ifg_opus_dirs)):
-        channel_ifg = np.multiply(
-            np.array(
-                struct.unpack_from(
-                    f"<{spectrum_length}f",
-                    read_opus_block(f, ifg_opus_dirs[0], types.OpusDataBlock).raw_data,
-                    offset=0,
-                )
-            ),
-            channel_parameters[channel_index].spectrum["CSF"],
+
+    file_map = np.memmap(f, dtype=np.uint8, mode="r")
+    pointers = [ifg_opus_dir.block_pointer for ifg_opus_dir in ifg_opus_dirs]
+
+    # equally spaced blocks (always the case for one or two channels in
+    # ascending order) can be expressed as a single strided view
+    stride = (pointers[1] - pointers[0]) if len(pointers) > 1 else 4 * spectrum_length
+    raw_ifg: npt.NDArray[np.float32]
+    if stride > 0 and all(p == pointers[0] + i * stride for i, p in enumerate(pointers)):
+        raw_ifg = np.ndarray(
+            shape=(len(pointers), spectrum_length),
+            dtype="<f4",
+            buffer=file_map,
+            offset=pointers[0],
+            strides=(stride, 4),
         )
-        full_ifg[channel_index, :] = channel_ifg.copy()
+    else:
+        raw_ifg = np.stack(
+            [
+                np.frombuffer(file_map, dtype="<f4", count=spectrum_length, offset=p)
+                for p in pointers
+            ]
+        )
+
+    scaling_factors = np.array(
+        [channel_parameters[i].spectrum["CSF"] for i in range(len(ifg_opus_dirs))],
+        dtype=np.float64,
+    )
+    return raw_ifg, scaling_factors
+
+
+def read_interferogram(
+    f: io.BufferedReader,
+    channel_parameters: list[types.OpusChannelParameters],
+    ifg_opus_dirs: Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry],
+    read_all_channels: bool = True,
+    spectrum_opus_dirs: Optional[
+        Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry]
+    ] = None,
+) -> npt.NDArray[np.float64]:
+    """Read the scaled `(channels, NPT)` interferogram of an OPUS file.
 
+    The blocks are memory-mapped (see `map_interferogram`) and scaled
+    in a single vectorized pass into the float64 output array."""
+
+    raw_ifg, scaling_factors = map_interferogram(
+        f,
+        channel_parameters=channel_parameters,
+        ifg_opus_dirs=ifg_opus_dirs,
+        read_all_channels=read_all_channels,
+        spectrum_opus_dirs=spectrum_opus_dirs,
+    )
+    full_ifg = np.empty(shape=raw_ifg.shape, dtype=np.float64)
+    np.multiply(raw_ifg, scaling_factors[:, np.newaxis], out=full_ifg)
     return full_ifg
+
+
+def iter_interferogram(
+    f: io.BufferedReader,
+    channel_parameters: list[types.OpusChannelParameters],
+    ifg_opus_dirs: Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry],
+    read_all_channels: bool = True,
+    window_size: int = 65536,
+    dtype: Literal["float32", "float64"] = "float64",
+    spectrum_opus_dirs: Optional[
+        Sequence[types.OpusDirectoryEntry | types.RawOpusDirectoryEntry]
+    ] = None,
+) -> Generator[npt.NDArray[np.floating[Any]], None, None]:
+    """Iterate over consecutive `(channels, window_size)` windows of the scaled
+    interferogram. The last window may be shorter.
+
+    Each window is read straight from the block offsets into a reused float32
+    buffer, so memory usage only depends on the window size, not on the
+    length of the interferogram."""
+
+    if window_size < 1:
+        raise ValueError("The window size must be at least 1")
+
+    channel_parameters, ifg_opus_dirs, spectrum_length = _check_interferogram_blocks(
+        f, channel_parameters, ifg_opus_dirs, read_all_channels, spectrum_opus_dirs
+    )
+    scaling_factors = np.array(
+        [channel_parameters[i].spectrum["CSF"] for i in range(len(ifg_opus_dirs))],
+        dtype=dtype,
+    )[:, np.newaxis]
+    raw_window = np.empty(
+        shape=(len(ifg_opus_dirs), min(window_size, spectrum_length)), dtype="<f4"
+    )
+
+    for start in range(0, spectrum_length, window_size):
+        length = min(window_size, spectrum_length - start)
+        for channel_index, ifg_opus_dir in enumerate(ifg_opus_dirs):
+            f.seek(ifg_opus_dir.block_pointer + 4 * start)
+            buffer = raw_window[channel_index, :length].data.cast("B")
+            if f.readinto(buffer) != 4 * length:
+                raise RuntimeError(
+                    f"Could not read {length} values at position {start} "
+                    + f"of interferogram channel {channel_index + 1}"
+                )
+        window = np.empty(shape=(len(ifg_opus_dirs), length), dtype=dtype)
+        np.multiply(raw_window[:, :length], scaling_factors, out=window)
+        yield window